@@ -0,0 +1,76 @@
+"""
+Single-flight request coalescing with a micro-TTL.
+
+When thousands of map clients poll the same report list at the same moment,
+only the first request for a key runs the query; concurrent requests for
+that key await the same in-flight load, and requests arriving within `ttl`
+afterwards reuse its result. Load on Mongo collapses to about one query per
+key per ttl.
+
+invalidate() drops cached results and detaches in-flight loads, so requests
+after a write never see a result that started before it.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import REGISTRY, Counter
+
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "aquaroute_coalesced_requests_total",
+    "Coalesced reads by cache and outcome (hit, joined, miss)",
+    ("cache", "outcome"),
+))
+
+
+class SingleFlightCache:
+    def __init__(self, name: str, ttl: float = 1.0, max_entries: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._results.clear()
+        self._in_flight.clear()
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                COALESCED_REQUESTS.inc(self.name, "hit")
+                return cached[1]
+            del self._results[key]
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            COALESCED_REQUESTS.inc(self.name, "joined")
+            # Shielded: one caller disconnecting must not cancel the load for the others
+            return await asyncio.shield(future)
+
+        COALESCED_REQUESTS.inc(self.name, "miss")
+        future = asyncio.ensure_future(self._load(key, loader, self._generation))
+        self._in_flight[key] = future
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await loader()
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+        # Errors are never cached, and results started before an invalidation are not kept
+        if self.ttl > 0 and generation == self._generation:
+            self._results[key] = (time.monotonic() + self.ttl, value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return value
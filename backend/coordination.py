@@ -0,0 +1,173 @@
+"""
+Cross-worker coordination for AquaRoute.
+
+When uvicorn runs several worker processes, in-process state (the flood
+penalty index, caches) has to be kept in step across them, and periodic jobs
+such as the expiry sweep should run on exactly one worker. This module
+provides:
+
+- an event bus: LocalEventBus for a single process, MongoEventBus which fans
+  events out to every worker through a change stream on `worker_events`
+- leader leases: LocalLease (always leader) and MongoLease, a TTL lease
+  document that one worker holds and renews; scheduler.py checks the lease
+  before each run of a leader-only job
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LocalEventBus:
+    """In-process pub/sub; handlers run synchronously on publish"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or new_worker_id()
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers[topic].append(handler)
+
+    def dispatch(self, topic: str, payload: dict) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error(f"Event handler for {topic} failed: {e}")
+
+    async def publish(self, topic: str, payload: dict) -> None:
+        """Apply the event in this worker and broadcast it to the others"""
+        self.dispatch(topic, payload)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class MongoEventBus(LocalEventBus):
+    """
+    Broadcasts events through a Mongo change stream (requires a replica set,
+    which includes Atlas). The publishing worker applies its own events
+    immediately and skips them when they come back on the stream.
+
+    start() pins the stream to the cluster time at which it was called, so a
+    worker that seeds its state from Mongo after start() misses no event
+    published in between; it may see some of them twice, so handlers must be
+    idempotent.
+    """
+
+    def __init__(self, collection, worker_id: Optional[str] = None,
+                 retention: timedelta = timedelta(hours=1)):
+        super().__init__(worker_id)
+        self.collection = collection
+        self.retention = retention
+        self._task: Optional[asyncio.Task] = None
+        self._start_at = None
+
+    async def publish(self, topic: str, payload: dict) -> None:
+        self.dispatch(topic, payload)
+        await self.collection.insert_one({
+            "topic": topic,
+            "payload": payload,
+            "origin": self.worker_id,
+            "created_at": datetime.utcnow(),
+        })
+
+    async def start(self) -> None:
+        await self.collection.create_index(
+            "created_at", expireAfterSeconds=int(self.retention.total_seconds())
+        )
+        # The listener task opens the stream later; start it from now, not from then
+        reply = await self.collection.database.command("ping")
+        self._start_at = reply.get("operationTime")
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        resume_token = None
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                start_at = self._start_at if resume_token is None else None
+                async with self.collection.watch(pipeline, resume_after=resume_token,
+                                                 start_at_operation_time=start_at) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = change["fullDocument"]
+                        if event.get("origin") != self.worker_id:
+                            self.dispatch(event["topic"], event["payload"])
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Worker event stream interrupted, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+
+class LocalLease:
+    """Single-process mode: this worker is always the leader"""
+
+    def __init__(self, name: str, worker_id: Optional[str] = None):
+        self.name = name
+        self.worker_id = worker_id or new_worker_id()
+
+    async def acquire(self) -> bool:
+        return True
+
+    async def release(self) -> None:
+        pass
+
+
+class MongoLease:
+    """
+    Leader election through a lease document in `leases`. The holder renews
+    before ttl runs out; if it dies, another worker takes over once the
+    lease expires.
+    """
+
+    def __init__(self, collection, name: str, ttl: timedelta, worker_id: Optional[str] = None):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.worker_id = worker_id or new_worker_id()
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; returns whether this worker is the leader"""
+        now = datetime.utcnow()
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.worker_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.worker_id, "expires_at": now + self.ttl, "renewed_at": now}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease
+            return False
+
+    async def release(self) -> None:
+        await self.collection.delete_one({"_id": self.name, "owner": self.worker_id})
@@ -0,0 +1,233 @@
+"""
+MongoDB connection pool configuration and health monitoring for AquaRoute.
+
+Pool size, timeouts and read preference come from the environment so they can
+be tuned per deployment. A pymongo ConnectionPoolListener tracks connections
+in use and checkout wait time, which feed /metrics and the readiness probe.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+POOL_CHECKOUT_WAIT = REGISTRY.register(Histogram(
+    "aquaroute_mongo_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the Mongo pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0),
+))
+POOL_CHECKOUT_FAILURES = REGISTRY.register(Counter(
+    "aquaroute_mongo_pool_checkout_failures_total",
+    "Connection checkouts that failed, by reason",
+    ("reason",),
+))
+POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "aquaroute_mongo_pool_connections",
+    "Mongo pool connections by state",
+    ("state",),
+))
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+@dataclass(frozen=True)
+class MongoSettings:
+    """Motor client pool and timeout settings"""
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = 60000
+    # Fail fast instead of letting requests queue behind a saturated pool
+    wait_queue_timeout_ms: int = 2000
+    server_selection_timeout_ms: int = 3000
+    connect_timeout_ms: int = 5000
+    socket_timeout_ms: Optional[int] = 10000
+    # Read-heavy list routes may be served by secondaries; writes always go to the primary
+    list_read_preference: str = "secondaryPreferred"
+    max_staleness_seconds: int = -1
+
+    @classmethod
+    def from_env(cls) -> "MongoSettings":
+        return cls(
+            max_pool_size=_env_int('MONGO_MAX_POOL_SIZE', cls.max_pool_size),
+            min_pool_size=_env_int('MONGO_MIN_POOL_SIZE', cls.min_pool_size),
+            max_idle_time_ms=_env_int('MONGO_MAX_IDLE_TIME_MS', cls.max_idle_time_ms),
+            wait_queue_timeout_ms=_env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', cls.wait_queue_timeout_ms),
+            server_selection_timeout_ms=_env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS',
+                                                 cls.server_selection_timeout_ms),
+            connect_timeout_ms=_env_int('MONGO_CONNECT_TIMEOUT_MS', cls.connect_timeout_ms),
+            socket_timeout_ms=_env_int('MONGO_SOCKET_TIMEOUT_MS', cls.socket_timeout_ms),
+            list_read_preference=os.environ.get('MONGO_LIST_READ_PREFERENCE', cls.list_read_preference),
+            max_staleness_seconds=_env_int('MONGO_MAX_STALENESS_SECONDS', cls.max_staleness_seconds),
+        )
+
+    def client_kwargs(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        kwargs = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            # Writes (and anything not routed through list_read_preference) use the primary
+            "readPreference": "primary",
+        }
+        if self.max_idle_time_ms is not None:
+            kwargs["maxIdleTimeMS"] = self.max_idle_time_ms
+        if self.socket_timeout_ms is not None:
+            kwargs["socketTimeoutMS"] = self.socket_timeout_ms
+        return kwargs
+
+    def list_read_preference_obj(self):
+        if self.list_read_preference == "primary":
+            return Primary()
+        if self.list_read_preference == "secondaryPreferred":
+            return SecondaryPreferred(max_staleness=self.max_staleness_seconds)
+        raise ValueError(f"Unsupported MONGO_LIST_READ_PREFERENCE: {self.list_read_preference}")
+
+
+@dataclass
+class _ServerPool:
+    open: int = 0
+    in_use: int = 0
+    waiting: int = 0
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Tracks pool occupancy and checkout wait time. pymongo keeps one pool of up
+    to max_pool_size connections per server, so counts are kept per server
+    address and saturation is judged per pool; totals feed the gauges.
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.last_failure: Optional[str] = None
+        self._servers: Dict[Tuple[str, int], _ServerPool] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _pool(self, event) -> _ServerPool:
+        pool = self._servers.get(event.address)
+        if pool is None:
+            pool = self._servers[event.address] = _ServerPool()
+        return pool
+
+    def _total(self, state: str) -> int:
+        return sum(getattr(pool, state) for pool in self._servers.values())
+
+    @property
+    def open(self) -> int:
+        return self._total("open")
+
+    @property
+    def in_use(self) -> int:
+        return self._total("in_use")
+
+    @property
+    def waiting(self) -> int:
+        return self._total("waiting")
+
+    def _publish(self):
+        for state in ("open", "in_use", "waiting"):
+            POOL_CONNECTIONS.set(state, value=self._total(state))
+
+    def _saturation(self, pool: _ServerPool) -> float:
+        return round(pool.in_use / self.max_pool_size, 3) if self.max_pool_size else 0.0
+
+    def stats(self) -> dict:
+        count = POOL_CHECKOUT_WAIT.count()
+        with self._lock:
+            servers = {
+                f"{host}:{port}": {"open": pool.open, "in_use": pool.in_use, "waiting": pool.waiting,
+                                   "saturation": self._saturation(pool)}
+                for (host, port), pool in self._servers.items()
+            }
+        return {
+            "max_pool_size": self.max_pool_size,
+            "open": sum(server["open"] for server in servers.values()),
+            "in_use": sum(server["in_use"] for server in servers.values()),
+            "waiting": sum(server["waiting"] for server in servers.values()),
+            # The busiest pool; each server's pool fills up on its own
+            "saturation": max((server["saturation"] for server in servers.values()), default=0.0),
+            "servers": servers,
+            "avg_checkout_wait_ms": round(POOL_CHECKOUT_WAIT.sum() / count * 1000, 3) if count else 0.0,
+            "checkout_timeouts": int(POOL_CHECKOUT_FAILURES.value("timeout")),
+            "last_failure": self.last_failure,
+        }
+
+    @property
+    def saturated(self) -> bool:
+        """Some server's pool is fully checked out with requests queued behind it"""
+        with self._lock:
+            return any(pool.in_use >= self.max_pool_size and pool.waiting > 0
+                       for pool in self._servers.values())
+
+    def connection_check_out_started(self, event):
+        # Started and checked_out/failed fire on the same thread for one checkout
+        self._local.start = time.perf_counter()
+        with self._lock:
+            self._pool(event).waiting += 1
+            self._publish()
+
+    def connection_checked_out(self, event):
+        start = getattr(self._local, "start", None)
+        if start is not None:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+        with self._lock:
+            pool = self._pool(event)
+            pool.waiting = max(0, pool.waiting - 1)
+            pool.in_use += 1
+            self._publish()
+
+    def connection_check_out_failed(self, event):
+        reason = str(event.reason)
+        POOL_CHECKOUT_FAILURES.inc(reason)
+        with self._lock:
+            pool = self._pool(event)
+            pool.waiting = max(0, pool.waiting - 1)
+            self.last_failure = reason
+            self._publish()
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event)
+            pool.in_use = max(0, pool.in_use - 1)
+            self._publish()
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event).open += 1
+            self._publish()
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event)
+            pool.open = max(0, pool.open - 1)
+            self._publish()
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        # The server left the topology; its connections are gone with it
+        with self._lock:
+            self._servers.pop(event.address, None)
+            self._publish()
@@ -0,0 +1,290 @@
+"""
+Road-edge flood penalty index for AquaRoute.
+
+Keeps a grid index of road-graph edges and a maintained mapping from active
+waterlogging reports to the edges they affect, so routing can read per-edge
+flood penalties without rescanning reports on every query.
+"""
+
+import heapq
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from spatial_index import EARTH_RADIUS_M, radius_bbox
+
+# Radius (metres) around a report within which a road edge is penalised
+SEVERITY_RADIUS_M = {"Low": 50.0, "Medium": 100.0, "Severe": 200.0}
+
+# Penalty contributed to each affected edge
+SEVERITY_PENALTY = {"Low": 1.0, "Medium": 2.0, "Severe": 4.0}
+
+# Grid cell size in degrees (~550m of latitude)
+DEFAULT_CELL_DEG = 0.005
+
+# Shards per copy-on-write map; a write after a snapshot copies one shard
+SNAPSHOT_SHARDS = 64
+
+Point = Tuple[float, float]
+
+
+def _to_local_m(lat: float, lng: float, ref_lat: float) -> Point:
+    """Equirectangular projection to metres; accurate at city scale"""
+    x = math.radians(lng) * EARTH_RADIUS_M * math.cos(math.radians(ref_lat))
+    y = math.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def point_segment_distance_m(p: Point, a: Point, b: Point) -> float:
+    """Distance in metres from point p to the segment a-b (all (lat, lng))"""
+    px, py = _to_local_m(p[0], p[1], p[0])
+    ax, ay = _to_local_m(a[0], a[1], p[0])
+    bx, by = _to_local_m(b[0], b[1], p[0])
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+class _FrozenMap(Mapping):
+    """Read-only mapping over shards that are never written again"""
+
+    def __init__(self, shards: Tuple[dict, ...], size: int):
+        self._shards = shards
+        self._size = size
+
+    def __getitem__(self, key):
+        return self._shards[hash(key) % len(self._shards)][key]
+
+    def __iter__(self) -> Iterator:
+        return chain.from_iterable(self._shards)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class _CowMap:
+    """
+    Dict split into shards with copy-on-write snapshots. freeze() shares the
+    current shards with the returned view in O(shards); the first write to a
+    shared shard afterwards copies just that shard (~1/SNAPSHOT_SHARDS of the
+    map), so publishing a snapshot never copies the whole map.
+    """
+
+    def __init__(self, shards: int = SNAPSHOT_SHARDS):
+        self._shards = [{} for _ in range(shards)]
+        self._shared = [False] * shards
+        self._size = 0
+
+    def _index(self, key) -> int:
+        return hash(key) % len(self._shards)
+
+    def _writable(self, key) -> dict:
+        i = self._index(key)
+        if self._shared[i]:
+            self._shards[i] = dict(self._shards[i])
+            self._shared[i] = False
+        return self._shards[i]
+
+    def get(self, key, default=None):
+        return self._shards[self._index(key)].get(key, default)
+
+    def __setitem__(self, key, value) -> None:
+        shard = self._writable(key)
+        if key not in shard:
+            self._size += 1
+        shard[key] = value
+
+    def pop(self, key, default=None):
+        if key not in self._shards[self._index(key)]:
+            return default
+        self._size -= 1
+        return self._writable(key).pop(key)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def freeze(self) -> _FrozenMap:
+        self._shared = [True] * len(self._shards)
+        return _FrozenMap(tuple(self._shards), self._size)
+
+
+@dataclass(frozen=True)
+class PenaltySnapshot:
+    """Immutable view of edge penalties at a given index version"""
+    version: int
+    penalties: Mapping[str, float]
+    edges_by_report: Mapping[str, Tuple[str, ...]]
+
+
+@dataclass
+class _ActiveReport:
+    lat: float
+    lng: float
+    severity: str
+    expires_at: Optional[datetime]
+    edges: Tuple[str, ...] = field(default_factory=tuple)
+
+
+class FloodPenaltyIndex:
+    """
+    Grid index of road edges with incrementally maintained flood penalties.
+
+    Adding or expiring a report only touches the edges within that report's
+    radius. Readers call snapshot() and get an immutable PenaltySnapshot that
+    is never mutated afterwards, so they need no locking; snapshots share
+    storage with the index copy-on-write (see _CowMap).
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._edges: Dict[str, Tuple[Point, ...]] = {}
+        self._grid: Dict[Tuple[int, int], Set[str]] = {}
+        self._reports: Dict[str, _ActiveReport] = {}
+        self._penalties = _CowMap()
+        self._report_edges = _CowMap()
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._version = 0
+        self._snapshot = PenaltySnapshot(0, self._penalties.freeze(), self._report_edges.freeze())
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._edges)
+
+    def __len__(self) -> int:
+        return len(self._reports)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _cells_for_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        lo = self._cell(min_lat, min_lng)
+        hi = self._cell(max_lat, max_lng)
+        for i in range(lo[0], hi[0] + 1):
+            for j in range(lo[1], hi[1] + 1):
+                yield (i, j)
+
+    # Road graph maintenance
+
+    def add_edge(self, edge_id: str, coords: Sequence[Point]) -> None:
+        """Register a road edge as a polyline of (lat, lng) points"""
+        if len(coords) < 2:
+            raise ValueError("An edge needs at least two coordinates")
+        if edge_id in self._edges:
+            self.remove_edge(edge_id)
+        points = tuple((float(lat), float(lng)) for lat, lng in coords)
+        self._edges[edge_id] = points
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+        for cell in self._cells_for_bbox(min(lats), min(lngs), max(lats), max(lngs)):
+            self._grid.setdefault(cell, set()).add(edge_id)
+
+    def add_edges(self, edges: Iterable[Tuple[str, Sequence[Point]]]) -> None:
+        for edge_id, coords in edges:
+            self.add_edge(edge_id, coords)
+
+    def remove_edge(self, edge_id: str) -> None:
+        points = self._edges.pop(edge_id, None)
+        if points is None:
+            return
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+        for cell in self._cells_for_bbox(min(lats), min(lngs), max(lats), max(lngs)):
+            bucket = self._grid.get(cell)
+            if bucket is not None:
+                bucket.discard(edge_id)
+                if not bucket:
+                    del self._grid[cell]
+        if self._penalties.pop(edge_id, None) is not None:
+            self._version += 1
+
+    def edges_near(self, lat: float, lng: float, radius_m: float) -> List[str]:
+        """Edge IDs whose geometry lies within radius_m of the point"""
+        candidates: Set[str] = set()
+        for cell in self._cells_for_bbox(*radius_bbox(lat, lng, radius_m)):
+            bucket = self._grid.get(cell)
+            if bucket:
+                candidates.update(bucket)
+
+        hits = []
+        for edge_id in candidates:
+            points = self._edges[edge_id]
+            for a, b in zip(points, points[1:]):
+                if point_segment_distance_m((lat, lng), a, b) <= radius_m:
+                    hits.append(edge_id)
+                    break
+        return hits
+
+    # Report maintenance
+
+    def add_report(self, report_id: str, lat: float, lng: float, severity: str = "Medium",
+                   expires_at: Optional[datetime] = None) -> Tuple[str, ...]:
+        """Apply a report's penalty to nearby edges; returns the affected edge IDs"""
+        if report_id in self._reports:
+            self.remove_report(report_id)
+        radius = SEVERITY_RADIUS_M.get(severity, SEVERITY_RADIUS_M["Medium"])
+        penalty = SEVERITY_PENALTY.get(severity, SEVERITY_PENALTY["Medium"])
+        edges = tuple(self.edges_near(lat, lng, radius))
+        for edge_id in edges:
+            self._penalties[edge_id] = self._penalties.get(edge_id, 0.0) + penalty
+        self._reports[report_id] = _ActiveReport(lat, lng, severity, expires_at, edges)
+        self._report_edges[report_id] = edges
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, report_id))
+        self._version += 1
+        return edges
+
+    def remove_report(self, report_id: str) -> Tuple[str, ...]:
+        """Withdraw a report's penalty; returns the edge IDs it had affected"""
+        report = self._reports.pop(report_id, None)
+        if report is None:
+            return ()
+        self._report_edges.pop(report_id)
+        penalty = SEVERITY_PENALTY.get(report.severity, SEVERITY_PENALTY["Medium"])
+        for edge_id in report.edges:
+            remaining = self._penalties.get(edge_id, 0.0) - penalty
+            if remaining <= 1e-9:
+                self._penalties.pop(edge_id, None)
+            else:
+                self._penalties[edge_id] = remaining
+        self._version += 1
+        return report.edges
+
+    def expire(self, now: Optional[datetime] = None) -> List[str]:
+        """Remove every report whose expires_at has passed; returns their IDs"""
+        now = now or datetime.utcnow()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            expires_at, report_id = heapq.heappop(self._expiry_heap)
+            report = self._reports.get(report_id)
+            # Skip stale heap entries left behind by re-added or removed reports
+            if report is None or report.expires_at != expires_at:
+                continue
+            self.remove_report(report_id)
+            expired.append(report_id)
+        return expired
+
+    # Readers
+
+    def snapshot(self) -> PenaltySnapshot:
+        """Return an immutable snapshot of the current penalties"""
+        snap = self._snapshot
+        if snap.version != self._version:
+            snap = PenaltySnapshot(
+                version=self._version,
+                penalties=self._penalties.freeze(),
+                edges_by_report=self._report_edges.freeze(),
+            )
+            self._snapshot = snap
+        return snap
+
+    def penalty(self, edge_id: str) -> float:
+        return self._penalties.get(edge_id, 0.0)
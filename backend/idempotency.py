@@ -0,0 +1,102 @@
+"""
+Idempotency keys for retried writes.
+
+A client sends `Idempotency-Key: <uuid>` with a POST. The first request
+claims the key in `idempotency_keys`; retries with the same key get the
+original response back instead of repeating the write (and any image
+upload). Keys expire through a TTL index.
+
+A claim is locked for lock_timeout. If the worker handling it dies before
+completing or abandoning it, a retry after the lock runs out takes the claim
+over instead of getting 409 until the key expires.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_TTL = timedelta(hours=24)
+# Longer than any report creation takes, including its Mongo retries
+DEFAULT_LOCK_TIMEOUT = timedelta(seconds=30)
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class IdempotencyInProgress(Exception):
+    """The original request with this key has not finished yet"""
+
+
+def request_fingerprint(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, collection, scope: str, ttl: timedelta = DEFAULT_TTL,
+                 lock_timeout: timedelta = DEFAULT_LOCK_TIMEOUT):
+        self.collection = collection
+        self.scope = scope
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _id(self, key: str) -> str:
+        return f"{self.scope}:{key}"
+
+    async def begin(self, key: str, fingerprint: str) -> Optional[dict]:
+        """
+        Claim the key. Returns None if this request should proceed, or the
+        stored response if it is a replay of a completed request.
+        """
+        now = datetime.utcnow()
+        try:
+            await self.collection.insert_one({
+                "_id": self._id(key),
+                "status": "in_progress",
+                "fingerprint": fingerprint,
+                "locked_until": now + self.lock_timeout,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        record = await self.collection.find_one({"_id": self._id(key)})
+        if record is None:
+            # Expired between the insert attempt and the read; claim it again
+            return await self.begin(key, fingerprint)
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyKeyReused(key)
+        if record["status"] == "completed":
+            return record["response"]
+        # Take over a claim whose worker died; only one retry can win the update
+        taken = await self.collection.find_one_and_update(
+            {
+                "_id": self._id(key),
+                "status": "in_progress",
+                "$or": [{"locked_until": {"$lt": now}}, {"locked_until": {"$exists": False}}],
+            },
+            {"$set": {"locked_until": now + self.lock_timeout}},
+        )
+        if taken is None:
+            raise IdempotencyInProgress(key)
+        return None
+
+    async def complete(self, key: str, response: dict) -> None:
+        await self.collection.update_one(
+            {"_id": self._id(key)},
+            {"$set": {"status": "completed", "response": response, "completed_at": datetime.utcnow()}},
+        )
+
+    async def abandon(self, key: str) -> None:
+        """Release the key after a failed request so the client can retry"""
+        await self.collection.delete_one({"_id": self._id(key), "status": "in_progress"})
@@ -0,0 +1,230 @@
+"""
+Persistent Mongo-backed work queues.
+
+Used for work that should not hold up a request: report photo uploads
+(`image_jobs`) and alert webhooks (`webhook_jobs`). Jobs live in a
+collection so they survive restarts, and a small pool of workers in each
+process claims them with an atomic find_one_and_update:
+
+- a claimed job is locked for `visibility_timeout`, renewed while the job
+  runs; if its worker dies the lock runs out and another worker picks it up.
+  Each claim gets a fresh `lock_token` and outcomes are written only while
+  it matches, so a worker whose lock was taken over cannot delete or
+  re-queue the job under its new owner
+- failures are retried with exponential backoff
+- after `max_attempts` the job is dead-lettered (`status: "dead"`), the
+  `on_dead` callback runs, and the job is kept for inspection for
+  `dead_retention` (TTL on `failed_at`) without its `dead_unset` fields
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from pymongo import ReturnDocument
+
+from metrics import REGISTRY, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+QUEUE_JOB_DURATION = REGISTRY.register(Histogram(
+    "aquaroute_queue_job_duration_seconds",
+    "Queued job processing time by queue and outcome",
+    ("queue", "outcome"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+))
+QUEUE_JOBS = REGISTRY.register(Counter(
+    "aquaroute_queue_jobs_total",
+    "Queued jobs by queue and outcome (done, retry, dead, lost)",
+    ("queue", "outcome"),
+))
+
+Processor = Callable[[dict], Awaitable[None]]
+
+
+class JobQueue:
+    def __init__(self, database, collection_name: str, process: Processor, workers: int = 2,
+                 max_attempts: int = 5, retry_backoff: float = 2.0, visibility_timeout: float = 120.0,
+                 poll_interval: float = 5.0, on_dead: Optional[Processor] = None,
+                 dead_retention: timedelta = timedelta(days=7), dead_unset: Sequence[str] = ()):
+        # The collection is looked up on use so building the queue doesn't connect
+        self.database = database
+        self.collection_name = collection_name
+        self.process = process
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self.dead_retention = dead_retention
+        # Large payload fields not worth keeping once on_dead has handled them
+        self.dead_unset = tuple(dead_unset)
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    @property
+    def collection(self):
+        return self.database[self.collection_name]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("available_at", 1)])
+        # Only dead jobs have failed_at
+        await self.collection.create_index("failed_at",
+                                           expireAfterSeconds=int(self.dead_retention.total_seconds()))
+
+    async def enqueue(self, **fields) -> str:
+        """Queue a job; `fields` are stored on the job document for the processor"""
+        return (await self.enqueue_many([fields]))[0]
+
+    async def enqueue_many(self, jobs: List[dict]) -> List[str]:
+        now = datetime.utcnow()
+        documents = [{
+            **fields,
+            "_id": str(uuid.uuid4()),
+            "status": "queued",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+        } for fields in jobs]
+        if documents:
+            await self.collection.insert_many(documents)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return [document["_id"] for document in documents]
+
+    async def claim(self) -> Optional[dict]:
+        """Lock the next due job, including ones whose worker stopped renewing"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "processing", "locked_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": "processing", "lock_token": uuid.uuid4().hex,
+                         "locked_until": now + timedelta(seconds=self.visibility_timeout)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    def _owned(job: dict) -> dict:
+        """Filter matching the job only while this claim still holds its lock"""
+        return {"_id": job["_id"], "lock_token": job["lock_token"]}
+
+    async def _renew_lock(self, job: dict) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                result = await self.collection.update_one(self._owned(job), {"$set": {
+                    "locked_until": datetime.utcnow() + timedelta(seconds=self.visibility_timeout)}})
+            except Exception as e:
+                logger.warning(f"Renewing the lock on job {job['_id']} in {self.collection_name} failed: {e}")
+                continue
+            if not result.matched_count:
+                return
+
+    async def run_job(self, job: dict) -> str:
+        """Process one claimed job and record the outcome"""
+        start = time.perf_counter()
+        renewal = asyncio.create_task(self._renew_lock(job))
+        try:
+            await self.process(job)
+        except Exception as e:
+            outcome = await self._fail(job, e)
+        else:
+            result = await self.collection.delete_one(self._owned(job))
+            outcome = "done" if result.deleted_count else self._lost(job)
+        finally:
+            renewal.cancel()
+        QUEUE_JOB_DURATION.observe(time.perf_counter() - start, self.collection_name, outcome)
+        QUEUE_JOBS.inc(self.collection_name, outcome)
+        return outcome
+
+    async def _fail(self, job: dict, error: Exception) -> str:
+        attempts = job["attempts"]
+        if attempts >= self.max_attempts:
+            logger.error(f"Job {job['_id']} in {self.collection_name} dead-lettered "
+                         f"after {attempts} attempts: {error}")
+            result = await self.collection.update_one(
+                self._owned(job),
+                {"$set": {"status": "dead", "last_error": str(error), "failed_at": datetime.utcnow()},
+                 "$unset": {field: "" for field in ("locked_until", "lock_token", *self.dead_unset)}},
+            )
+            if not result.matched_count:
+                return self._lost(job)
+            if self.on_dead is not None:
+                try:
+                    await self.on_dead(job)
+                except Exception as e:
+                    logger.error(f"Dead-letter handler for job {job['_id']} in {self.collection_name} failed: {e}")
+            return "dead"
+        delay = self.retry_backoff * 2 ** (attempts - 1)
+        logger.warning(f"Job {job['_id']} in {self.collection_name} failed (attempt {attempts}), "
+                       f"retrying in {delay}s: {error}")
+        result = await self.collection.update_one(
+            self._owned(job),
+            {"$set": {"status": "queued", "last_error": str(error),
+                      "available_at": datetime.utcnow() + timedelta(seconds=delay)},
+             "$unset": {"locked_until": "", "lock_token": ""}},
+        )
+        return "retry" if result.matched_count else self._lost(job)
+
+    def _lost(self, job: dict) -> str:
+        logger.warning(f"Job {job['_id']} in {self.collection_name} was claimed by another worker "
+                       f"after its lock ran out; leaving the outcome to that worker")
+        return "lost"
+
+    async def drain(self) -> int:
+        """Process due jobs until none are left; returns how many ran"""
+        count = 0
+        while True:
+            job = await self.claim()
+            if job is None:
+                return count
+            await self.run_job(job)
+            count += 1
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.collection_name}-worker:{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop claiming; unfinished jobs are picked up again after their lock expires"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            # Clear before draining so an enqueue during the drain still wakes us
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker for {self.collection_name} failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        counts = {"queued": 0, "processing": 0, "dead": 0}
+        for status in counts:
+            counts[status] = await self.collection.count_documents({"status": status})
+        return {"workers": len(self._tasks), **counts}
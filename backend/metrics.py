@@ -0,0 +1,317 @@
+"""
+Lightweight request instrumentation for AquaRoute.
+
+Provides per-route latency histograms, MongoDB command timing through a
+pymongo CommandListener and Cloudinary upload timing, all rendered in the
+Prometheus text exposition format. Bookkeeping on the hot path is a
+perf_counter call, a bisect and a few dict lookups.
+
+Requests slower than a threshold are logged with a per-phase breakdown
+(validation, endpoint, serialization, Mongo, uploads) and kept in
+recent_slow_requests.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from sub-millisecond Mongo calls to slow uploads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Point-in-time value with optional labels"""
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is O(log buckets)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "aquaroute_http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code",
+    ("method", "route", "status"),
+))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    "aquaroute_http_request_db_seconds",
+    "Total MongoDB time spent per HTTP request",
+    ("method", "route"),
+))
+MONGO_COMMAND_LATENCY = REGISTRY.register(Histogram(
+    "aquaroute_mongo_command_duration_seconds",
+    "MongoDB command round-trip time by command name",
+    ("command",),
+))
+MONGO_COMMAND_FAILURES = REGISTRY.register(Counter(
+    "aquaroute_mongo_command_failures_total",
+    "MongoDB commands that returned an error",
+    ("command",),
+))
+CLOUDINARY_UPLOAD_LATENCY = REGISTRY.register(Histogram(
+    "aquaroute_cloudinary_upload_duration_seconds",
+    "Cloudinary image upload duration by outcome",
+    ("outcome",),
+))
+SLOW_REQUESTS = REGISTRY.register(Counter(
+    "aquaroute_http_slow_requests_total",
+    "HTTP requests slower than the slow-request threshold",
+    ("method", "route"),
+))
+
+
+@dataclass
+class RequestTimings:
+    """Per-request accumulator, shared with executor threads via contextvars"""
+    db_seconds: float = 0.0
+    db_calls: int = 0
+    # Seconds per named phase; see profiling.TimedRoute and timed_phase()
+    phases: Dict[str, float] = field(default_factory=dict)
+    _lap_start: float = 0.0
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def start_lap(self) -> None:
+        self._lap_start = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        """Charge the time since the previous lap to `name`"""
+        now = time.perf_counter()
+        self.add_phase(name, now - self._lap_start)
+        self._lap_start = now
+
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Charge the enclosed block to `name` on the current request, if any"""
+    timings = current_timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add_phase(name, time.perf_counter() - start)
+
+
+# Most recent slow requests, newest last
+recent_slow_requests: Deque[dict] = deque(maxlen=100)
+
+
+def record_slow_request(method: str, route: str, path: str, status: str,
+                        seconds: float, timings: RequestTimings) -> dict:
+    entry = {
+        "at": datetime.utcnow().isoformat(),
+        "method": method,
+        "route": route,
+        "path": path,
+        "status": int(status),
+        "seconds": round(seconds, 6),
+        "phases": {name: round(value, 6) for name, value in timings.phases.items()},
+        "db_seconds": round(timings.db_seconds, 6),
+        "db_calls": timings.db_calls,
+    }
+    recent_slow_requests.append(entry)
+    SLOW_REQUESTS.inc(method, route)
+    breakdown = " ".join(f"{name}={value:.3f}s" for name, value in timings.phases.items())
+    logger.warning(
+        f"Slow request {method} {path} -> {status} in {seconds:.3f}s: {breakdown} "
+        f"db={timings.db_seconds:.3f}s ({timings.db_calls} calls)"
+    )
+    return entry
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Records every Mongo command's duration globally and against the current request"""
+
+    def started(self, event):
+        pass
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.db_seconds += seconds
+            timings.db_calls += 1
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+        MONGO_COMMAND_FAILURES.inc(event.command_name)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request against its route template.
+
+    Requests taking at least slow_request_seconds (if set) are passed to
+    record_slow_request().
+    """
+
+    def __init__(self, app, exclude_paths: Sequence[str] = ("/metrics",),
+                 slow_request_seconds: Optional[float] = None):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_timings.reset(token)
+            # FastAPI stores the matched APIRoute in the scope; use its template
+            # rather than the raw path to keep label cardinality bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method, route_path, status[0])
+            REQUEST_DB_TIME.observe(timings.db_seconds, method, route_path)
+            if self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds:
+                record_slow_request(method, route_path, scope["path"], status[0], elapsed, timings)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
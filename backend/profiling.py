@@ -0,0 +1,173 @@
+"""
+On-demand sampling profiler and per-phase request timing.
+
+SamplingProfiler samples the Python stack of every thread in this process
+from a background thread and folds the samples into the collapsed-stack
+format read by flamegraph.pl, speedscope and similar tools, one stack per
+line with `;`-separated frames (outermost first) and a sample count:
+
+    MainThread;run (asyncio/runners.py:86);...;validate_python (pydantic/type_adapter.py:250) 42
+
+Only code that is running appears: a coroutine suspended in an await (for
+example waiting for Mongo) is on no stack. The profile therefore shows where
+CPU time and blocking calls go; waits are covered by the slow-request log.
+
+TimedRoute splits each request's handler time into validation, endpoint and
+serialization phases on metrics.current_timings.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from types import CodeType
+from typing import Dict, Optional
+
+from fastapi.routing import APIRoute
+
+from metrics import current_timings
+
+# Leaf frames of threads that are waiting for work rather than doing it
+IDLE_FRAMES = frozenset({
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+})
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profile is already running in this process"""
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._labels: Dict[CodeType, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="aquaroute-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip=own)
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def sample(self, skip: Optional[int] = None) -> None:
+        """Record one stack per thread (except `skip`)"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+_path_prefixes = None
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to the sys.path entry it was imported from"""
+    global _path_prefixes
+    if _path_prefixes is None:
+        _path_prefixes = sorted((os.path.join(os.path.abspath(p), "") for p in sys.path if p),
+                                key=len, reverse=True)
+    for prefix in _path_prefixes:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+_active = threading.Lock()
+
+
+async def profile(seconds: float, interval: float = 0.005, include_idle: bool = False) -> SamplingProfiler:
+    """Sample this process for `seconds` while the event loop keeps serving requests"""
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    profiler = SamplingProfiler(interval, include_idle)
+    try:
+        profiler.start()
+        await asyncio.sleep(seconds)
+    finally:
+        # Joining waits at most one interval
+        profiler.stop()
+        _active.release()
+    return profiler
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that charges handler time to phases of the current request:
+    validation (reading, parsing and validating the request, including
+    dependencies), endpoint (the route function) and serialization
+    (response model validation and JSON encoding).
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            async def timed_call(**values):
+                timings = current_timings.get()
+                if timings is not None:
+                    timings.lap("validation")
+                try:
+                    return await call(**values)
+                finally:
+                    if timings is not None:
+                        timings.lap("endpoint")
+        else:
+            def timed_call(**values):
+                # Runs in the threadpool, which copies the request's context
+                timings = current_timings.get()
+                if timings is not None:
+                    timings.lap("validation")
+                try:
+                    return call(**values)
+                finally:
+                    if timings is not None:
+                        timings.lap("endpoint")
+        # Swapped in before the handler is built, which reads dependant.call per request
+        self.dependant.call = timed_call
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = current_timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.start_lap()
+            try:
+                return await handler(request)
+            finally:
+                timings.lap("serialization" if "endpoint" in timings.phases else "validation")
+
+        return timed_handler
@@ -0,0 +1,229 @@
+"""
+Rate limiting and admission control for AquaRoute.
+
+A token bucket per (client, route budget) protects Mongo from a single
+misbehaving client, and a global in-flight cap sheds load when the process is
+saturated. Rejections return 429 (client over budget) or 503 (server over
+capacity) with a Retry-After header. The in-process check is a dict lookup
+plus a little arithmetic; an optional Mongo-backed fixed-window counter shares
+budgets across uvicorn workers.
+"""
+
+import ipaddress
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Pattern, Sequence, Tuple
+
+from metrics import REGISTRY, Counter, Gauge
+
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    "aquaroute_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter or load shedder",
+    ("budget", "reason"),
+))
+IN_FLIGHT_REQUESTS = REGISTRY.register(Gauge(
+    "aquaroute_in_flight_requests",
+    "HTTP requests currently being handled",
+))
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Sustained rate (requests/second) with a burst allowance"""
+    name: str
+    rate: float
+    burst: int
+
+
+# (method, path pattern, budget); first match wins
+DEFAULT_BUDGETS: List[Tuple[str, str, Budget]] = [
+    ("POST", r"^/api/reports$", Budget("create_report", rate=10 / 60, burst=5)),
+    ("POST", r"^/api/reports/[^/]+/vote$", Budget("vote", rate=30 / 60, burst=10)),
+    ("POST", r"^/api/reports/[^/]+/comments$", Budget("comment", rate=20 / 60, burst=5)),
+    ("POST", r"^/api/upload-image$", Budget("upload_image", rate=10 / 60, burst=3)),
+]
+DEFAULT_BUDGET = Budget("default", rate=10.0, burst=100)
+
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by client and budget"""
+
+    def __init__(self, budgets=None, default: Optional[Budget] = DEFAULT_BUDGET,
+                 max_keys: int = 100_000, clock=time.monotonic):
+        budgets = DEFAULT_BUDGETS if budgets is None else budgets
+        self._routes: List[Tuple[str, Pattern, Budget]] = [
+            (method, re.compile(pattern), budget) for method, pattern, budget in budgets
+        ]
+        self.default = default
+        self.max_keys = max_keys
+        self._clock = clock
+        # (client key, budget name) -> [tokens, last refill time], least recently used first
+        self._buckets: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+
+    def budget_for(self, method: str, path: str) -> Optional[Budget]:
+        for route_method, pattern, budget in self._routes:
+            if route_method == method and pattern.match(path):
+                return budget
+        return self.default
+
+    def check(self, client_key: str, budget: Budget) -> float:
+        """Consume one token; returns 0 if allowed, else seconds until retry"""
+        now = self._clock()
+        key = (client_key, budget.name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Evict the least recently used bucket; it is the likeliest to have refilled
+            while len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [float(budget.burst), now]
+        else:
+            bucket[0] = min(budget.burst, bucket[0] + (now - bucket[1]) * budget.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / budget.rate
+
+
+class MongoRateLimitBackend:
+    """Fixed-window counters in Mongo so all workers share one budget"""
+
+    def __init__(self, collection, window_seconds: int = 60):
+        self.collection = collection
+        self.window_seconds = window_seconds
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def hit(self, client_key: str, budget: Budget) -> float:
+        now = time.time()
+        window_start = int(now // self.window_seconds) * self.window_seconds
+        limit = budget.burst + budget.rate * self.window_seconds
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"{budget.name}:{client_key}:{window_start}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "expires_at": datetime.utcnow() + timedelta(seconds=2 * self.window_seconds)
+                },
+            },
+            upsert=True,
+            return_document=True,
+        )
+        if doc["count"] <= limit:
+            return 0.0
+        return window_start + self.window_seconds - now
+
+
+Networks = Sequence[ipaddress._BaseNetwork]
+
+
+def parse_networks(value: str) -> List[ipaddress._BaseNetwork]:
+    """Comma-separated IPs or CIDRs, e.g. "10.0.0.0/8, 127.0.0.1" """
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip()]
+
+
+def _is_trusted(address: str, trusted_proxies: Networks) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_key_from_scope(scope, trusted_proxies: Networks = ()) -> str:
+    """
+    Identify the caller by IP.
+
+    The socket peer is used unless it is one of trusted_proxies; then the
+    X-Forwarded-For entries are read from the right (the end our proxies
+    append to) and the first address that is not a trusted proxy is the
+    client. Entries further left are supplied by the client and ignored.
+    Bearer tokens are not verified by this API, so they are not used as keys.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not trusted_proxies or not _is_trusted(peer, trusted_proxies):
+        return "ip:" + peer
+    hops: List[bytes] = []
+    for name, value in scope.get("headers") or ():
+        if name == b"x-forwarded-for":
+            hops.extend(value.split(b","))
+    for hop in reversed(hops):
+        address = hop.strip().decode("latin-1")
+        if not _is_trusted(address, trusted_proxies):
+            return "ip:" + address
+    return "ip:" + peer
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-client budgets and global load shedding"""
+
+    def __init__(self, app, limiter: Optional[TokenBucketLimiter] = None,
+                 backend: Optional[MongoRateLimitBackend] = None,
+                 max_in_flight: Optional[int] = None, enabled: Optional[bool] = None,
+                 trusted_proxies: Optional[Networks] = None,
+                 exempt_paths=("/metrics",)):
+        self.app = app
+        self.limiter = limiter or TokenBucketLimiter()
+        self.backend = backend
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(
+            os.environ.get('MAX_IN_FLIGHT_REQUESTS', '256'))
+        self.enabled = enabled if enabled is not None else (
+            os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'false')
+        # X-Forwarded-For is only honoured on connections from these proxies
+        self.trusted_proxies = trusted_proxies if trusted_proxies is not None else parse_networks(
+            os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', ''))
+        self.exempt_paths = frozenset(exempt_paths)
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        budget = None if method == "OPTIONS" else self.limiter.budget_for(method, scope["path"])
+
+        if self.in_flight >= self.max_in_flight:
+            RATE_LIMIT_REJECTIONS.inc(budget.name if budget else "none", "overload")
+            await _reject(send, 503, 1.0, "Server is busy, please retry shortly")
+            return
+
+        if budget is not None:
+            client_key = client_key_from_scope(scope, self.trusted_proxies)
+            retry_after = self.limiter.check(client_key, budget)
+            if not retry_after and self.backend is not None:
+                retry_after = await self.backend.hit(client_key, budget)
+            if retry_after:
+                RATE_LIMIT_REJECTIONS.inc(budget.name, "rate_limited")
+                await _reject(send, 429, retry_after, "Too many requests")
+                return
+
+        self.in_flight += 1
+        IN_FLIGHT_REQUESTS.set(value=self.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            IN_FLIGHT_REQUESTS.set(value=self.in_flight)
+
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = ('{"detail": "%s"}' % detail).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
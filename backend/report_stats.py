@@ -0,0 +1,93 @@
+"""
+Hourly report statistics, maintained incrementally.
+
+One rollup document per (creation hour, geohash-5 area, severity) in the
+`report_stats` collection:
+
+    {"_id": "2026-10-19T13|te7ud|2", "hour": datetime(2026, 10, 19, 13),
+     "area": "te7ud", "severity": 2,
+     "reports": 3, "upvotes": 5, "downvotes": 1, "expired": 2}
+
+Report creation, votes and the expiry sweep each $inc the bucket of the
+report involved (votes and expiries count against the hour the report was
+created in). Queries read only the buckets in range, so their cost does not
+depend on how many reports there are, and history outlives the reports
+themselves.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from report_store import SEVERITY_CODES
+from scoring import SEVERITY_LEVELS
+from spatial_index import BASE32, geohash_encode
+
+STATS_PRECISION = 5  # ~4.9km x 4.9km
+COUNTERS = ("reports", "upvotes", "downvotes", "expired")
+
+
+def hour_of(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_of(report: dict) -> Tuple[datetime, str, int]:
+    """(hour, area, severity code) of an API-shaped report dict"""
+    return (
+        hour_of(report["created_at"]),
+        geohash_encode(report["lat"], report["lng"], STATS_PRECISION),
+        SEVERITY_CODES[report["severity"]],
+    )
+
+
+def bucket_id(bucket: Tuple[datetime, str, int]) -> str:
+    hour, area, severity = bucket
+    return f"{hour:%Y-%m-%dT%H}|{area}|{severity}"
+
+
+def valid_area(area: str) -> bool:
+    return 0 < len(area) <= STATS_PRECISION and all(char in BASE32 for char in area)
+
+
+async def record_stats(collection, reports: Iterable[dict], counts: Dict[str, int]) -> None:
+    """Add `counts` (e.g. {"reports": 1}) to the bucket of each report; one upsert per bucket"""
+    totals: Dict[Tuple[datetime, str, int], int] = defaultdict(int)
+    for report in reports:
+        totals[bucket_of(report)] += 1
+    operations = []
+    for bucket, times in totals.items():
+        hour, area, severity = bucket
+        operations.append(UpdateOne(
+            {"_id": bucket_id(bucket)},
+            {"$inc": {name: amount * times for name, amount in counts.items()},
+             "$setOnInsert": {"hour": hour, "area": area, "severity": severity}},
+            upsert=True,
+        ))
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+
+
+async def query_stats(collection, start: datetime, end: datetime, area: Optional[str] = None,
+                      precision: int = STATS_PRECISION) -> List[dict]:
+    """
+    Buckets for hours in [start, end), optionally within a geohash prefix,
+    with areas coarsened to `precision` characters.
+    """
+    spec = {"hour": {"$gte": hour_of(start), "$lt": end}}
+    if area:
+        # Anchored prefix, so the (hour, area) index bounds the scan
+        spec["area"] = {"$regex": f"^{area}"}
+    totals: Dict[Tuple[datetime, str, int], Dict[str, int]] = {}
+    async for doc in collection.find(spec, {"_id": 0}):
+        key = (doc["hour"], doc["area"][:precision], doc["severity"])
+        bucket = totals.get(key)
+        if bucket is None:
+            bucket = totals[key] = dict.fromkeys(COUNTERS, 0)
+        for name in COUNTERS:
+            bucket[name] += doc.get(name, 0)
+    return [
+        {"hour": hour, "area": area_key, "severity": SEVERITY_LEVELS[severity], **counters}
+        for (hour, area_key, severity), counters in sorted(totals.items())
+    ]
@@ -0,0 +1,174 @@
+"""
+Compact storage schema for waterlogging reports.
+
+The API shape (server.WaterloggingReport) is unchanged; only the stored
+documents are smaller:
+
+    API field            stored as
+    id (UUID string)     _id: Binary UUID (16 bytes, no separate ObjectId)
+    lat, lng             loc: GeoJSON Point [lng, lat]
+    severity ("Low"...)  severity: int index into SEVERITY_LEVELS
+    image_base64         moved to report_images, keyed by the same _id
+    None-valued fields   omitted
+
+to_document() and from_document() convert between the two. from_document()
+also accepts legacy documents (string `id`, ObjectId `_id`), and the filters
+here match both formats, so the app works while migrate_legacy_reports()
+converts old documents in the background.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from bson.binary import Binary
+
+from scoring import SEVERITY_LEVELS
+from spatial_index import EARTH_RADIUS_M, radius_bbox
+
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITY_LEVELS)}
+
+# Fields the API always returns, even when None
+NULLABLE_FIELDS = ("image_url", "image_base64", "image_status")
+
+# Counters a concurrent request may change while a legacy document is migrated
+MUTABLE_FIELDS = ("accuracy_score", "total_votes", "comment_count", "nearby_reports")
+
+
+def encode_id(report_id: str) -> Optional[Binary]:
+    try:
+        return Binary.from_uuid(uuid.UUID(report_id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def decode_id(value) -> str:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value.as_uuid())
+
+
+def id_filter(report_id: str) -> dict:
+    binary = encode_id(report_id)
+    if binary is None:
+        return {"id": report_id}
+    return {"$or": [{"_id": binary}, {"id": report_id}]}
+
+
+def ids_filter(report_ids: Iterable[str]) -> dict:
+    report_ids = list(report_ids)
+    binaries = [binary for binary in map(encode_id, report_ids) if binary is not None]
+    return {"$or": [{"_id": {"$in": binaries}}, {"id": {"$in": report_ids}}]}
+
+
+def near_filter(lat: float, lng: float, radius_m: float) -> dict:
+    """
+    Reports within radius_m of the point, in both formats. Compact documents
+    match through the 2dsphere index on loc; legacy ones (a box, not a circle)
+    through the sparse index on their string id, so neither branch scans.
+    """
+    min_lat, min_lng, max_lat, max_lng = radius_bbox(lat, lng, radius_m)
+    return {"$or": [
+        {"loc": {"$geoWithin": {"$centerSphere": [[lng, lat], radius_m / EARTH_RADIUS_M]}}},
+        {"id": {"$exists": True}, "lat": {"$gte": min_lat, "$lte": max_lat},
+         "lng": {"$gte": min_lng, "$lte": max_lng}},
+    ]}
+
+
+def to_document(report: dict) -> dict:
+    """Stored form of an API-shaped report dict (without its image_base64)"""
+    doc = {
+        key: value for key, value in report.items()
+        if value is not None and key not in ("id", "lat", "lng", "severity", "image_base64")
+    }
+    doc["_id"] = encode_id(report["id"])
+    doc["loc"] = {"type": "Point", "coordinates": [report["lng"], report["lat"]]}
+    doc["severity"] = SEVERITY_CODES[report["severity"]]
+    return doc
+
+
+def from_document(doc: dict, fill_defaults: bool = False) -> dict:
+    """API-shaped dict from a stored (or legacy) document; handles partial projections"""
+    report = dict(doc)
+    _id = report.pop("_id", None)
+    if "id" not in report and _id is not None:
+        report["id"] = decode_id(_id)
+    loc = report.pop("loc", None)
+    if loc is not None:
+        report["lng"], report["lat"] = loc["coordinates"]
+    if isinstance(report.get("severity"), int):
+        report["severity"] = SEVERITY_LEVELS[report["severity"]]
+    if fill_defaults:
+        for key in NULLABLE_FIELDS:
+            report.setdefault(key, None)
+    return report
+
+
+def image_document(report_id: str, image_base64: str, expires_at: Optional[datetime] = None) -> dict:
+    return {
+        "_id": encode_id(report_id),
+        "image_base64": image_base64,
+        # Own TTL so images never outlive their report
+        "expires_at": expires_at or datetime.utcnow() + timedelta(days=1),
+    }
+
+
+async def attach_images(images, reports: List[dict]) -> None:
+    """Fill image_base64 on API-shaped reports whose photo is stored inline"""
+    wanted = {
+        report["id"]: report for report in reports
+        if report.get("image_status") in ("inline", "failed") and not report.get("image_base64")
+    }
+    if not wanted:
+        return
+    binaries = [binary for binary in map(encode_id, wanted) if binary is not None]
+    async for image in images.find({"_id": {"$in": binaries}}):
+        wanted[decode_id(image["_id"])]["image_base64"] = image["image_base64"]
+
+
+async def migrate_legacy_reports(reports, images, batch_size: int = 500) -> int:
+    """
+    Convert up to batch_size legacy documents; returns how many were converted.
+
+    Each converted document is written before the legacy one is deleted, and
+    the delete only succeeds if the counters are unchanged. If a request
+    updated the legacy document in between, the new copy is dropped and the
+    document is retried on the next run, so no vote or comment is lost.
+    Readers de-duplicate the brief overlap by id.
+    """
+    legacy = await reports.find({"id": {"$exists": True}}).to_list(batch_size)
+    converted = 0
+    for doc in legacy:
+        report = from_document(doc)
+        if encode_id(report["id"]) is None:
+            # Not a UUID; leave it in the legacy format (still readable)
+            continue
+        image_base64 = report.pop("image_base64", None)
+        new_doc = to_document(report)
+        if image_base64:
+            await images.replace_one(
+                {"_id": new_doc["_id"]},
+                image_document(report["id"], image_base64, report.get("expires_at")),
+                upsert=True,
+            )
+            new_doc["image_status"] = new_doc.get("image_status") or "inline"
+        # Upsert in case an earlier run stopped between these two writes
+        await reports.replace_one({"_id": new_doc["_id"]}, new_doc, upsert=True)
+        unchanged = {field: doc[field] if field in doc else {"$exists": False} for field in MUTABLE_FIELDS}
+        result = await reports.delete_one({"_id": doc["_id"], **unchanged})
+        if result.deleted_count:
+            converted += 1
+        else:
+            await reports.delete_one({"_id": new_doc["_id"]})
+    return converted
+
+
+def dedupe(reports: List[dict]) -> List[dict]:
+    """Drop the second copy of a report caught mid-migration"""
+    seen = set()
+    unique = []
+    for report in reports:
+        if report["id"] not in seen:
+            seen.add(report["id"])
+            unique.append(report)
+    return unique
@@ -0,0 +1,180 @@
+"""
+In-app asyncio scheduler for periodic maintenance jobs.
+
+Jobs run on their own tasks, never on a request path. Each job gets:
+
+- a jittered interval so workers don't fire in lockstep
+- an optional timeout
+- single-flight execution: a run that is still going is never overlapped,
+  and run_now() joins an in-flight run instead of starting another
+- an optional lease (see coordination.py) so only the leader runs it
+- graceful shutdown: stop() lets in-flight runs finish within a grace
+  period, then cancels them
+- run-time metrics in /metrics
+"""
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+JOB_DURATION = REGISTRY.register(Histogram(
+    "aquaroute_job_duration_seconds",
+    "Background job run time by job and outcome",
+    ("job", "outcome"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+))
+JOB_RUNS = REGISTRY.register(Counter(
+    "aquaroute_job_runs_total",
+    "Background job runs by job and outcome",
+    ("job", "outcome"),
+))
+JOB_LAST_SUCCESS = REGISTRY.register(Gauge(
+    "aquaroute_job_last_success_timestamp_seconds",
+    "Unix time of each job's last successful run",
+    ("job",),
+))
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float
+    jitter: float = 0.1  # Fraction of interval
+    timeout: Optional[float] = None
+    lease: Optional[object] = None  # coordination.LocalLease / MongoLease
+    runs: int = 0
+    failures: int = 0
+    last_duration: Optional[float] = None
+    last_success: Optional[float] = None
+    last_error: Optional[str] = None
+    _running: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class Scheduler:
+    def __init__(self, shutdown_grace: float = 10.0):
+        self.shutdown_grace = shutdown_grace
+        self._jobs: Dict[str, Job] = {}
+        self._loops: Dict[str, asyncio.Task] = {}
+        self._stopping: Optional[asyncio.Event] = None
+
+    def register(self, name: str, func: Callable[[], Awaitable[None]], interval: float,
+                 jitter: float = 0.1, timeout: Optional[float] = None, lease=None) -> Job:
+        if name in self._jobs:
+            raise ValueError(f"Job {name} is already registered")
+        job = Job(name, func, interval, jitter, timeout, lease)
+        self._jobs[name] = job
+        return job
+
+    @property
+    def jobs(self) -> Dict[str, Job]:
+        return dict(self._jobs)
+
+    async def start(self) -> None:
+        self._stopping = asyncio.Event()
+        for name, job in self._jobs.items():
+            if name not in self._loops:
+                self._loops[name] = asyncio.create_task(self._loop(job), name=f"job:{name}")
+
+    async def stop(self) -> None:
+        """Stop scheduling, give in-flight runs the grace period, then cancel"""
+        if self._stopping is not None:
+            self._stopping.set()
+        in_flight = [job._running for job in self._jobs.values() if job._running and not job._running.done()]
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=self.shutdown_grace)
+        for task in list(self._loops.values()) + in_flight:
+            task.cancel()
+        await asyncio.gather(*self._loops.values(), *in_flight, return_exceptions=True)
+        self._loops.clear()
+        for job in self._jobs.values():
+            if job.lease is not None:
+                try:
+                    await job.lease.release()
+                except Exception:
+                    pass
+
+    async def run_now(self, name: str) -> None:
+        """Run a job immediately, joining the current run if one is in flight"""
+        job = self._jobs[name]
+        if job._running is None or job._running.done():
+            job._running = asyncio.create_task(self._execute(job), name=f"job-run:{name}")
+        await asyncio.shield(job._running)
+
+    def _next_delay(self, job: Job) -> float:
+        spread = job.interval * job.jitter
+        return max(0.0, job.interval + random.uniform(-spread, spread))
+
+    async def _loop(self, job: Job) -> None:
+        # Stagger the first run so workers starting together don't collide
+        delay = random.uniform(0, job.interval * job.jitter)
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                if job.lease is None or await job.lease.acquire():
+                    await self.run_now(job.name)
+                else:
+                    JOB_RUNS.inc(job.name, "not_leader")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already recorded by _execute; keep the schedule going
+                pass
+            delay = self._next_delay(job)
+
+    async def _execute(self, job: Job) -> None:
+        start = time.perf_counter()
+        outcome = "success"
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.func(), timeout=job.timeout)
+            else:
+                await job.func()
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            job.last_error = f"timed out after {job.timeout}s"
+            logger.error(f"Job {job.name} timed out after {job.timeout}s")
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "error"
+            job.last_error = str(e)
+            logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - start
+            job.runs += 1
+            job.last_duration = elapsed
+            JOB_DURATION.observe(elapsed, job.name, outcome)
+            JOB_RUNS.inc(job.name, outcome)
+            if outcome == "success":
+                job.last_success = time.time()
+                job.last_error = None
+                JOB_LAST_SUCCESS.set(job.name, value=job.last_success)
+            else:
+                job.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "interval": job.interval,
+                "runs": job.runs,
+                "failures": job.failures,
+                "running": bool(job._running and not job._running.done()),
+                "last_duration_ms": round(job.last_duration * 1000, 3) if job.last_duration is not None else None,
+                "last_success": job.last_success,
+                "last_error": job.last_error,
+            }
+            for name, job in self._jobs.items()
+        }
@@ -0,0 +1,102 @@
+"""
+Trust scoring for waterlogging reports.
+
+Each report gets a base confidence in [0, 1] from its votes, agreement with
+nearby reports and photo evidence. Confidence decays with age, but instead
+of recomputing the decay on every read, reports store a time-shifted
+log score:
+
+    trust_rank = ln(confidence * severity_weight) + created_at / TAU
+
+Because every report decays at the same rate, ordering by trust_rank is the
+same as ordering by decayed confidence at any moment, and "decayed
+confidence >= threshold" becomes the indexable range query
+
+    trust_rank >= ln(threshold) + now / TAU
+
+Scores are only recomputed when their inputs change (create, vote, a new
+nearby report), never on reads.
+"""
+
+import math
+from datetime import datetime
+from typing import Optional
+
+SEVERITY_LEVELS = ("Low", "Medium", "Severe")
+
+# Severe reports rank above equally trusted minor ones
+SEVERITY_WEIGHT = {"Low": 0.6, "Medium": 0.8, "Severe": 1.0}
+
+# Confidence halves every 6 hours
+HALF_LIFE_SECONDS = 6 * 3600
+TAU = HALF_LIFE_SECONDS / math.log(2)
+
+# Beta prior on vote accuracy: an unvoted report starts at 0.5
+PRIOR_UP = 1.0
+PRIOR_DOWN = 1.0
+
+# Reports within this distance and window count as corroborating each other
+AGREEMENT_RADIUS_M = 150.0
+AGREEMENT_SCALE = 2.0  # ~63% of the agreement weight at 2 nearby reports
+
+W_VOTES = 0.6
+W_AGREEMENT = 0.3
+W_PHOTO = 0.1
+
+EPOCH = datetime(1970, 1, 1)
+MIN_CONFIDENCE = 1e-6
+
+
+def _timestamp(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+
+def vote_accuracy(accuracy_score: int, total_votes: int) -> float:
+    """Posterior mean of the up-vote fraction"""
+    up = (total_votes + accuracy_score) / 2
+    down = (total_votes - accuracy_score) / 2
+    return (up + PRIOR_UP) / (up + down + PRIOR_UP + PRIOR_DOWN)
+
+
+def agreement(nearby_reports: int) -> float:
+    return 1.0 - math.exp(-max(nearby_reports, 0) / AGREEMENT_SCALE)
+
+
+def base_confidence(accuracy_score: int = 0, total_votes: int = 0,
+                    nearby_reports: int = 0, has_photo: bool = False) -> float:
+    """Undecayed confidence in [0, 1]"""
+    return (W_VOTES * vote_accuracy(accuracy_score, total_votes)
+            + W_AGREEMENT * agreement(nearby_reports)
+            + W_PHOTO * (1.0 if has_photo else 0.0))
+
+
+def trust_rank(confidence: float, severity: str, created_at: datetime) -> float:
+    weight = SEVERITY_WEIGHT.get(severity, SEVERITY_WEIGHT["Medium"])
+    return math.log(max(confidence * weight, MIN_CONFIDENCE)) + _timestamp(created_at) / TAU
+
+
+def rank_threshold(min_confidence: float, now: Optional[datetime] = None) -> float:
+    """Lowest trust_rank whose decayed, severity-weighted confidence is >= min_confidence"""
+    now = now or datetime.utcnow()
+    return math.log(max(min_confidence, MIN_CONFIDENCE)) + _timestamp(now) / TAU
+
+
+def effective_confidence(rank: float, now: Optional[datetime] = None) -> float:
+    """Decayed, severity-weighted confidence at `now`, recovered from trust_rank"""
+    now = now or datetime.utcnow()
+    return math.exp(rank - _timestamp(now) / TAU)
+
+
+def score_fields(report: dict) -> dict:
+    """The stored score fields for a report document"""
+    confidence = base_confidence(
+        report.get("accuracy_score", 0),
+        report.get("total_votes", 0),
+        report.get("nearby_reports", 0),
+        # has_photo is set at creation, before a queued upload fills in image_url
+        bool(report.get("has_photo") or report.get("image_url") or report.get("image_base64")),
+    )
+    return {
+        "confidence": round(confidence, 6),
+        "trust_rank": trust_rank(confidence, report.get("severity", "Medium"), report["created_at"]),
+    }
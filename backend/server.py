@@ -1,42 +1,262 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, UploadFile, File, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import cloudinary
-import cloudinary.uploader
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, OperationFailure
 import os
+import asyncio
+import hmac
 import logging
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import base64
-import io
-from PIL import Image
+import json
+from coalescing import SingleFlightCache
+from coordination import LocalEventBus, LocalLease, MongoEventBus, MongoLease
+from db_config import MongoSettings, PoolMonitor
+from flood_index import FloodPenaltyIndex
+from idempotency import (
+    MAX_KEY_LENGTH, IdempotencyInProgress, IdempotencyKeyReused, IdempotencyStore, request_fingerprint
+)
+from job_queue import JobQueue
+from metrics import (
+    CLOUDINARY_UPLOAD_LATENCY,
+    PROMETHEUS_CONTENT_TYPE,
+    MetricsMiddleware,
+    MongoCommandTimer,
+    recent_slow_requests,
+    render_metrics,
+    timed_phase,
+)
+from profiling import ProfilerBusy, TimedRoute, profile
+from rate_limit import MongoRateLimitBackend, RateLimitMiddleware
+from report_stats import STATS_PRECISION, query_stats, record_stats, valid_area
+from report_store import (
+    attach_images, dedupe, from_document, id_filter, ids_filter, image_document,
+    migrate_legacy_reports, near_filter, to_document
+)
+from scheduler import Scheduler
+from scoring import AGREEMENT_RADIUS_M, SEVERITY_LEVELS, rank_threshold, score_fields
+from spatial_index import GeoHashIndex
+from subscriptions import Subscription, SubscriptionIndex
+from webhooks import UnsafeWebhookURL, resolve_webhook_url
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Heavy subsystems (dotenv, Motor, Cloudinary) are initialised on first use so
+# importing this module stays cheap for cold starts
+_env_loaded = False
+
+def load_env():
+    """Load backend/.env once; existing environment variables take precedence"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(ROOT_DIR / '.env')
+        _env_loaded = True
 
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+_mongo_client = None
+_mongo_settings = None
+pool_monitor = PoolMonitor(max_pool_size=0)
+
+def get_mongo_settings() -> MongoSettings:
+    global _mongo_settings
+    if _mongo_settings is None:
+        load_env()
+        _mongo_settings = MongoSettings.from_env()
+        pool_monitor.max_pool_size = _mongo_settings.max_pool_size
+    return _mongo_settings
+
+def get_mongo_client():
+    """Create the Motor client on first database access"""
+    global _mongo_client
+    if _mongo_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        settings = get_mongo_settings()
+        _mongo_client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            event_listeners=[MongoCommandTimer(), pool_monitor],
+            **settings.client_kwargs()
+        )
+    return _mongo_client
+
+class LazyDatabase:
+    """Stands in for the Motor database until it is first used"""
+    def __init__(self):
+        self._database = None
+
+    def _resolve(self):
+        if self._database is None:
+            load_env()
+            self._database = get_mongo_client()[os.environ['DB_NAME']]
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+db = LazyDatabase()
+
+def list_collection(name: str):
+    """Collection handle for read-heavy list routes (may be served by a secondary)"""
+    return db.get_collection(name, read_preference=get_mongo_settings().list_read_preference_obj())
 
 # Cloudinary configuration
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY', 'demo'),  
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET', 'demo')
-)
+_cloudinary_uploader = None
 
-# Create the main app without a prefix
-app = FastAPI()
+def get_cloudinary_uploader():
+    """Import and configure the Cloudinary SDK on the first upload"""
+    global _cloudinary_uploader
+    if _cloudinary_uploader is None:
+        import cloudinary
+        import cloudinary.uploader
+        load_env()
+        cloudinary.config(
+            cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
+            api_key=os.environ.get('CLOUDINARY_API_KEY', 'demo'),
+            api_secret=os.environ.get('CLOUDINARY_API_SECRET', 'demo')
+        )
+        _cloudinary_uploader = cloudinary.uploader
+    return _cloudinary_uploader
+
+# Road-edge flood penalties, kept in step with active reports
+flood_index = FloodPenaltyIndex()
+# Positions of active reports for "what's near here" lookups
+report_index = GeoHashIndex()
+# False until startup has seeded report_index from Mongo
+report_index_ready = False
+# Areas watched by alert subscriptions, inverted by geohash cell
+subscription_index = SubscriptionIndex()
+
+# Cross-worker coordination; create_app switches to Mongo-backed variants
+# when WORKER_COORDINATION=mongo (see README, "Running with multiple workers")
+event_bus = LocalEventBus()
+
+def load_settings():
+    """
+    Read the tunables below from the environment. create_app() calls this
+    again after load_env(), so values from backend/.env take effect.
+    """
+    global EXPIRY_SWEEP_INTERVAL, REPORT_TTL_GRACE, REPORTS_CACHE_TTL, IMAGE_WORKERS, IMAGE_JOB_MAX_ATTEMPTS
+    global WEBHOOK_WORKERS, WEBHOOK_MAX_ATTEMPTS, WEBHOOK_TIMEOUT_SECONDS, REPORT_MIGRATION_BATCH
+    global SLOW_REQUEST_SECONDS, WEBHOOK_ALLOWED_HOSTS
+    EXPIRY_SWEEP_INTERVAL = float(os.environ.get('EXPIRY_SWEEP_INTERVAL_SECONDS', '60'))
+    # The sweep deletes expired reports (and counts them in the stats); the TTL
+    # index only removes those it missed, e.g. while no worker held the lease
+    REPORT_TTL_GRACE = int(os.environ.get('REPORT_TTL_GRACE_SECONDS', '3600'))
+    # Identical report-list polls share one query; results live for a short TTL
+    REPORTS_CACHE_TTL = float(os.environ.get('REPORTS_CACHE_TTL_SECONDS', '1.0'))
+    # Report photos are uploaded off the request path
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+    IMAGE_JOB_MAX_ATTEMPTS = int(os.environ.get('IMAGE_JOB_MAX_ATTEMPTS', '5'))
+    # Alert webhooks are delivered through their own queue
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '2'))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+    WEBHOOK_TIMEOUT_SECONDS = float(os.environ.get('WEBHOOK_TIMEOUT_SECONDS', '5'))
+    # Optional comma-separated host allowlist (subdomains included); see webhooks.py
+    WEBHOOK_ALLOWED_HOSTS = tuple(
+        host.strip().lower() for host in os.environ.get('WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()
+    )
+    REPORT_MIGRATION_BATCH = int(os.environ.get('REPORT_MIGRATION_BATCH', '500'))
+    # Requests slower than this are logged and kept for /debug/slow-requests (0 disables)
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0'))
+
+load_settings()
+
+# Periodic maintenance; jobs are registered in create_app
+scheduler = Scheduler()
+
+# Shared report-list results; create_app rebuilds it with the configured TTL
+reports_cache = SingleFlightCache("reports", ttl=REPORTS_CACHE_TTL)
+
+# Queues for report photos and alert webhooks; create_app builds them
+image_queue = None
+
+webhook_queue = None
+_webhook_client = None
+
+def _on_report_created(payload: dict):
+    flood_index.add_report(payload["id"], payload["lat"], payload["lng"],
+                           payload["severity"], payload["expires_at"])
+    report_index.insert(payload["id"], payload["lat"], payload["lng"], payload["expires_at"])
+
+def _on_subscription_created(payload: dict):
+    subscription_index.add(Subscription.from_document(payload))
+
+def _on_subscription_deleted(payload: dict):
+    subscription_index.remove(payload["id"])
+
+def _invalidate_report_lists(payload: dict):
+    reports_cache.invalidate()
+
+def _on_reports_expired(payload: dict):
+    for report_id in payload["ids"]:
+        flood_index.remove_report(report_id)
+        report_index.remove(report_id)
+
+async def expire_local_indexes():
+    now = datetime.utcnow()
+    flood_index.expire(now)
+    report_index.expire(now)
+
+# Fields that place a report in its stats bucket (legacy documents carry lat/lng)
+STATS_PROJECTION = {"id": 1, "loc": 1, "lat": 1, "lng": 1, "severity": 1, "created_at": 1}
+
+async def sweep_expired_reports():
+    """Delete expired reports and tell every worker to drop them (runs on the leader only)"""
+    current_time = datetime.utcnow()
+    expired = await db.waterlogging_reports.find(
+        {"expires_at": {"$lt": current_time}}, STATS_PROJECTION
+    ).to_list(None)
+    if not expired:
+        return
+    ids = [from_document(report)["id"] for report in expired]
+    await db.waterlogging_reports.delete_many({"_id": {"$in": [report["_id"] for report in expired]}})
+    await db.report_images.delete_many({"_id": {"$in": [report["_id"] for report in expired]}})
+    await record_stats(db.report_stats, (from_document(report) for report in expired), {"expired": 1})
+    await event_bus.publish("reports.expired", {"ids": ids})
+    logger.info(f"Swept {len(ids)} expired reports")
+
+async def migrate_reports():
+    """Convert legacy report documents to the compact schema (runs on the leader only)"""
+    total = 0
+    while True:
+        converted = await migrate_legacy_reports(db.waterlogging_reports, db.report_images,
+                                                 REPORT_MIGRATION_BATCH)
+        total += converted
+        if converted < REPORT_MIGRATION_BATCH:
+            break
+    if total:
+        # Content is unchanged apart from image_status; other workers catch up within the TTL
+        reports_cache.invalidate()
+        logger.info(f"Migrated {total} reports to the compact schema")
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
+
+COMMENT_SNIPPET_LENGTH = 80
 
 # Define Models
+class CommentSummary(BaseModel):
+    author: str
+    text: str  # Truncated to COMMENT_SNIPPET_LENGTH
+    created_at: datetime
+
 class WaterloggingReport(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     lat: float
@@ -44,10 +264,17 @@ class WaterloggingReport(BaseModel):
     severity: str = Field(default="Medium")  # Low, Medium, Severe
     image_url: Optional[str] = None  # New field for photo URL
     image_base64: Optional[str] = None  # Base64 for display when Cloudinary unavailable
+    image_status: Optional[str] = None  # pending, ready, inline or failed; None without a photo
     created_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime = Field(default_factory=lambda: datetime.utcnow() + timedelta(days=1))
     accuracy_score: int = Field(default=0)  # For voting system
     total_votes: int = Field(default=0)
+    comment_count: int = Field(default=0)  # Denormalized, maintained by create_comment
+    latest_comment: Optional[CommentSummary] = None
+    has_photo: bool = Field(default=False)
+    nearby_reports: int = Field(default=0)  # Active reports corroborating this one
+    confidence: Optional[float] = None  # Undecayed trust score in [0, 1], see scoring.py
+    trust_rank: Optional[float] = None  # Indexed, decay-aware sort key
 
 class WaterloggingReportCreate(BaseModel):
     lat: float
@@ -66,6 +293,10 @@ class CommentCreate(BaseModel):
     text: str = Field(max_length=200)
     author: Optional[str] = "Anonymous"
 
+class CommentBatchRequest(BaseModel):
+    report_ids: List[str] = Field(max_length=200)
+    limit_per_report: int = Field(default=100, ge=1, le=100)
+
 class VoteRequest(BaseModel):
     vote_type: str  # "up" or "down"
 
@@ -77,41 +308,219 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
-# Helper function for image upload
+MAX_ROUTE_POINTS = 200
+
+class SubscriptionCreate(BaseModel):
+    # Either a place (lat, lng) or a commute (route as [[lat, lng], ...])
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    route: Optional[List[List[float]]] = Field(default=None, max_length=MAX_ROUTE_POINTS)
+    radius_m: float = Field(default=500.0, ge=10, le=5000)  # Around the place, or either side of the route
+    min_severity: str = "Low"
+    webhook_url: Optional[str] = Field(default=None, max_length=2048)
+
+class AlertSubscription(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    points: List[List[float]]
+    radius_m: float
+    min_severity: str = "Low"
+    webhook_url: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class StatsBucket(BaseModel):
+    hour: datetime  # Creation hour (UTC) of the reports counted here
+    area: str  # Geohash prefix
+    severity: str
+    reports: int
+    upvotes: int
+    downvotes: int
+    expired: int
+
+class ReportStats(BaseModel):
+    start: datetime
+    end: datetime
+    precision: int
+    buckets: List[StatsBucket]
+
+class Alert(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    subscription_id: str
+    report_id: str
+    lat: float
+    lng: float
+    severity: str
+    distance_m: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Helper functions for image upload
+def cloudinary_configured() -> bool:
+    return not (os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo') == 'demo' or
+                os.environ.get('CLOUDINARY_API_KEY', 'demo') == 'demo' or
+                os.environ.get('CLOUDINARY_API_SECRET', 'demo') == 'demo')
+
+async def upload_to_cloudinary(image_base64: str) -> str:
+    """Upload base64 image to Cloudinary and return URL; raises on failure"""
+    upload_start = time.perf_counter()
+    try:
+        # The SDK is blocking; keep it off the event loop
+        with timed_phase("upload"):
+            result = await asyncio.to_thread(
+                get_cloudinary_uploader().upload,
+                image_base64,
+                folder="aquaroute_reports",
+                resource_type="image",
+                transformation=[
+                    {"width": 800, "height": 600, "crop": "limit"},
+                    {"quality": "auto:good"}
+                ]
+            )
+    except Exception:
+        CLOUDINARY_UPLOAD_LATENCY.observe(time.perf_counter() - upload_start, "error")
+        raise
+    CLOUDINARY_UPLOAD_LATENCY.observe(time.perf_counter() - upload_start, "success")
+    url = result.get("secure_url")
+    if not url:
+        raise RuntimeError("Cloudinary response had no secure_url")
+    return url
+
 async def upload_image_to_cloudinary(image_base64: str) -> str:
-    """Upload base64 image to Cloudinary and return URL"""
+    """Upload base64 image to Cloudinary and return URL (None if unavailable)"""
     try:
         # Check if Cloudinary is configured
-        if (os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo') == 'demo' or
-            os.environ.get('CLOUDINARY_API_KEY', 'demo') == 'demo' or  
-            os.environ.get('CLOUDINARY_API_SECRET', 'demo') == 'demo'):
+        if not cloudinary_configured():
             logger.warning("Cloudinary not configured - using base64 storage")
             return None
-            
-        # Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            image_base64,
-            folder="aquaroute_reports",
-            resource_type="image",
-            transformation=[
-                {"width": 800, "height": 600, "crop": "limit"},
-                {"quality": "auto:good"}
-            ]
-        )
-        return result.get("secure_url")
+        return await upload_to_cloudinary(image_base64)
     except Exception as e:
         logger.error(f"Cloudinary upload failed: {e}")
         return None
 
+async def process_report_image(job: dict):
+    """Image queue worker: upload a report's photo and patch the report"""
+    if cloudinary_configured():
+        update = {"image_url": await upload_to_cloudinary(job["image_base64"]), "image_status": "ready"}
+        await db.waterlogging_reports.update_one(id_filter(job["report_id"]), {"$set": update})
+    else:
+        # Keep base64 for display when Cloudinary is unavailable
+        await store_inline_image(job["report_id"], job["image_base64"], "inline")
+
+async def store_inline_image(report_id: str, image_base64: str, status: str):
+    """Keep the photo in report_images, out of the report document"""
+    await db.report_images.replace_one(
+        {"_id": image_document(report_id, image_base64)["_id"]},
+        image_document(report_id, image_base64),
+        upsert=True
+    )
+    await db.waterlogging_reports.update_one(id_filter(report_id), {"$set": {"image_status": status}})
+
+def get_webhook_client():
+    """Shared HTTP client for alert webhooks, created on first delivery"""
+    global _webhook_client
+    if _webhook_client is None:
+        import httpx
+        # Redirects could lead to internal addresses that were never checked
+        _webhook_client = httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT_SECONDS, follow_redirects=False)
+    return _webhook_client
+
+async def deliver_webhook(job: dict):
+    """Webhook queue worker: POST an alert; non-2xx responses are retried"""
+    # Checked again on delivery and pinned to the checked address (DNS rebinding)
+    target = await resolve_webhook_url(job["url"], WEBHOOK_ALLOWED_HOSTS)
+    response = await get_webhook_client().post(
+        target.url, json=job["payload"], headers={"Host": target.host_header},
+        extensions={"sni_hostname": target.server_name}
+    )
+    response.raise_for_status()
+
+async def notify_subscribers(report: WaterloggingReport):
+    """Record an alert for every subscription watching the report's location"""
+    matches = subscription_index.match(report.lat, report.lng, report.severity)
+    if not matches:
+        return
+    alerts = [
+        Alert(subscription_id=subscription.id, report_id=report.id, lat=report.lat, lng=report.lng,
+              severity=report.severity, distance_m=round(distance, 1))
+        for subscription, distance in matches
+    ]
+    await db.alerts.insert_many([alert.dict() for alert in alerts])
+    await webhook_queue.enqueue_many([
+        {"url": subscription.webhook_url, "payload": jsonable_encoder(alert)}
+        for (subscription, _), alert in zip(matches, alerts) if subscription.webhook_url
+    ])
+
+async def image_job_dead(job: dict):
+    """Out of retries: fall back to serving the photo inline"""
+    await store_inline_image(job["report_id"], job["image_base64"], "failed")
+
+# Trust scoring: stored scores are refreshed only when their inputs change
+SCORE_PROJECTION = {
+    "id": 1, "severity": 1, "created_at": 1, "accuracy_score": 1,
+    "total_votes": 1, "nearby_reports": 1, "has_photo": 1, "image_url": 1
+}
+
+async def rescore_report(report: dict) -> dict:
+    """Store fresh scores for a report snapshot.
+    
+    The write only applies if the vote and corroboration counts still match the
+    snapshot; if they moved on, the concurrent update that moved them rescores.
+    """
+    scores = score_fields(report)
+    await db.waterlogging_reports.update_one(
+        {
+            **id_filter(report["id"]),
+            "total_votes": report.get("total_votes", 0),
+            "nearby_reports": report.get("nearby_reports", 0)
+        },
+        {"$set": scores}
+    )
+    return scores
+
+async def add_corroboration(neighbors: List[dict]):
+    """Count a new report against each nearby report and refresh their scores"""
+    if not neighbors:
+        return
+    ids = [neighbor["id"] for neighbor in neighbors]
+    await db.waterlogging_reports.update_many(ids_filter(ids), {"$inc": {"nearby_reports": 1}})
+    updates = []
+    for neighbor in neighbors:
+        neighbor["nearby_reports"] = neighbor.get("nearby_reports", 0) + 1
+        updates.append(UpdateOne(
+            {**id_filter(neighbor["id"]), "total_votes": neighbor.get("total_votes", 0),
+             "nearby_reports": neighbor["nearby_reports"]},
+            {"$set": score_fields(neighbor)}
+        ))
+    await db.waterlogging_reports.bulk_write(updates, ordered=False)
+
 # Waterlogging report routes
-@api_router.get("/reports", response_model=List[WaterloggingReport])
-async def get_waterlogging_reports(time_filter: Optional[str] = None):
-    """Get all active waterlogging reports with optional time filtering"""
-    current_time = datetime.utcnow()
+# Comment summary fields are left unset (and omitted) unless requested
+@api_router.get("/reports", response_model=List[WaterloggingReport], response_model_exclude_unset=True)
+async def get_waterlogging_reports(time_filter: Optional[str] = None, include_comment_summary: bool = False,
+                                   sort: Optional[str] = None, min_confidence: Optional[float] = None):
+    """Get all active waterlogging reports with optional time filtering and comment summaries.
     
-    # Remove expired reports
-    await db.waterlogging_reports.delete_many({"expires_at": {"$lt": current_time}})
+    sort=trust orders by decayed confidence; min_confidence (0-1) drops reports whose
+    decayed, severity-weighted confidence is below the threshold.
     
+    Concurrent identical requests share one query and one serialized response
+    (see coalescing.py); results may be up to REPORTS_CACHE_TTL_SECONDS old,
+    except that new and expired reports invalidate them immediately.
+    """
+    # Normalize so equivalent queries share a key
+    if time_filter is not None and time_filter not in ("1h", "6h", "24h"):
+        time_filter = "24h"
+    if sort != "trust":
+        sort = None
+    key = (time_filter, include_comment_summary, sort, min_confidence)
+    body = await reports_cache.get(
+        key, lambda: _load_reports(time_filter, include_comment_summary, sort, min_confidence)
+    )
+    return Response(content=body, media_type="application/json")
+
+async def _load_reports(time_filter: Optional[str], include_comment_summary: bool,
+                        sort: Optional[str], min_confidence: Optional[float]) -> bytes:
+    current_time = datetime.utcnow()
+    
+    # Expired reports are deleted by the leader's sweeper; just filter them out here
     # Build query based on time filter
     query = {"expires_at": {"$gte": current_time}}
     
@@ -127,45 +536,175 @@ async def get_waterlogging_reports(time_filter: Optional[str] = None):
             
         query["created_at"] = {"$gte": time_threshold}
     
+    if min_confidence is not None:
+        query["trust_rank"] = {"$gte": rank_threshold(min_confidence, current_time)}
+    
     # Get remaining active reports
-    reports = await db.waterlogging_reports.find(query).to_list(1000)
+    projection = None if include_comment_summary else {"comment_count": 0, "latest_comment": 0}
+    cursor = list_collection("waterlogging_reports").find(query, projection)
+    if sort == "trust":
+        cursor = cursor.sort("trust_rank", -1)
+    reports = dedupe([from_document(report, fill_defaults=True) for report in await cursor.to_list(1000)])
+    await attach_images(db.report_images, reports)
+    if include_comment_summary:
+        for report in reports:
+            # Reports created before counters existed
+            report.setdefault("comment_count", 0)
+            report.setdefault("latest_comment", None)
+    models = [WaterloggingReport(**report) for report in reports]
+    return JSONResponse(jsonable_encoder(models, exclude_unset=True)).body
+
+def report_idempotency() -> IdempotencyStore:
+    return IdempotencyStore(db.idempotency_keys, scope="reports")
+
+@api_router.get("/reports/nearby", response_model=List[WaterloggingReport], response_model_exclude_unset=True)
+async def get_nearby_reports(lat: float = Query(..., ge=-90, le=90), lng: float = Query(..., ge=-180, le=180),
+                             radius_m: float = Query(500.0, gt=0, le=5000), limit: int = Query(50, ge=1, le=200)):
+    """Get active reports within radius_m of a point, nearest first.
+    
+    Candidates come from the in-memory report index, so only the matching
+    reports are read from Mongo.
+    """
+    nearby = report_index.within_radius(lat, lng, radius_m)[:limit]
+    if not nearby:
+        return []
+    order = {report_id: rank for rank, (report_id, _) in enumerate(nearby)}
+    reports = await list_collection("waterlogging_reports").find(
+        {**ids_filter(order), "expires_at": {"$gte": datetime.utcnow()}},
+        {"comment_count": 0, "latest_comment": 0}
+    ).to_list(None)
+    reports = dedupe([from_document(report, fill_defaults=True) for report in reports])
+    await attach_images(db.report_images, reports)
+    reports.sort(key=lambda report: order[report["id"]])
     return [WaterloggingReport(**report) for report in reports]
 
 @api_router.post("/reports", response_model=WaterloggingReport)
-async def create_waterlogging_report(report: WaterloggingReportCreate):
-    """Create a new waterlogging report with optional photo"""
+async def create_waterlogging_report(report: WaterloggingReportCreate, response: Response,
+                                     idempotency_key: Optional[str] = Header(
+                                         None, alias="Idempotency-Key", max_length=MAX_KEY_LENGTH)):
+    """Create a new waterlogging report with optional photo.
+    
+    Retries carrying the same Idempotency-Key get the original report back
+    instead of creating (and uploading) a duplicate.
+    """
     # Validate severity
-    if report.severity not in ["Low", "Medium", "Severe"]:
+    if report.severity not in SEVERITY_LEVELS:
         raise HTTPException(status_code=400, detail="Severity must be Low, Medium, or Severe")
     
-    # Create report with auto-expire
-    report_data = report.dict()
+    if not idempotency_key:
+        return await _create_report(report)
+    
+    store = report_idempotency()
+    try:
+        stored = await store.begin(idempotency_key, request_fingerprint(report.dict()))
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                            headers={"Retry-After": "1"})
+    if stored is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return WaterloggingReport(**stored)
+    
+    inserted = False
+    
+    async def complete(new_report: WaterloggingReport):
+        nonlocal inserted
+        inserted = True
+        # Stored JSON-encoded so replays match the original response exactly
+        await store.complete(idempotency_key, jsonable_encoder(new_report))
+    
+    try:
+        return await _create_report(report, on_inserted=complete)
+    except BaseException:
+        # Once the report exists, a retry must not create it again
+        if not inserted:
+            await store.abandon(idempotency_key)
+        raise
+
+async def _create_report(report: WaterloggingReportCreate,
+                         on_inserted: Optional[Callable[[WaterloggingReport], Awaitable[None]]] = None
+                         ) -> WaterloggingReport:
+    """
+    Store a new report, then run its follow-ups (corroboration, stats, alerts,
+    events). on_inserted runs once the report and its photo job are stored;
+    the follow-ups are best effort, so a failure there never fails the request.
+    """
+    # Create report with auto-expire; the photo is uploaded by the image queue
+    report_data = report.dict(exclude={"image_base64"})
     
-    # Handle image upload if provided
-    image_url = None
+    new_report = WaterloggingReport(**report_data)
+    if report.image_base64:
+        new_report.has_photo = True
+        new_report.image_status = "pending"
+    
+    # Nearby active reports corroborate this one, and it corroborates them. Candidates come
+    # from the in-memory report index, so only those reports are read (by _id)
+    if report_index_ready:
+        candidates = report_index.within_radius(new_report.lat, new_report.lng, AGREEMENT_RADIUS_M)
+        spec = ids_filter(report_id for report_id, _ in candidates) if candidates else None
+    else:
+        # Startup could not seed the index: ask Mongo (2dsphere index on loc)
+        spec = near_filter(new_report.lat, new_report.lng, AGREEMENT_RADIUS_M)
+    neighbors = []
+    if spec is not None:
+        neighbors = await db.waterlogging_reports.find(
+            {**spec, "expires_at": {"$gte": new_report.created_at}}, SCORE_PROJECTION
+        ).to_list(None)
+    neighbors = dedupe([from_document(neighbor) for neighbor in neighbors])
+    new_report.nearby_reports = len(neighbors)
+    scores = score_fields(new_report.dict())
+    new_report.confidence = scores["confidence"]
+    new_report.trust_rank = scores["trust_rank"]
+    
+    # Insert into database (compact form, see report_store.py)
+    await db.waterlogging_reports.insert_one(to_document(new_report.dict()))
     if report.image_base64:
         try:
-            # Try to upload to Cloudinary
-            image_url = await upload_image_to_cloudinary(report.image_base64)
-            if image_url:
-                report_data["image_url"] = image_url
-                # Remove base64 data if successfully uploaded to cloud
-                report_data.pop("image_base64", None)
-            else:
-                # Keep base64 for display if Cloudinary upload failed
-                logger.info("Using base64 storage for image")
+            await image_queue.enqueue(report_id=new_report.id, image_base64=report.image_base64)
         except Exception as e:
-            logger.error(f"Image processing failed: {e}")
-            # Keep base64 as fallback
-            pass
+            logger.error(f"Could not queue image for report {new_report.id}: {e}")
+            new_report.image_base64 = report.image_base64
+            new_report.image_status = "failed"
+            try:
+                await image_job_dead({"report_id": new_report.id, "image_base64": report.image_base64})
+            except Exception as store_error:
+                logger.error(f"Could not store the photo of report {new_report.id} inline: {store_error}")
+    if on_inserted is not None:
+        await on_inserted(new_report)
     
-    new_report = WaterloggingReport(**report_data)
-    
-    # Insert into database
-    await db.waterlogging_reports.insert_one(new_report.dict())
+    try:
+        await add_corroboration(neighbors)
+    except Exception as e:
+        logger.error(f"Updating reports near report {new_report.id} failed: {e}")
+    try:
+        await record_stats(db.report_stats, [new_report.dict()], {"reports": 1})
+    except Exception as e:
+        logger.error(f"Updating stats for report {new_report.id} failed: {e}")
+    try:
+        await notify_subscribers(new_report)
+    except Exception as e:
+        logger.error(f"Alerting subscribers about report {new_report.id} failed: {e}")
+    try:
+        await event_bus.publish("report.created", {
+            "id": new_report.id,
+            "lat": new_report.lat,
+            "lng": new_report.lng,
+            "severity": new_report.severity,
+            "expires_at": new_report.expires_at,
+        })
+    except Exception as e:
+        logger.error(f"Publishing the creation of report {new_report.id} failed: {e}")
     
     return new_report
 
+@api_router.get("/flood-penalties")
+async def get_flood_penalties():
+    """Get the current per-edge flood penalties for route weighting"""
+    flood_index.expire()
+    snapshot = flood_index.snapshot()
+    return {"version": snapshot.version, "penalties": dict(snapshot.penalties)}
+
 # Image upload route (alternative method)
 @api_router.post("/upload-image")
 async def upload_image(file: UploadFile = File(...)):
@@ -175,7 +714,8 @@ async def upload_image(file: UploadFile = File(...)):
         image_data = await file.read()
         
         # Convert to base64 for storage/transport
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        with timed_phase("base64"):
+            image_base64 = base64.b64encode(image_data).decode('utf-8')
         image_base64_with_prefix = f"data:{file.content_type};base64,{image_base64}"
         
         # Try to upload to Cloudinary
@@ -202,18 +742,97 @@ async def upload_image(file: UploadFile = File(...)):
         logger.error(f"Image upload failed: {e}")
         raise HTTPException(status_code=400, detail=f"Image upload failed: {str(e)}")
 
+# Alert subscription routes
+# The subscription id is only returned to its creator and acts as its access token
+@api_router.post("/subscriptions", response_model=AlertSubscription)
+async def create_subscription(request: SubscriptionCreate):
+    """Watch a place or a commute for new waterlogging reports"""
+    if request.route is not None:
+        if request.lat is not None or request.lng is not None:
+            raise HTTPException(status_code=400, detail="Give either lat/lng or route, not both")
+        points = request.route
+        if len(points) < 2:
+            raise HTTPException(status_code=400, detail="A route needs at least two points")
+    elif request.lat is not None and request.lng is not None:
+        points = [[request.lat, request.lng]]
+    else:
+        raise HTTPException(status_code=400, detail="Give lat and lng for a place, or route for a commute")
+    if any(len(point) != 2 or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180) for point in points):
+        raise HTTPException(status_code=400, detail="Points must be [lat, lng] pairs")
+    if request.min_severity not in SEVERITY_LEVELS:
+        raise HTTPException(status_code=400, detail="Severity must be Low, Medium, or Severe")
+    if request.webhook_url:
+        try:
+            await resolve_webhook_url(request.webhook_url, WEBHOOK_ALLOWED_HOSTS)
+        except UnsafeWebhookURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    subscription = AlertSubscription(points=points, radius_m=request.radius_m,
+                                     min_severity=request.min_severity, webhook_url=request.webhook_url)
+    await db.alert_subscriptions.insert_one(subscription.dict())
+    await event_bus.publish("subscription.created", subscription.dict())
+    return subscription
+
+@api_router.get("/subscriptions/{subscription_id}", response_model=AlertSubscription)
+async def get_subscription(subscription_id: str):
+    """Get a subscription"""
+    subscription = await db.alert_subscriptions.find_one({"id": subscription_id})
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return AlertSubscription(**subscription)
+
+@api_router.delete("/subscriptions/{subscription_id}")
+async def delete_subscription(subscription_id: str):
+    """Stop alerts for a subscription"""
+    result = await db.alert_subscriptions.delete_one({"id": subscription_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    await event_bus.publish("subscription.deleted", {"id": subscription_id})
+    return {"message": "Subscription deleted"}
+
+@api_router.get("/subscriptions/{subscription_id}/alerts", response_model=List[Alert])
+async def get_alerts(subscription_id: str, since: Optional[datetime] = None):
+    """Get recent alerts for a subscription, newest first"""
+    if not await db.alert_subscriptions.find_one({"id": subscription_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    query = {"subscription_id": subscription_id}
+    if since is not None:
+        query["created_at"] = {"$gt": since}
+    alerts = await db.alerts.find(query).sort("created_at", -1).to_list(100)
+    return [Alert(**alert) for alert in alerts]
+
 # Comment routes
 @api_router.get("/reports/{report_id}/comments", response_model=List[Comment])
 async def get_comments(report_id: str):
     """Get all comments for a specific report"""
-    comments = await db.comments.find({"report_id": report_id}).to_list(100)
+    comments = await list_collection("comments").find({"report_id": report_id}).to_list(100)
     return [Comment(**comment) for comment in comments]
 
+@api_router.post("/comments/batch", response_model=Dict[str, List[Comment]])
+async def get_comments_batch(request: CommentBatchRequest):
+    """Get comments for many reports in one round-trip, keyed by report ID"""
+    report_ids = list(dict.fromkeys(request.report_ids))
+    grouped: Dict[str, List[Comment]] = {report_id: [] for report_id in report_ids}
+    if not report_ids:
+        return grouped
+    
+    # The limit is applied in Mongo so only limit_per_report comments per report come back;
+    # the (report_id, created_at) index serves the match and sort
+    pipeline = [
+        {"$match": {"report_id": {"$in": report_ids}}},
+        {"$sort": {"report_id": 1, "created_at": 1}},
+        {"$group": {"_id": "$report_id", "comments": {"$push": "$$ROOT"}}},
+        {"$project": {"comments": {"$slice": ["$comments", request.limit_per_report]}}},
+    ]
+    async for group in list_collection("comments").aggregate(pipeline):
+        grouped[group["_id"]] = [Comment(**comment) for comment in group["comments"]]
+    return grouped
+
 @api_router.post("/reports/{report_id}/comments", response_model=Comment)
 async def create_comment(report_id: str, comment: CommentCreate):
     """Add a new comment to a specific report"""
     # Verify the report exists
-    existing_report = await db.waterlogging_reports.find_one({"id": report_id})
+    existing_report = await db.waterlogging_reports.find_one(id_filter(report_id), {"_id": 1})
     if not existing_report:
         raise HTTPException(status_code=404, detail="Report not found")
     
@@ -225,34 +844,83 @@ async def create_comment(report_id: str, comment: CommentCreate):
     # Insert into database
     await db.comments.insert_one(new_comment.dict())
     
+    # Keep the report's denormalized comment summary in step
+    latest = CommentSummary(
+        author=new_comment.author,
+        text=new_comment.text[:COMMENT_SNIPPET_LENGTH],
+        created_at=new_comment.created_at
+    )
+    await db.waterlogging_reports.update_one(
+        id_filter(report_id),
+        {"$inc": {"comment_count": 1}, "$set": {"latest_comment": latest.dict()}}
+    )
+    
     return new_comment
 
+# Statistics route
+STATS_MAX_RANGE = timedelta(days=31)
+
+@api_router.get("/stats", response_model=ReportStats)
+async def get_report_stats(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           area: Optional[str] = None,
+                           precision: int = Query(STATS_PRECISION, ge=1, le=STATS_PRECISION)):
+    """Hourly report counts by area and severity (default: the last 24 hours).
+    
+    area is a geohash prefix (1-5 characters); precision coarsens areas to
+    that many geohash characters. Votes and expiries count against the hour
+    the report was created in. Served from rollups in report_stats.py.
+    """
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    # Timestamps are stored as naive UTC
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > STATS_MAX_RANGE:
+        raise HTTPException(status_code=400, detail="Range is limited to 31 days")
+    if area is not None and not valid_area(area):
+        raise HTTPException(status_code=400, detail="area must be a geohash prefix of 1-5 characters")
+    
+    buckets = await query_stats(db.report_stats, start, end, area, precision)
+    return ReportStats(start=start, end=end, precision=precision,
+                       buckets=[StatsBucket(**bucket) for bucket in buckets])
+
 # Voting routes
 @api_router.post("/reports/{report_id}/vote")
 async def vote_on_report(report_id: str, vote: VoteRequest):
     """Vote on report accuracy"""
-    # Verify the report exists
-    report = await db.waterlogging_reports.find_one({"id": report_id})
-    if not report:
-        raise HTTPException(status_code=404, detail="Report not found")
-    
-    # Update vote counts
     if vote.vote_type == "up":
-        await db.waterlogging_reports.update_one(
-            {"id": report_id},
-            {"$inc": {"accuracy_score": 1, "total_votes": 1}}
-        )
+        increment = {"accuracy_score": 1, "total_votes": 1}
     elif vote.vote_type == "down":
-        await db.waterlogging_reports.update_one(
-            {"id": report_id},
-            {"$inc": {"accuracy_score": -1, "total_votes": 1}}
-        )
+        increment = {"accuracy_score": -1, "total_votes": 1}
     else:
         raise HTTPException(status_code=400, detail="Vote type must be 'up' or 'down'")
     
-    # Return updated report
-    updated_report = await db.waterlogging_reports.find_one({"id": report_id})
-    return {"message": "Vote recorded", "accuracy_score": updated_report["accuracy_score"], "total_votes": updated_report["total_votes"]}
+    # Update vote counts and read back the result in one round-trip
+    updated_report = await db.waterlogging_reports.find_one_and_update(
+        id_filter(report_id),
+        {"$inc": increment},
+        projection={**SCORE_PROJECTION, **STATS_PROJECTION},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    updated_report = from_document(updated_report)
+    
+    try:
+        await record_stats(db.report_stats, [updated_report], {f"{vote.vote_type}votes": 1})
+    except Exception as e:
+        logger.error(f"Updating stats for report {report_id} failed: {e}")
+    scores = await rescore_report(updated_report)
+    return {
+        "message": "Vote recorded",
+        "accuracy_score": updated_report["accuracy_score"],
+        "total_votes": updated_report["total_votes"],
+        "confidence": scores["confidence"]
+    }
 
 # Original status check routes
 @api_router.get("/")
@@ -268,44 +936,268 @@ async def create_status_check(input: StatusCheckCreate):
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+    status_checks = await list_collection("status_checks").find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
-# Include the router in the main app
-app.include_router(api_router)
+# Health probes
+@api_router.get("/health")
+async def liveness():
+    """Liveness probe - the process is up and serving"""
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    """Readiness probe - reports degraded when Mongo is unreachable or the pool is saturated"""
+    database = {"reachable": True}
+    ping_start = time.perf_counter()
+    try:
+        timeout = get_mongo_settings().server_selection_timeout_ms / 1000
+        await asyncio.wait_for(db.command("ping"), timeout=timeout)
+        database["ping_ms"] = round((time.perf_counter() - ping_start) * 1000, 3)
+    except Exception as e:
+        database = {"reachable": False, "error": str(e) or type(e).__name__}
+    
+    status = "ok" if database["reachable"] and not pool_monitor.saturated else "degraded"
+    return JSONResponse(
+        status_code=200 if status == "ok" else 503,
+        content={"status": status, "database": database, "pool": pool_monitor.stats(),
+                 "jobs": jsonable_encoder(scheduler.stats())}
+    )
+
+# Prometheus scrape endpoint (outside /api so it is not exposed through the API ingress)
+async def metrics():
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)        
+# Debug endpoints (outside /api, like /metrics); they answer 404 unless ADMIN_TOKEN is set
+DEBUG_PATHS = ("/debug/profile", "/debug/slow-requests")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+def require_admin(authorization: Optional[str] = Header(None)):
+    """Requires `Authorization: Bearer <ADMIN_TOKEN>`"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Admin token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+async def debug_profile(seconds: float = Query(10.0, gt=0, le=60),
+                        interval_ms: float = Query(5.0, ge=1, le=100),
+                        idle: bool = False,
+                        _: None = Depends(require_admin)):
+    """Sample this worker for `seconds` and return collapsed stacks for a flamegraph"""
+    try:
+        profiler = await profile(seconds, interval_ms / 1000, include_idle=idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=profiler.collapsed(), media_type="text/plain",
+                    headers={"X-Profile-Samples": str(profiler.samples)})
+
+async def debug_slow_requests(_: None = Depends(require_admin)):
+    """Recent requests over SLOW_REQUEST_SECONDS on this worker, newest first"""
+    return list(reversed(recent_slow_requests))
+
+async def database_unavailable(request, exc):
+    """Degraded mode: fail fast with 503 when Mongo is unreachable or the pool is exhausted"""
+    logger.error(f"Database unavailable: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": "5"}
+    )
+
+async def load_report_indexes():
+    """Load the road graph (if configured) and seed the in-memory indexes from active reports and subscriptions"""
+    graph_path = os.environ.get('ROAD_GRAPH_PATH')
+    if graph_path:
+        # Expected format: [{"id": "edge-1", "coords": [[lat, lng], [lat, lng], ...]}, ...]
+        with open(graph_path) as f:
+            flood_index.add_edges((edge["id"], edge["coords"]) for edge in json.load(f))
+        logger.info(f"Loaded road graph with {flood_index.edge_count} edges")
+    
+    current_time = datetime.utcnow()
+    cursor = db.waterlogging_reports.find(
+        {"expires_at": {"$gte": current_time}},
+        {"id": 1, "loc": 1, "lat": 1, "lng": 1, "severity": 1, "expires_at": 1}
+    )
+    async for report in cursor:
+        report = from_document(report)
+        flood_index.add_report(report["id"], report["lat"], report["lng"],
+                               report.get("severity", "Medium"), report.get("expires_at"))
+        report_index.insert(report["id"], report["lat"], report["lng"], report.get("expires_at"))
+    
+    async for subscription in db.alert_subscriptions.find({}, {"_id": 0}):
+        subscription_index.add(Subscription.from_document(subscription))
+
+async def ensure_report_ttl_index():
+    try:
+        await db.waterlogging_reports.create_index("expires_at", expireAfterSeconds=REPORT_TTL_GRACE)
+    except OperationFailure as e:
+        if e.code != 85:  # IndexOptionsConflict: the index predates the grace period
+            raise
+        try:
+            await db.command("collMod", "waterlogging_reports",
+                             index={"keyPattern": {"expires_at": 1}, "expireAfterSeconds": REPORT_TTL_GRACE})
+        except OperationFailure as e:
+            if e.code != 13:  # Unauthorized: collMod usually needs dbAdmin
+                raise
+            logger.warning(
+                f"Could not set the {REPORT_TTL_GRACE}s grace period on the waterlogging_reports TTL "
+                f"index (collMod not permitted); reports deleted by TTL before the expiry sweep runs "
+                f"are missing from /api/stats. Apply it as a database admin: db.runCommand({{collMod: "
+                f"'waterlogging_reports', index: {{keyPattern: {{expires_at: 1}}, "
+                f"expireAfterSeconds: {REPORT_TTL_GRACE}}}}})"
+            )
+
+# Shared rate-limit counters, set by create_app when RATE_LIMIT_BACKEND=mongo
+rate_limit_backend = None
 
-@app.on_event("startup")
 async def startup_db():
-    """Create TTL index for auto-expiring reports"""
+    """Create indexes, seed the in-memory indexes and start the background workers"""
+    global report_index_ready
+    # Index creation is best effort: a worker without Mongo still serves degraded (503) responses
     try:
         # Create TTL index on expires_at field for automatic document deletion
-        await db.waterlogging_reports.create_index("expires_at", expireAfterSeconds=0)
+        await ensure_report_ttl_index()
         logger.info("Created TTL index for waterlogging reports")
         
-        # Log Cloudinary configuration status
-        if (os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo') == 'demo'):
-            logger.warning("🔑 Cloudinary not configured - add credentials to .env for photo uploads")
-        else:
-            logger.info("✅ Cloudinary configured - photo uploads enabled")
-            
-    except Exception as e:
-        logger.error(f"Error in startup: {e}")
+        # Per-report comment lookups and the batch endpoint filter on report_id, oldest first
+        await db.comments.create_index([("report_id", 1), ("created_at", 1)])
+        # Trust-sorted and thresholded report lists
+        await db.waterlogging_reports.create_index([("trust_rank", -1)])
+        # Legacy documents (string id) until the migration job has converted them
+        await db.waterlogging_reports.create_index("id", sparse=True)
+        # Location queries on compact documents (near_filter)
+        await db.waterlogging_reports.create_index([("loc", "2dsphere")])
+        await db.report_images.create_index("expires_at", expireAfterSeconds=0)
+        # Idempotency keys for report creation expire after a day
+        await report_idempotency().ensure_indexes()
+        await image_queue.ensure_indexes()
+        await webhook_queue.ensure_indexes()
+        await db.alert_subscriptions.create_index("id", unique=True)
+        # Alerts are kept for a day
+        await db.alerts.create_index([("subscription_id", 1), ("created_at", -1)])
+        await db.alerts.create_index("created_at", expireAfterSeconds=86400)
+        # Stats queries scan an hour range, optionally by area prefix
+        await db.report_stats.create_index([("hour", 1), ("area", 1)])
+        
+        if rate_limit_backend is not None:
+            await rate_limit_backend.ensure_indexes()
+    except Exception:
+        logger.exception("Creating indexes failed; continuing without them")
+    
+    # Not guarded: a worker without its sweeper, photo or webhook workers must fail to start.
+    # The event bus starts before seeding so events published meanwhile are not lost
+    await event_bus.start()
+    
+    report_index_ready = False
+    try:
+        await load_report_indexes()
+        report_index_ready = True
+    except Exception:
+        logger.exception("Loading the road graph or active reports failed; flood penalties and "
+                         "nearby lookups start empty until new reports arrive, and corroboration "
+                         "queries Mongo directly")
+    
+    await scheduler.start()
+    await image_queue.start()
+    await webhook_queue.start()
+    
+    # Log Cloudinary configuration status
+    if (os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo') == 'demo'):
+        logger.warning("🔑 Cloudinary not configured - add credentials to .env for photo uploads")
+    else:
+        logger.info("✅ Cloudinary configured - photo uploads enabled")
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await image_queue.stop()
+    await webhook_queue.stop()
+    if _webhook_client is not None:
+        await _webhook_client.aclose()
+    await scheduler.stop()
+    await event_bus.stop()
+    if _mongo_client is not None:
+        _mongo_client.close()
+
+def create_app() -> FastAPI:
+    """
+    App factory: `uvicorn server:create_app --factory`.
+    
+    Building the app does not connect to Mongo or import Cloudinary; both are
+    initialised by the first request (or startup hook) that needs them.
+    """
+    global rate_limit_backend, event_bus, scheduler, image_queue, webhook_queue, reports_cache
+    load_env()
+    load_settings()
+    
+    if os.environ.get('WORKER_COORDINATION', 'local') == 'mongo':
+        event_bus = MongoEventBus(db.worker_events)
+        sweeper_lease = MongoLease(db.leases, "expiry-sweeper",
+                                   ttl=timedelta(seconds=3 * EXPIRY_SWEEP_INTERVAL),
+                                   worker_id=event_bus.worker_id)
+    else:
+        event_bus = LocalEventBus()
+        sweeper_lease = LocalLease("expiry-sweeper", event_bus.worker_id)
+    event_bus.subscribe("report.created", _on_report_created)
+    event_bus.subscribe("reports.expired", _on_reports_expired)
+    event_bus.subscribe("report.created", _invalidate_report_lists)
+    event_bus.subscribe("reports.expired", _invalidate_report_lists)
+    event_bus.subscribe("subscription.created", _on_subscription_created)
+    event_bus.subscribe("subscription.deleted", _on_subscription_deleted)
+    
+    reports_cache = SingleFlightCache("reports", ttl=REPORTS_CACHE_TTL)
+    scheduler = Scheduler()
+    # Cluster-wide: only the lease holder deletes expired reports
+    scheduler.register("expiry-sweep", sweep_expired_reports, EXPIRY_SWEEP_INTERVAL,
+                       timeout=EXPIRY_SWEEP_INTERVAL, lease=sweeper_lease)
+    # Cluster-wide and resumable: converts legacy report documents batch by batch
+    scheduler.register("report-migration", migrate_reports, EXPIRY_SWEEP_INTERVAL, lease=sweeper_lease)
+    # Per worker: drop expired reports from this process's in-memory indexes
+    scheduler.register("local-index-expiry", expire_local_indexes, 30.0, timeout=10.0)
+    
+    image_queue = JobQueue(db, "image_jobs", process_report_image, workers=IMAGE_WORKERS,
+                           max_attempts=IMAGE_JOB_MAX_ATTEMPTS, on_dead=image_job_dead,
+                           # image_job_dead keeps the photo in report_images
+                           dead_unset=("image_base64",))
+    webhook_queue = JobQueue(db, "webhook_jobs", deliver_webhook, workers=WEBHOOK_WORKERS,
+                             max_attempts=WEBHOOK_MAX_ATTEMPTS)
+    
+    # Create the main app without a prefix
+    application = FastAPI()
+    application.add_api_route("/metrics", metrics, include_in_schema=False)
+    application.add_api_route("/debug/profile", debug_profile, include_in_schema=False)
+    application.add_api_route("/debug/slow-requests", debug_slow_requests, include_in_schema=False)
+    
+    # Include the router in the main app
+    application.include_router(api_router)
+    application.add_exception_handler(ConnectionFailure, database_unavailable)
+    
+    # Per-client budgets and load shedding; RATE_LIMIT_BACKEND=mongo shares counters across workers
+    if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+        rate_limit_backend = MongoRateLimitBackend(db.rate_limits)
+    
+    # Inside CORS so browsers can read 429/503 responses
+    application.add_middleware(RateLimitMiddleware, backend=rate_limit_backend)
+    
+    application.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Outermost so latency includes CORS handling
+    application.add_middleware(MetricsMiddleware, exclude_paths=("/metrics",) + DEBUG_PATHS,
+                               slow_request_seconds=SLOW_REQUEST_SECONDS if SLOW_REQUEST_SECONDS > 0 else None)
+    
+    application.add_event_handler("startup", startup_db)
+    application.add_event_handler("shutdown", shutdown_db_client)
+    return application
+
+def __getattr__(name):
+    # `uvicorn server:app` keeps working: the app is built on first access
+    if name == "app":
+        application = create_app()
+        globals()["app"] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,248 @@
+"""
+Geohash-bucketed in-memory spatial index for active reports.
+
+Points are sharded into geohash cells (precision 6 is ~1.2km x 0.6km). Each
+cell keeps its ids in a list and its coordinates in a packed array('d'), and
+a global id -> (cell, slot) map gives O(1) insert and swap-remove. A radius
+or bbox query visits only the cells covering the query box, so its cost is
+the number of covering cells plus the candidates in them, independent of the
+total number of points. Expiry uses a heap, as in flood_index.py.
+
+The geohash helpers are shared with the subscription index and the stats
+rollups.
+"""
+
+import heapq
+import math
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+DEFAULT_PRECISION = 6
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lng, max_lat, max_lng
+
+
+def geohash_encode(lat: float, lng: float, precision: int = DEFAULT_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = value * 2 + 1
+                lng_lo = mid
+            else:
+                value = value * 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value * 2 + 1
+                lat_lo = mid
+            else:
+                value = value * 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat, lng) extent in degrees of a cell at this precision"""
+    total = 5 * precision
+    lng_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_bounds(geohash: str) -> BBox:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def geohash_cover(bbox: BBox, precision: int = DEFAULT_PRECISION) -> Iterator[str]:
+    """Geohash cells at this precision that intersect the box"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    dlat, dlng = geohash_cell_size(precision)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0 - 1e-9)
+    for i in range(math.floor((min_lat + 90.0) / dlat), math.floor((max_lat + 90.0) / dlat) + 1):
+        lat = -90.0 + (i + 0.5) * dlat
+        for j in range(math.floor((min_lng + 180.0) / dlng), math.floor((max_lng + 180.0) / dlng) + 1):
+            yield geohash_encode(lat, -180.0 + (j + 0.5) * dlng, precision)
+
+
+def geohash_cover_count(bbox: BBox, precision: int = DEFAULT_PRECISION) -> int:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    dlat, dlng = geohash_cell_size(precision)
+    rows = math.floor((max_lat + 90.0) / dlat) - math.floor((min_lat + 90.0) / dlat) + 1
+    cols = math.floor((max_lng + 180.0) / dlng) - math.floor((min_lng + 180.0) / dlng) + 1
+    return rows * cols
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat: float, lng: float, radius_m: float) -> BBox:
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def _overlaps(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class _Bucket:
+    __slots__ = ("ids", "coords")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.coords = array("d")  # lat0, lng0, lat1, lng1, ...
+
+
+class GeoHashIndex:
+    """Point index with insert, remove, expiry, bbox and radius queries"""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        self.precision = precision
+        self._buckets: Dict[str, _Bucket] = {}
+        self._where: Dict[str, Tuple[str, int]] = {}
+        self._expires: Dict[str, datetime] = {}
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, point_id: str) -> bool:
+        return point_id in self._where
+
+    @property
+    def bucket_count(self) -> int:
+        return len(self._buckets)
+
+    def insert(self, point_id: str, lat: float, lng: float, expires_at: Optional[datetime] = None) -> None:
+        if point_id in self._where:
+            self.remove(point_id)
+        cell = geohash_encode(lat, lng, self.precision)
+        bucket = self._buckets.get(cell)
+        if bucket is None:
+            bucket = self._buckets[cell] = _Bucket()
+        self._where[point_id] = (cell, len(bucket.ids))
+        bucket.ids.append(point_id)
+        bucket.coords.append(lat)
+        bucket.coords.append(lng)
+        if expires_at is not None:
+            self._expires[point_id] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, point_id))
+
+    def remove(self, point_id: str) -> bool:
+        location = self._where.pop(point_id, None)
+        if location is None:
+            return False
+        self._expires.pop(point_id, None)
+        cell, slot = location
+        bucket = self._buckets[cell]
+        last = len(bucket.ids) - 1
+        if slot != last:
+            # Swap the last point into the freed slot
+            moved = bucket.ids[last]
+            bucket.ids[slot] = moved
+            bucket.coords[2 * slot] = bucket.coords[2 * last]
+            bucket.coords[2 * slot + 1] = bucket.coords[2 * last + 1]
+            self._where[moved] = (cell, slot)
+        bucket.ids.pop()
+        del bucket.coords[2 * last:]
+        if not bucket.ids:
+            del self._buckets[cell]
+        return True
+
+    def expire(self, now: Optional[datetime] = None) -> List[str]:
+        """Remove points whose expiry has passed; returns their ids"""
+        now = now or datetime.utcnow()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, point_id = heapq.heappop(self._expiry_heap)
+            # Skip heap entries left behind by removals and re-inserts
+            if self._expires.get(point_id) == expires_at:
+                self.remove(point_id)
+                expired.append(point_id)
+        return expired
+
+    def _buckets_for(self, bbox: BBox) -> Iterator[_Bucket]:
+        if geohash_cover_count(bbox, self.precision) <= len(self._buckets):
+            for cell in geohash_cover(bbox, self.precision):
+                bucket = self._buckets.get(cell)
+                if bucket is not None:
+                    yield bucket
+        else:
+            # Query box spans more cells than are occupied; walk the occupied ones
+            for cell, bucket in self._buckets.items():
+                if _overlaps(geohash_bounds(cell), bbox):
+                    yield bucket
+
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[str]:
+        bbox = (min_lat, min_lng, max_lat, max_lng)
+        found = []
+        for bucket in self._buckets_for(bbox):
+            coords = bucket.coords
+            for slot, point_id in enumerate(bucket.ids):
+                lat, lng = coords[2 * slot], coords[2 * slot + 1]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    found.append(point_id)
+        return found
+
+    def within_radius(self, lat: float, lng: float, radius_m: float) -> List[Tuple[str, float]]:
+        """(id, distance in metres) of points within radius_m, nearest first"""
+        found = []
+        for bucket in self._buckets_for(radius_bbox(lat, lng, radius_m)):
+            coords = bucket.coords
+            for slot, point_id in enumerate(bucket.ids):
+                distance = haversine_m(lat, lng, coords[2 * slot], coords[2 * slot + 1])
+                if distance <= radius_m:
+                    found.append((point_id, distance))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def position(self, point_id: str) -> Optional[Tuple[float, float]]:
+        location = self._where.get(point_id)
+        if location is None:
+            return None
+        cell, slot = location
+        coords = self._buckets[cell].coords
+        return coords[2 * slot], coords[2 * slot + 1]
@@ -0,0 +1,105 @@
+"""
+Proximity alert subscriptions.
+
+A subscription watches a place (a point and radius) or a commute (a polyline
+and a corridor width). SubscriptionIndex is an inverted spatial index: each
+subscription is registered under every geohash cell its area touches, so a
+new report only looks at the subscriptions in its own cell and checks their
+exact shapes. Matching costs O(subscriptions in that cell), not O(all
+subscriptions).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from flood_index import point_segment_distance_m
+from scoring import SEVERITY_LEVELS
+from spatial_index import geohash_cover, geohash_encode, haversine_m, radius_bbox
+
+# Cells are ~1.2km x 0.6km: a 500m home radius touches a handful
+SUBSCRIPTION_PRECISION = 6
+
+Point = Tuple[float, float]
+
+
+@dataclass(frozen=True)
+class Subscription:
+    id: str
+    points: Tuple[Point, ...]  # One point for a place, two or more for a commute
+    radius_m: float
+    min_severity: str = "Low"
+    webhook_url: Optional[str] = None
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "Subscription":
+        return cls(
+            id=doc["id"],
+            points=tuple((float(lat), float(lng)) for lat, lng in doc["points"]),
+            radius_m=float(doc["radius_m"]),
+            min_severity=doc.get("min_severity", "Low"),
+            webhook_url=doc.get("webhook_url"),
+        )
+
+    def distance_m(self, lat: float, lng: float) -> float:
+        if len(self.points) == 1:
+            return haversine_m(lat, lng, *self.points[0])
+        return min(point_segment_distance_m((lat, lng), a, b) for a, b in zip(self.points, self.points[1:]))
+
+    def accepts(self, severity: str) -> bool:
+        return SEVERITY_LEVELS.index(severity) >= SEVERITY_LEVELS.index(self.min_severity)
+
+
+class SubscriptionIndex:
+    def __init__(self, precision: int = SUBSCRIPTION_PRECISION):
+        self.precision = precision
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._cells: Dict[str, Set[str]] = {}
+        self._cells_by_subscription: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def __contains__(self, subscription_id: str) -> bool:
+        return subscription_id in self._subscriptions
+
+    def _cover(self, subscription: Subscription) -> Set[str]:
+        cells = set()
+        points = subscription.points
+        # A place covers its radius; each commute segment covers its box grown by the corridor
+        segments = zip(points, points[1:]) if len(points) > 1 else [(points[0], points[0])]
+        for a, b in segments:
+            lo = radius_bbox(min(a[0], b[0]), min(a[1], b[1]), subscription.radius_m)
+            hi = radius_bbox(max(a[0], b[0]), max(a[1], b[1]), subscription.radius_m)
+            cells.update(geohash_cover((lo[0], lo[1], hi[2], hi[3]), self.precision))
+        return cells
+
+    def add(self, subscription: Subscription) -> None:
+        if subscription.id in self._subscriptions:
+            self.remove(subscription.id)
+        cells = self._cover(subscription)
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(subscription.id)
+        self._subscriptions[subscription.id] = subscription
+        self._cells_by_subscription[subscription.id] = tuple(cells)
+
+    def remove(self, subscription_id: str) -> bool:
+        if self._subscriptions.pop(subscription_id, None) is None:
+            return False
+        for cell in self._cells_by_subscription.pop(subscription_id):
+            members = self._cells[cell]
+            members.discard(subscription_id)
+            if not members:
+                del self._cells[cell]
+        return True
+
+    def match(self, lat: float, lng: float, severity: str) -> List[Tuple[Subscription, float]]:
+        """Subscriptions whose area contains the point, with the distance to it"""
+        matches = []
+        for subscription_id in self._cells.get(geohash_encode(lat, lng, self.precision), ()):
+            subscription = self._subscriptions[subscription_id]
+            if not subscription.accepts(severity):
+                continue
+            distance = subscription.distance_m(lat, lng)
+            if distance <= subscription.radius_m:
+                matches.append((subscription, distance))
+        return matches
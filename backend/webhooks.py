@@ -0,0 +1,80 @@
+"""
+Outbound webhook URL checks.
+
+Anyone can create an alert subscription, so a webhook URL must not make the
+server send requests into its own network (SSRF). resolve_webhook_url()
+accepts only http(s) URLs whose host resolves exclusively to public
+addresses, optionally restricted to an allowlist of hosts. It runs when the
+subscription is created and again before every delivery, and delivery
+connects to the address that was checked (the returned WebhookTarget), so a
+DNS answer that changes in between (rebinding) cannot redirect the request.
+Redirects are never followed.
+"""
+
+import asyncio
+import ipaddress
+import socket
+from dataclasses import dataclass
+from typing import List, Sequence
+from urllib.parse import urlsplit, urlunsplit
+
+
+class UnsafeWebhookURL(ValueError):
+    """The URL is malformed, not allowed or points at a non-public address"""
+
+
+@dataclass(frozen=True)
+class WebhookTarget:
+    url: str  # Host replaced by the checked address
+    host_header: str
+    server_name: str  # For TLS SNI and certificate verification
+
+
+async def resolve_host(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def host_allowed(host: str, allowed_hosts: Sequence[str]) -> bool:
+    """An empty allowlist allows every host; entries also allow their subdomains"""
+    return not allowed_hosts or any(host == allowed or host.endswith("." + allowed) for allowed in allowed_hosts)
+
+
+async def resolve_webhook_url(url: str, allowed_hosts: Sequence[str] = ()) -> WebhookTarget:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeWebhookURL("webhook_url must be an http(s) URL")
+    if parts.username is not None or parts.password is not None:
+        raise UnsafeWebhookURL("webhook_url must not contain credentials")
+    host = parts.hostname.lower()
+    if not host_allowed(host, allowed_hosts):
+        raise UnsafeWebhookURL(f"Webhooks to {host} are not allowed")
+    try:
+        port = parts.port
+    except ValueError:
+        raise UnsafeWebhookURL("webhook_url has an invalid port")
+
+    try:
+        addresses = await resolve_host(host, port or (443 if parts.scheme == "https" else 80))
+    except (OSError, UnicodeError):
+        raise UnsafeWebhookURL(f"Could not resolve {host}")
+    # Every address must be public, or a second lookup could pick a private one
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise UnsafeWebhookURL("webhook_url must resolve to public addresses only")
+
+    address = addresses[0]
+    netloc = f"[{address}]" if ":" in address else address
+    if port is not None:
+        netloc += f":{port}"
+    return WebhookTarget(
+        url=urlunsplit((parts.scheme, netloc, parts.path, parts.query, "")),
+        host_header=parts.netloc,
+        server_name=host,
+    )
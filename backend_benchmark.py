@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Load-testing benchmark for the AquaRoute backend.
+
+Boots the FastAPI app in-process (httpx ASGI transport) against either
+mongomock-motor or a local mongod, replays monsoon-style traffic with asyncio
+concurrency and reports RPS and p50/p95/p99 latency per route. Results can be
+saved as a baseline and later runs compared against it.
+
+    python backend_benchmark.py                         # mongomock, default load
+    python backend_benchmark.py --mongo-url mongodb://localhost:27017
+    python backend_benchmark.py --save-baseline         # record benchmark_baseline.json
+    python backend_benchmark.py --compare               # fail on p95 regressions
+
+Each run also measures cold start (import of server.py to the first response)
+in fresh interpreters; see --startup-runs.
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+DEFAULT_BASELINE = ROOT_DIR / "benchmark_baseline.json"
+
+# Mumbai bounding box for generated reports
+LAT_RANGE = (18.90, 19.25)
+LNG_RANGE = (72.78, 72.98)
+
+
+def boot_app(mongo_url=None, db_name="aquaroute_benchmark"):
+    """Import the app with a local database and Cloudinary disabled"""
+    os.environ["MONGO_URL"] = mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = db_name
+    # Never hit the real Cloudinary account from a benchmark
+    for key in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+        os.environ[key] = "demo"
+    # All simulated clients share one peer address; measure the app, not the limiter
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    # Per-request client logging would dominate the benchmark's own timings
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if mongo_url is None:
+        from mongomock_motor import AsyncMongoMockClient
+        server.db = AsyncMongoMockClient()[db_name]
+    return server
+
+
+# Runs in a fresh interpreter: time from importing server.py to the first response
+STARTUP_PROBE = r"""
+import asyncio, sys, time
+import httpx
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import server
+
+async def first_response():
+    transport = httpx.ASGITransport(app=server.create_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        response = await client.get("/api/")
+    assert response.status_code == 200, response.status_code
+
+asyncio.run(first_response())
+print(time.perf_counter() - start)
+"""
+
+
+def measure_cold_start(runs):
+    """Import-to-first-response time over several fresh processes"""
+    env = dict(os.environ)
+    env.update({"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "aquaroute_benchmark"})
+    timings, errors = [], 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE, str(BACKEND_DIR)],
+            env=env, capture_output=True, text=True,
+        )
+        if output.returncode != 0:
+            errors += 1
+            continue
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    timings.sort()
+    # No RPS: the runs are sequential process launches, not served requests
+    return {
+        "runs": len(timings),
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3) if timings else 0.0,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def make_image_base64(size=(640, 480)):
+    """Small generated JPEG, shaped like a phone photo after client-side resize"""
+    from PIL import Image
+
+    image = Image.new("RGB", size, (40, 90, 160))
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=70)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def random_report(image=None):
+    report = {
+        "lat": random.uniform(*LAT_RANGE),
+        "lng": random.uniform(*LNG_RANGE),
+        "severity": random.choice(["Low", "Medium", "Medium", "Severe"]),
+    }
+    if image:
+        report["image_base64"] = image
+    return report
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[route] += 1
+            return None
+        self.samples[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def summary(self, wall_seconds):
+        results = {}
+        for route, values in sorted(self.samples.items()):
+            values.sort()
+            results[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+            }
+        return results
+
+
+# Traffic scenarios
+
+async def polling_clients(client, rec, clients, rounds, poll_interval):
+    """Each map client polls the 24h report list on the 30-second cycle"""
+    async def one_client():
+        # Spread clients across the poll window like real browsers
+        await asyncio.sleep(random.uniform(0, poll_interval))
+        for _ in range(rounds):
+            await rec.call(client, "GET /api/reports", "GET", "/api/reports",
+                           params={"time_filter": "24h"})
+            await asyncio.sleep(poll_interval)
+
+    await asyncio.gather(*(one_client() for _ in range(clients)))
+
+
+async def report_burst(client, rec, count, report_ids):
+    """Many users pin flooding at once when a downpour starts"""
+    async def create():
+        response = await rec.call(client, "POST /api/reports", "POST", "/api/reports",
+                                  json=random_report())
+        if response is not None and response.status_code == 200:
+            report_ids.append(response.json()["id"])
+
+    await asyncio.gather(*(create() for _ in range(count)))
+
+
+async def vote_storm(client, rec, count, report_ids, hot_reports=5):
+    """Votes concentrate on a handful of highly visible reports"""
+    if not report_ids:
+        return
+    targets = report_ids[:hot_reports]
+
+    async def vote():
+        report_id = random.choice(targets)
+        await rec.call(client, "POST /api/reports/{id}/vote", "POST",
+                       f"/api/reports/{report_id}/vote",
+                       json={"vote_type": random.choice(["up", "up", "down"])})
+
+    await asyncio.gather(*(vote() for _ in range(count)))
+
+
+async def comment_wave(client, rec, count, report_ids):
+    if not report_ids:
+        return
+
+    async def comment():
+        report_id = random.choice(report_ids)
+        await rec.call(client, "POST /api/reports/{id}/comments", "POST",
+                       f"/api/reports/{report_id}/comments",
+                       json={"text": "Knee-deep near the signal", "author": "bench"})
+        await rec.call(client, "GET /api/reports/{id}/comments", "GET",
+                       f"/api/reports/{report_id}/comments")
+
+    await asyncio.gather(*(comment() for _ in range(count)))
+
+
+async def image_uploads(client, rec, count, image):
+    """Photo reports, both inline base64 and multipart upload"""
+    raw = base64.b64decode(image.split(",", 1)[1])
+
+    async def inline():
+        await rec.call(client, "POST /api/reports (photo)", "POST", "/api/reports",
+                       json=random_report(image))
+
+    async def multipart():
+        await rec.call(client, "POST /api/upload-image", "POST", "/api/upload-image",
+                       files={"file": ("flood.jpg", raw, "image/jpeg")})
+
+    await asyncio.gather(*(inline() for _ in range(count)),
+                         *(multipart() for _ in range(count)))
+
+
+async def run_benchmark(args):
+    import httpx
+
+    server = boot_app(args.mongo_url)
+    if args.mongo_url:
+        # Start from an empty database so earlier runs don't skew the results
+        await server.db.client.drop_database(server.db.name)
+    # create_app wires the event bus, scheduler and queues that startup starts
+    app = server.create_app()
+    await server.startup_db()
+
+    rec = Recorder()
+    report_ids = []
+    image = make_image_base64()
+    poll_interval = 30.0 * args.time_scale
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                 limits=limits, timeout=60.0) as client:
+        # Seed an initial set of active reports so polling has data to return
+        await report_burst(client, Recorder(), args.seed_reports, report_ids)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            polling_clients(client, rec, args.clients, args.rounds, poll_interval),
+            report_burst(client, rec, args.burst, report_ids),
+            vote_storm(client, rec, args.votes, report_ids),
+            comment_wave(client, rec, args.comments, report_ids),
+            image_uploads(client, rec, args.uploads, image),
+        )
+        wall = time.perf_counter() - start
+
+    if args.mongo_url:
+        await server.db.client.drop_database(server.db.name)
+    await server.shutdown_db_client()
+
+    # Startup runs happen after the timed window so they don't skew per-route RPS
+    results = {"wall_seconds": round(wall, 3), "routes": rec.summary(wall)}
+    if args.startup_runs:
+        results["cold_start"] = measure_cold_start(args.startup_runs)
+    return results
+
+
+def print_results(results, baseline=None):
+    header = f"{'route':34} {'reqs':>6} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for route, stats in results["routes"].items():
+        line = (f"{route:34} {stats['requests']:>6} {stats['errors']:>4} {stats['rps']:>9.1f} "
+                f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+        if baseline and route in baseline["routes"]:
+            base_p95 = baseline["routes"][route]["p95_ms"]
+            if base_p95:
+                line += f"   p95 {((stats['p95_ms'] - base_p95) / base_p95) * 100:+.0f}%"
+        print(line)
+    print(f"\nWall time: {results['wall_seconds']}s")
+    cold = results.get("cold_start")
+    if cold:
+        line = (f"Cold start ({cold['runs']} runs, {cold['errors']} errors): p50 {cold['p50_ms']:.1f}ms, "
+                f"p95 {cold['p95_ms']:.1f}ms, max {cold['max_ms']:.1f}ms")
+        base = (baseline or {}).get("cold_start")
+        if base and base["p95_ms"]:
+            line += f"   p95 {((cold['p95_ms'] - base['p95_ms']) / base['p95_ms']) * 100:+.0f}%"
+        print(line)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return the routes whose p95 regressed beyond tolerance (fractional)"""
+    regressions = []
+    for route, stats in results["routes"].items():
+        base = baseline["routes"].get(route)
+        if not base or not base["p95_ms"]:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{route}: errors {base['errors']} -> {stats['errors']}")
+    cold, base = results.get("cold_start"), baseline.get("cold_start")
+    if cold and base and base["p95_ms"]:
+        if cold["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"cold start: p95 {base['p95_ms']}ms -> {cold['p95_ms']}ms")
+        if cold["errors"] > base["errors"]:
+            regressions.append(f"cold start: errors {base['errors']} -> {cold['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=None, help="Local mongod URL (default: mongomock-motor)")
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent polling map clients")
+    parser.add_argument("--rounds", type=int, default=3, help="Poll rounds per client")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Compress the 30s poll interval (0.01 -> 0.3s)")
+    parser.add_argument("--seed-reports", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=100, help="Reports created in the burst")
+    parser.add_argument("--votes", type=int, default=300, help="Votes in the vote storm")
+    parser.add_argument("--comments", type=int, default=50)
+    parser.add_argument("--uploads", type=int, default=10, help="Photo reports and multipart uploads each")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="Fresh-process cold starts to measure (0 to skip)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible traffic")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(run_benchmark(args))
+
+    baseline = None
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if args.compare:
+        if baseline is None:
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            return 1
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,791 +2,684 @@
 """
 Backend API Testing for AquaRoute - Waterlogging Report System
 Tests all backend endpoints and functionality as specified in requirements.
+
+The app runs in-process through httpx's ASGI transport against mongomock-motor,
+so the suite needs no deployed backend and finishes in seconds. Concurrent
+scenarios (parallel votes, comments racing expiry, parallel creates) guard
+against lost updates and other race regressions.
+
+    python backend_test.py        # or: python -m pytest backend_test.py
 """
 
-import requests
-import json
-import time
-from datetime import datetime, timedelta
+import asyncio
+import os
 import sys
+from datetime import datetime, timedelta
+from pathlib import Path
 
-# Get backend URL from frontend .env file
-def get_backend_url():
-    try:
-        with open('/app/frontend/.env', 'r') as f:
-            for line in f:
-                if line.startswith('REACT_APP_BACKEND_URL='):
-                    return line.split('=', 1)[1].strip()
-    except Exception as e:
-        print(f"Error reading backend URL: {e}")
-        return None
-
-BASE_URL = get_backend_url()
-if not BASE_URL:
-    print("ERROR: Could not get backend URL from frontend/.env")
-    sys.exit(1)
-
-API_URL = f"{BASE_URL}/api"
-print(f"Testing backend at: {API_URL}")
-
-class TestResults:
-    def __init__(self):
-        self.passed = 0
-        self.failed = 0
-        self.errors = []
-    
-    def pass_test(self, test_name):
-        self.passed += 1
-        print(f"✅ PASS: {test_name}")
-    
-    def fail_test(self, test_name, error):
-        self.failed += 1
-        self.errors.append(f"{test_name}: {error}")
-        print(f"❌ FAIL: {test_name} - {error}")
-    
-    def summary(self):
-        total = self.passed + self.failed
-        print(f"\n{'='*60}")
-        print(f"TEST SUMMARY: {self.passed}/{total} tests passed")
-        if self.errors:
-            print(f"\nFAILED TESTS:")
-            for error in self.errors:
-                print(f"  - {error}")
-        print(f"{'='*60}")
-        return self.failed == 0
-
-def test_api_root():
+import httpx
+import pytest
+
+ROOT_DIR = Path(__file__).parent
+
+# Local database and no Cloudinary account for in-process runs
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "aquaroute_test")
+for key in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+    os.environ[key] = "demo"
+# Concurrent scenarios deliberately exceed per-client budgets
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+# Queued webhooks are inspected, never delivered
+os.environ["WEBHOOK_WORKERS"] = "0"
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+import server  # noqa: E402
+from flood_index import FloodPenaltyIndex  # noqa: E402
+from idempotency import request_fingerprint  # noqa: E402
+from report_store import id_filter  # noqa: E402
+from spatial_index import GeoHashIndex  # noqa: E402
+from subscriptions import SubscriptionIndex  # noqa: E402
+import webhooks  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    """Fresh in-memory database and in-process HTTP client per test"""
+    server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    server.flood_index = FloodPenaltyIndex()
+    server.report_index = GeoHashIndex()
+    server.subscription_index = SubscriptionIndex()
+    app = server.create_app()
+    await server.startup_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver/api") as c:
+        yield c
+    await server.shutdown_db_client()
+
+
+async def create_report(client, **overrides):
+    data = {"lat": 19.0760, "lng": 72.8777, "severity": "Medium"}
+    data.update(overrides)
+    response = await client.post("/reports", json=data)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+# Core API
+
+async def test_api_root(client):
     """Test GET /api/ endpoint"""
-    results = TestResults()
-    
-    try:
-        response = requests.get(f"{API_URL}/", timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "message" in data and "AquaRoute" in data["message"]:
-                results.pass_test("GET /api/ returns AquaRoute welcome message")
-            else:
-                results.fail_test("GET /api/ message content", f"Expected AquaRoute message, got: {data}")
-        else:
-            results.fail_test("GET /api/ status code", f"Expected 200, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("GET /api/ connection", str(e))
-    
-    return results
-
-def test_get_reports_empty():
+    response = await client.get("/")
+    assert response.status_code == 200
+    assert "AquaRoute" in response.json()["message"]
+
+
+async def test_get_reports_empty(client):
     """Test GET /api/reports when no reports exist"""
-    results = TestResults()
-    
-    try:
-        response = requests.get(f"{API_URL}/reports", timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if isinstance(data, list):
-                results.pass_test("GET /api/reports returns list format")
-            else:
-                results.fail_test("GET /api/reports format", f"Expected list, got: {type(data)}")
-        else:
-            results.fail_test("GET /api/reports status code", f"Expected 200, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("GET /api/reports connection", str(e))
-    
-    return results
-
-def test_create_report_valid():
+    response = await client.get("/reports")
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+async def test_create_report_valid(client):
     """Test POST /api/reports with valid data"""
-    results = TestResults()
-    
-    # Test data with Indian coordinates (Mumbai area)
-    test_data = {
-        "lat": 19.0760,
-        "lng": 72.8777,
-        "severity": "Medium"
-    }
-    
-    try:
-        response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check required fields
-            required_fields = ["id", "lat", "lng", "severity", "created_at", "expires_at"]
-            missing_fields = [field for field in required_fields if field not in data]
-            
-            if not missing_fields:
-                results.pass_test("POST /api/reports creates report with all required fields")
-                
-                # Verify data integrity
-                if data["lat"] == test_data["lat"] and data["lng"] == test_data["lng"]:
-                    results.pass_test("POST /api/reports preserves lat/lng coordinates")
-                else:
-                    results.fail_test("POST /api/reports data integrity", "Coordinates don't match input")
-                
-                if data["severity"] == test_data["severity"]:
-                    results.pass_test("POST /api/reports preserves severity level")
-                else:
-                    results.fail_test("POST /api/reports severity", f"Expected {test_data['severity']}, got {data['severity']}")
-                
-                # Check timestamps
-                try:
-                    created_at = datetime.fromisoformat(data["created_at"].replace('Z', '+00:00'))
-                    expires_at = datetime.fromisoformat(data["expires_at"].replace('Z', '+00:00'))
-                    
-                    time_diff = expires_at - created_at
-                    if abs(time_diff.total_seconds() - 86400) < 60:  # 24 hours ± 1 minute
-                        results.pass_test("POST /api/reports sets 24-hour expiry")
-                    else:
-                        results.fail_test("POST /api/reports expiry time", f"Expected ~24 hours, got {time_diff}")
-                        
-                except Exception as e:
-                    results.fail_test("POST /api/reports timestamp parsing", str(e))
-                
-                return results, data  # Return created report for further testing
-                
-            else:
-                results.fail_test("POST /api/reports missing fields", f"Missing: {missing_fields}")
-                
-        else:
-            results.fail_test("POST /api/reports status code", f"Expected 200, got {response.status_code}: {response.text}")
-            
-    except Exception as e:
-        results.fail_test("POST /api/reports connection", str(e))
-    
-    return results, None
-
-def test_severity_levels():
+    test_data = {"lat": 19.0760, "lng": 72.8777, "severity": "Medium"}
+    data = await create_report(client, **test_data)
+
+    for field in ["id", "lat", "lng", "severity", "created_at", "expires_at"]:
+        assert field in data
+    assert data["lat"] == test_data["lat"] and data["lng"] == test_data["lng"]
+    assert data["severity"] == test_data["severity"]
+
+    created_at = datetime.fromisoformat(data["created_at"].replace('Z', '+00:00'))
+    expires_at = datetime.fromisoformat(data["expires_at"].replace('Z', '+00:00'))
+    assert abs((expires_at - created_at).total_seconds() - 86400) < 60  # 24 hours ± 1 minute
+
+
+@pytest.mark.parametrize("severity", ["Low", "Medium", "Severe"])
+async def test_severity_levels(client, severity):
     """Test POST /api/reports with different severity levels"""
-    results = TestResults()
-    
-    valid_severities = ["Low", "Medium", "Severe"]
-    
-    for severity in valid_severities:
-        test_data = {
-            "lat": 20.5937,
-            "lng": 78.9629,
-            "severity": severity
-        }
-        
-        try:
-            response = requests.post(
-                f"{API_URL}/reports", 
-                json=test_data,
-                headers={"Content-Type": "application/json"},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data["severity"] == severity:
-                    results.pass_test(f"POST /api/reports accepts severity '{severity}'")
-                else:
-                    results.fail_test(f"POST /api/reports severity '{severity}'", f"Got {data['severity']}")
-            else:
-                results.fail_test(f"POST /api/reports severity '{severity}' status", f"Got {response.status_code}")
-                
-        except Exception as e:
-            results.fail_test(f"POST /api/reports severity '{severity}' connection", str(e))
-    
-    return results
-
-def test_invalid_severity():
+    data = await create_report(client, lat=20.5937, lng=78.9629, severity=severity)
+    assert data["severity"] == severity
+
+
+async def test_invalid_severity(client):
     """Test POST /api/reports with invalid severity level"""
-    results = TestResults()
-    
-    test_data = {
-        "lat": 20.5937,
-        "lng": 78.9629,
-        "severity": "Invalid"
-    }
-    
-    try:
-        response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 400:
-            results.pass_test("POST /api/reports rejects invalid severity with 400 error")
-        else:
-            results.fail_test("POST /api/reports invalid severity", f"Expected 400, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("POST /api/reports invalid severity connection", str(e))
-    
-    return results
-
-def test_missing_required_fields():
-    """Test POST /api/reports with missing required fields"""
-    results = TestResults()
-    
-    # Test missing lat
-    test_data = {"lng": 78.9629, "severity": "Medium"}
-    
-    try:
-        response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 422:  # FastAPI validation error
-            results.pass_test("POST /api/reports rejects missing lat field")
-        else:
-            results.fail_test("POST /api/reports missing lat", f"Expected 422, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("POST /api/reports missing lat connection", str(e))
-    
-    # Test missing lng
-    test_data = {"lat": 20.5937, "severity": "Medium"}
-    
-    try:
-        response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 422:  # FastAPI validation error
-            results.pass_test("POST /api/reports rejects missing lng field")
-        else:
-            results.fail_test("POST /api/reports missing lng", f"Expected 422, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("POST /api/reports missing lng connection", str(e))
-    
-    return results
-
-def test_data_persistence():
+    response = await client.post("/reports", json={"lat": 20.5937, "lng": 78.9629, "severity": "Invalid"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("data", [
+    {"lng": 78.9629, "severity": "Medium"},
+    {"lat": 20.5937, "severity": "Medium"},
+])
+async def test_missing_required_fields(client, data):
+    """Test POST /api/reports with missing lat or lng"""
+    response = await client.post("/reports", json=data)
+    assert response.status_code == 422  # FastAPI validation error
+
+
+async def test_data_persistence(client):
     """Test that created reports appear in GET /api/reports"""
-    results = TestResults()
-    
-    # Create a report
-    test_data = {
-        "lat": 18.5204,
-        "lng": 73.8567,
-        "severity": "Severe"
-    }
-    
-    try:
-        # Create report
-        create_response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if create_response.status_code == 200:
-            created_report = create_response.json()
-            report_id = created_report["id"]
-            
-            # Fetch all reports
-            get_response = requests.get(f"{API_URL}/reports", timeout=10)
-            
-            if get_response.status_code == 200:
-                reports = get_response.json()
-                
-                # Find our report
-                found_report = None
-                for report in reports:
-                    if report["id"] == report_id:
-                        found_report = report
-                        break
-                
-                if found_report:
-                    results.pass_test("Created report appears in GET /api/reports")
-                    
-                    # Verify data integrity
-                    if (found_report["lat"] == test_data["lat"] and 
-                        found_report["lng"] == test_data["lng"] and
-                        found_report["severity"] == test_data["severity"]):
-                        results.pass_test("Report data integrity maintained in database")
-                    else:
-                        results.fail_test("Report data integrity", "Data doesn't match between create and fetch")
-                else:
-                    results.fail_test("Data persistence", f"Created report with ID {report_id} not found in GET response")
-            else:
-                results.fail_test("Data persistence GET", f"GET /api/reports failed with {get_response.status_code}")
-        else:
-            results.fail_test("Data persistence CREATE", f"POST /api/reports failed with {create_response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("Data persistence connection", str(e))
-    
-    return results
-
-def test_malformed_json():
+    created = await create_report(client, lat=18.5204, lng=73.8567, severity="Severe")
+    reports = (await client.get("/reports")).json()
+    found = [r for r in reports if r["id"] == created["id"]]
+    assert len(found) == 1
+    assert (found[0]["lat"], found[0]["lng"], found[0]["severity"]) == (18.5204, 73.8567, "Severe")
+
+
+async def test_malformed_json(client):
     """Test POST /api/reports with malformed JSON"""
-    results = TestResults()
-    
-    try:
-        response = requests.post(
-            f"{API_URL}/reports", 
-            data="invalid json",
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 422:  # FastAPI validation error
-            results.pass_test("POST /api/reports rejects malformed JSON")
-        else:
-            results.fail_test("POST /api/reports malformed JSON", f"Expected 422, got {response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("POST /api/reports malformed JSON connection", str(e))
-    
-    return results
-
-def test_comments_system():
+    response = await client.post("/reports", content="invalid json",
+                                 headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+
+
+async def test_photo_is_processed_after_creation(client):
+    """Test POST /api/reports with a photo returns before the image is processed"""
+    image = "data:image/jpeg;base64,/9j/4AAQSkZJRg=="
+    created = await create_report(client, image_base64=image)
+    assert created["image_status"] == "pending"
+    assert created["has_photo"] is True and created["image_base64"] is None
+
+    # The app's workers pick the job up in the background
+    for _ in range(100):
+        report = await server.db.waterlogging_reports.find_one(id_filter(created["id"]))
+        if report["image_status"] != "pending":
+            break
+        await asyncio.sleep(0.01)
+    # No Cloudinary account in tests, so the photo is kept inline, outside the report document
+    assert report["image_status"] == "inline" and "image_base64" not in report
+    listed = (await client.get("/reports")).json()
+    assert listed[0]["image_base64"] == image
+    assert await server.db.image_jobs.count_documents({}) == 0
+
+
+async def test_nearby_reports(client):
+    """Test GET /api/reports/nearby returns reports within the radius, nearest first"""
+    far = await create_report(client, lat=19.0900, lng=72.8777)
+    near = await create_report(client, lat=19.0761, lng=72.8777)
+    nearer = await create_report(client, lat=19.0760, lng=72.8778)
+
+    response = await client.get("/reports/nearby", params={"lat": 19.0760, "lng": 72.8777, "radius_m": 500})
+    assert response.status_code == 200
+    assert [r["id"] for r in response.json()] == [nearer["id"], near["id"]]
+
+    response = await client.get("/reports/nearby", params={"lat": 19.0760, "lng": 72.8777, "radius_m": 5000})
+    assert [r["id"] for r in response.json()][-1] == far["id"]
+
+    response = await client.get("/reports/nearby", params={"lat": 19.0760, "lng": 72.8777, "radius_m": 50000})
+    assert response.status_code == 422
+
+
+async def public_dns(host, port):
+    return ["93.184.216.34"]
+
+
+async def test_alert_subscriptions(client, monkeypatch):
+    """Test subscriptions for a place and a commute receive matching reports"""
+    monkeypatch.setattr(webhooks, "resolve_host", public_dns)
+    response = await client.post("/subscriptions", json={
+        "lat": 19.0760, "lng": 72.8777, "radius_m": 300,
+        "webhook_url": "https://hooks.example.com/aquaroute"
+    })
+    assert response.status_code == 200
+    home = response.json()
+    response = await client.post("/subscriptions", json={
+        "route": [[19.0200, 72.8400], [19.0600, 72.8400]], "radius_m": 200, "min_severity": "Severe"
+    })
+    assert response.status_code == 200
+    commute = response.json()
+
+    near_home = await create_report(client, lat=19.0765, lng=72.8780)
+    await create_report(client, lat=19.0400, lng=72.8405, severity="Low")  # Below the commute's threshold
+    on_commute = await create_report(client, lat=19.0400, lng=72.8405, severity="Severe")
+    await create_report(client, lat=19.2000, lng=72.9500)  # Nowhere near either
+
+    alerts = (await client.get(f"/subscriptions/{home['id']}/alerts")).json()
+    assert [a["report_id"] for a in alerts] == [near_home["id"]]
+    alerts = (await client.get(f"/subscriptions/{commute['id']}/alerts")).json()
+    assert [a["report_id"] for a in alerts] == [on_commute["id"]]
+    # Only the home subscription has a webhook
+    jobs = await server.db.webhook_jobs.find({}).to_list(None)
+    assert [(job["url"], job["payload"]["report_id"]) for job in jobs] == [
+        ("https://hooks.example.com/aquaroute", near_home["id"])
+    ]
+
+    response = await client.delete(f"/subscriptions/{home['id']}")
+    assert response.status_code == 200
+    await create_report(client, lat=19.0765, lng=72.8780)
+    assert (await client.get(f"/subscriptions/{home['id']}/alerts")).status_code == 404
+
+
+@pytest.mark.parametrize("data", [
+    {"radius_m": 300},
+    {"lat": 19.0, "lng": 72.8, "route": [[19.0, 72.8], [19.1, 72.8]]},
+    {"route": [[19.0, 72.8]]},
+    {"lat": 19.0, "lng": 72.8, "min_severity": "Extreme"},
+    {"lat": 19.0, "lng": 72.8, "webhook_url": "ftp://example.com"},
+    # Webhooks into the server's own network
+    {"lat": 19.0, "lng": 72.8, "webhook_url": "http://localhost:27017/"},
+    {"lat": 19.0, "lng": 72.8, "webhook_url": "http://169.254.169.254/latest/meta-data/"},
+    {"lat": 19.0, "lng": 72.8, "webhook_url": "http://10.0.0.5/hook"},
+    {"lat": 19.0, "lng": 72.8, "webhook_url": "http://[::1]:8001/api/reports"},
+])
+async def test_invalid_subscriptions(client, data):
+    """Test POST /api/subscriptions rejects incomplete or invalid areas"""
+    response = await client.post("/subscriptions", json=data)
+    assert response.status_code == 400
+
+
+async def test_webhook_delivery_is_pinned_to_checked_address(client, monkeypatch):
+    """Test deliveries re-check the host and connect to the address that was checked"""
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(204)
+
+    monkeypatch.setattr(webhooks, "resolve_host", public_dns)
+    monkeypatch.setattr(server, "_webhook_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    job = {"url": "https://hooks.example.com:8443/aquaroute?x=1", "payload": {"report_id": "r1"}}
+    await server.deliver_webhook(job)
+    assert str(sent[0].url) == "https://93.184.216.34:8443/aquaroute?x=1"
+    assert sent[0].headers["Host"] == "hooks.example.com:8443"
+    assert sent[0].extensions["sni_hostname"] == "hooks.example.com"
+
+    # The name now points inside the network (DNS rebinding): nothing is sent
+    async def rebound(host, port):
+        return ["127.0.0.1"]
+
+    monkeypatch.setattr(webhooks, "resolve_host", rebound)
+    with pytest.raises(webhooks.UnsafeWebhookURL):
+        await server.deliver_webhook(job)
+    assert len(sent) == 1
+
+
+async def test_legacy_reports_before_and_after_migration(client):
+    """Reports stored in the pre-compact format keep working and migrate transparently"""
+    import uuid
+    from bson import ObjectId
+    legacy_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    await server.db.waterlogging_reports.insert_one({
+        "_id": ObjectId(), "id": legacy_id, "lat": 19.05, "lng": 72.85, "severity": "Severe",
+        "image_url": None, "image_base64": "data:image/jpeg;base64,AAAA",
+        "created_at": now, "expires_at": now + timedelta(days=1),
+        "accuracy_score": 0, "total_votes": 0, "comment_count": 0, "latest_comment": None,
+        "has_photo": True, "nearby_reports": 0, "confidence": 0.5, "trust_rank": 1.0,
+    })
+    assert (await client.post(f"/reports/{legacy_id}/vote", json={"vote_type": "up"})).status_code == 200
+    assert (await client.post(f"/reports/{legacy_id}/comments", json={"text": "Still flooded"})).status_code == 200
+    before = (await client.get("/reports", params={"include_comment_summary": "true"})).json()
+
+    await server.migrate_reports()
+    stored = await server.db.waterlogging_reports.find_one({})
+    assert "id" not in stored and "image_base64" not in stored and isinstance(stored["severity"], int)
+
+    after = (await client.get("/reports", params={"include_comment_summary": "true"})).json()
+    # Legacy photos predate image_status; migration records where the photo lives
+    assert before[0].pop("image_status") is None and after[0].pop("image_status") == "inline"
+    assert after == before
+    assert after[0]["total_votes"] == 1 and after[0]["comment_count"] == 1
+
+
+async def test_idempotent_create_replays(client):
+    """Test POST /api/reports retried with the same Idempotency-Key"""
+    data = {"lat": 19.1, "lng": 72.9, "severity": "Severe"}
+    headers = {"Idempotency-Key": "retry-1"}
+    first = await client.post("/reports", json=data, headers=headers)
+    second = await client.post("/reports", json=data, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert await server.db.waterlogging_reports.count_documents({}) == 1
+
+    # Same key, different body
+    response = await client.post("/reports", json={**data, "severity": "Low"}, headers=headers)
+    assert response.status_code == 422
+
+
+async def test_idempotency_claim_of_dead_worker_is_taken_over(client):
+    """Test a key left in progress by a crashed worker is retried once its lock runs out"""
+    data = {"lat": 19.1, "lng": 72.9, "severity": "Severe"}
+    headers = {"Idempotency-Key": "crashed"}
+    # The original request claimed the key and died before completing it
+    fingerprint = request_fingerprint(server.WaterloggingReportCreate(**data).dict())
+    assert await server.report_idempotency().begin("crashed", fingerprint) is None
+
+    response = await client.post("/reports", json=data, headers=headers)
+    assert response.status_code == 409 and response.headers["Retry-After"] == "1"
+
+    await server.db.idempotency_keys.update_one(
+        {"_id": "reports:crashed"}, {"$set": {"locked_until": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    retry = await client.post("/reports", json=data, headers=headers)
+    assert retry.status_code == 200 and "Idempotent-Replayed" not in retry.headers
+    replay = await client.post("/reports", json=data, headers=headers)
+    assert replay.json() == retry.json() and replay.headers["Idempotent-Replayed"] == "true"
+    assert await server.db.waterlogging_reports.count_documents({}) == 1
+
+
+async def test_idempotent_create_survives_failed_follow_ups(client, monkeypatch):
+    """Test a failure after the report is stored neither fails the request nor lets a retry duplicate it"""
+    data = {"lat": 19.1, "lng": 72.9, "severity": "Severe"}
+    headers = {"Idempotency-Key": "publish-fails"}
+
+    async def broken_publish(topic, payload):
+        raise RuntimeError("event bus unavailable")
+
+    monkeypatch.setattr(server.event_bus, "publish", broken_publish)
+    first = await client.post("/reports", json=data, headers=headers)
+    assert first.status_code == 200
+
+    retry = await client.post("/reports", json=data, headers=headers)
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert await server.db.waterlogging_reports.count_documents({}) == 1
+
+
+async def test_comments_system(client):
     """Test Comments System - GET and POST /api/reports/{report_id}/comments"""
-    results = TestResults()
-    
-    # First create a report to comment on
-    test_report = {
-        "lat": 19.0760,
-        "lng": 72.8777,
-        "severity": "Medium"
+    report_id = (await create_report(client))["id"]
+
+    response = await client.get(f"/reports/{report_id}/comments")
+    assert response.status_code == 200
+    assert response.json() == []
+
+    comment_data = {
+        "text": "This waterlogging is quite severe, avoid this area during heavy rains!",
+        "author": "LocalResident"
     }
-    
-    try:
-        # Create report
-        create_response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_report,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if create_response.status_code != 200:
-            results.fail_test("Comments test setup", f"Failed to create test report: {create_response.status_code}")
-            return results
-            
-        report_id = create_response.json()["id"]
-        
-        # Test 1: GET comments for report (should be empty initially)
-        get_response = requests.get(f"{API_URL}/reports/{report_id}/comments", timeout=10)
-        
-        if get_response.status_code == 200:
-            comments = get_response.json()
-            if isinstance(comments, list) and len(comments) == 0:
-                results.pass_test("GET /api/reports/{report_id}/comments returns empty list initially")
-            else:
-                results.fail_test("GET comments initial state", f"Expected empty list, got: {comments}")
-        else:
-            results.fail_test("GET comments status", f"Expected 200, got {get_response.status_code}")
-        
-        # Test 2: POST comment with valid data
-        comment_data = {
-            "text": "This waterlogging is quite severe, avoid this area during heavy rains!",
-            "author": "LocalResident"
-        }
-        
-        post_response = requests.post(
-            f"{API_URL}/reports/{report_id}/comments",
-            json=comment_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if post_response.status_code == 200:
-            comment = post_response.json()
-            required_fields = ["id", "report_id", "text", "author", "created_at"]
-            missing_fields = [field for field in required_fields if field not in comment]
-            
-            if not missing_fields:
-                results.pass_test("POST /api/reports/{report_id}/comments creates comment with all required fields")
-                
-                if comment["text"] == comment_data["text"] and comment["author"] == comment_data["author"]:
-                    results.pass_test("POST comment preserves text and author")
-                else:
-                    results.fail_test("POST comment data integrity", "Text or author doesn't match")
-                    
-                if comment["report_id"] == report_id:
-                    results.pass_test("POST comment links to correct report")
-                else:
-                    results.fail_test("POST comment report_id", f"Expected {report_id}, got {comment['report_id']}")
-            else:
-                results.fail_test("POST comment missing fields", f"Missing: {missing_fields}")
-        else:
-            results.fail_test("POST comment status", f"Expected 200, got {post_response.status_code}")
-        
-        # Test 3: GET comments after posting (should return the comment)
-        get_after_response = requests.get(f"{API_URL}/reports/{report_id}/comments", timeout=10)
-        
-        if get_after_response.status_code == 200:
-            comments = get_after_response.json()
-            if isinstance(comments, list) and len(comments) == 1:
-                results.pass_test("GET comments returns posted comment")
-                
-                if comments[0]["text"] == comment_data["text"]:
-                    results.pass_test("GET comments data persistence")
-                else:
-                    results.fail_test("GET comments persistence", "Comment text doesn't match")
-            else:
-                results.fail_test("GET comments after post", f"Expected list with 1 comment, got: {len(comments) if isinstance(comments, list) else 'not a list'}")
-        else:
-            results.fail_test("GET comments after post status", f"Expected 200, got {get_after_response.status_code}")
-        
-        # Test 4: POST comment with long text (200 char limit)
-        long_comment = {
-            "text": "A" * 201,  # 201 characters - should fail
-            "author": "TestUser"
-        }
-        
-        long_response = requests.post(
-            f"{API_URL}/reports/{report_id}/comments",
-            json=long_comment,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if long_response.status_code == 422:  # Validation error
-            results.pass_test("POST comment rejects text longer than 200 characters")
-        else:
-            results.fail_test("POST comment text limit", f"Expected 422 for long text, got {long_response.status_code}")
-        
-        # Test 5: POST comment to non-existent report
-        fake_report_id = "non-existent-report-id"
-        fake_comment = {
-            "text": "This should fail",
-            "author": "TestUser"
-        }
-        
-        fake_response = requests.post(
-            f"{API_URL}/reports/{fake_report_id}/comments",
-            json=fake_comment,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if fake_response.status_code == 404:
-            results.pass_test("POST comment to non-existent report returns 404")
-        else:
-            results.fail_test("POST comment invalid report", f"Expected 404, got {fake_response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("Comments system connection", str(e))
-    
-    return results
-
-def test_voting_system():
+    response = await client.post(f"/reports/{report_id}/comments", json=comment_data)
+    assert response.status_code == 200
+    comment = response.json()
+    for field in ["id", "report_id", "text", "author", "created_at"]:
+        assert field in comment
+    assert comment["text"] == comment_data["text"] and comment["author"] == comment_data["author"]
+    assert comment["report_id"] == report_id
+
+    comments = (await client.get(f"/reports/{report_id}/comments")).json()
+    assert [c["text"] for c in comments] == [comment_data["text"]]
+
+    # 200 character limit
+    response = await client.post(f"/reports/{report_id}/comments", json={"text": "A" * 201, "author": "TestUser"})
+    assert response.status_code == 422
+
+    response = await client.post("/reports/non-existent-report-id/comments",
+                                 json={"text": "This should fail", "author": "TestUser"})
+    assert response.status_code == 404
+
+
+async def test_comment_summaries_in_report_list(client):
+    """Test GET /api/reports?include_comment_summary=true embeds counts and latest comment"""
+    report_id = (await create_report(client))["id"]
+    quiet_id = (await create_report(client))["id"]
+    for text in ["Water receding", "Still knee-deep near the bus stop " * 4]:
+        await client.post(f"/reports/{report_id}/comments", json={"text": text, "author": "Resident"})
+
+    reports = {r["id"]: r for r in (await client.get("/reports", params={"include_comment_summary": "true"})).json()}
+    assert reports[report_id]["comment_count"] == 2
+    latest = reports[report_id]["latest_comment"]
+    assert latest["author"] == "Resident"
+    assert latest["text"].startswith("Still knee-deep") and len(latest["text"]) == server.COMMENT_SNIPPET_LENGTH
+    assert reports[quiet_id]["comment_count"] == 0 and reports[quiet_id]["latest_comment"] is None
+
+    # Not requested: the summary fields are omitted
+    plain = (await client.get("/reports")).json()
+    assert all("comment_count" not in r and "latest_comment" not in r for r in plain)
+
+
+async def test_comments_batch(client):
+    """Test POST /api/comments/batch returns comments for many reports at once"""
+    first = (await create_report(client))["id"]
+    second = (await create_report(client))["id"]
+    for i in range(3):
+        await client.post(f"/reports/{first}/comments", json={"text": f"first {i}"})
+    await client.post(f"/reports/{second}/comments", json={"text": "second 0"})
+
+    response = await client.post("/comments/batch", json={"report_ids": [first, second, "missing"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [c["text"] for c in data[first]] == ["first 0", "first 1", "first 2"]
+    assert [c["text"] for c in data[second]] == ["second 0"]
+    assert data["missing"] == []
+
+    response = await client.post("/comments/batch", json={"report_ids": [first], "limit_per_report": 2})
+    assert [c["text"] for c in response.json()[first]] == ["first 0", "first 1"]
+
+
+async def test_voting_system(client):
     """Test Voting System - POST /api/reports/{report_id}/vote"""
-    results = TestResults()
-    
-    # First create a report to vote on
-    test_report = {
-        "lat": 19.0760,
-        "lng": 72.8777,
-        "severity": "Severe"
-    }
-    
-    try:
-        # Create report
-        create_response = requests.post(
-            f"{API_URL}/reports", 
-            json=test_report,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if create_response.status_code != 200:
-            results.fail_test("Voting test setup", f"Failed to create test report: {create_response.status_code}")
-            return results
-            
-        report_data = create_response.json()
-        report_id = report_data["id"]
-        
-        # Verify initial vote counts
-        if "accuracy_score" in report_data and "total_votes" in report_data:
-            if report_data["accuracy_score"] == 0 and report_data["total_votes"] == 0:
-                results.pass_test("New report has initial vote counts (accuracy_score=0, total_votes=0)")
-            else:
-                results.fail_test("Initial vote counts", f"Expected 0,0 got {report_data['accuracy_score']},{report_data['total_votes']}")
-        else:
-            results.fail_test("Vote fields missing", "accuracy_score or total_votes not in report")
-        
-        # Test 1: Vote UP on report
-        up_vote = {"vote_type": "up"}
-        
-        up_response = requests.post(
-            f"{API_URL}/reports/{report_id}/vote",
-            json=up_vote,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if up_response.status_code == 200:
-            vote_result = up_response.json()
-            if "accuracy_score" in vote_result and "total_votes" in vote_result:
-                if vote_result["accuracy_score"] == 1 and vote_result["total_votes"] == 1:
-                    results.pass_test("POST vote 'up' increases accuracy_score and total_votes")
-                else:
-                    results.fail_test("Vote up counts", f"Expected 1,1 got {vote_result['accuracy_score']},{vote_result['total_votes']}")
-            else:
-                results.fail_test("Vote up response", "Missing accuracy_score or total_votes in response")
-        else:
-            results.fail_test("Vote up status", f"Expected 200, got {up_response.status_code}")
-        
-        # Test 2: Vote DOWN on report
-        down_vote = {"vote_type": "down"}
-        
-        down_response = requests.post(
-            f"{API_URL}/reports/{report_id}/vote",
-            json=down_vote,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if down_response.status_code == 200:
-            vote_result = down_response.json()
-            if "accuracy_score" in vote_result and "total_votes" in vote_result:
-                if vote_result["accuracy_score"] == 0 and vote_result["total_votes"] == 2:
-                    results.pass_test("POST vote 'down' decreases accuracy_score and increases total_votes")
-                else:
-                    results.fail_test("Vote down counts", f"Expected 0,2 got {vote_result['accuracy_score']},{vote_result['total_votes']}")
-            else:
-                results.fail_test("Vote down response", "Missing accuracy_score or total_votes in response")
-        else:
-            results.fail_test("Vote down status", f"Expected 200, got {down_response.status_code}")
-        
-        # Test 3: Invalid vote type
-        invalid_vote = {"vote_type": "invalid"}
-        
-        invalid_response = requests.post(
-            f"{API_URL}/reports/{report_id}/vote",
-            json=invalid_vote,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if invalid_response.status_code == 400:
-            results.pass_test("POST vote with invalid vote_type returns 400")
-        else:
-            results.fail_test("Invalid vote type", f"Expected 400, got {invalid_response.status_code}")
-        
-        # Test 4: Vote on non-existent report
-        fake_report_id = "non-existent-report-id"
-        fake_vote = {"vote_type": "up"}
-        
-        fake_response = requests.post(
-            f"{API_URL}/reports/{fake_report_id}/vote",
-            json=fake_vote,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if fake_response.status_code == 404:
-            results.pass_test("POST vote on non-existent report returns 404")
-        else:
-            results.fail_test("Vote invalid report", f"Expected 404, got {fake_response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("Voting system connection", str(e))
-    
-    return results
-
-def test_time_filtering():
+    report = await create_report(client, severity="Severe")
+    report_id = report["id"]
+    assert (report["accuracy_score"], report["total_votes"]) == (0, 0)
+
+    result = (await client.post(f"/reports/{report_id}/vote", json={"vote_type": "up"})).json()
+    assert (result["accuracy_score"], result["total_votes"]) == (1, 1)
+
+    result = (await client.post(f"/reports/{report_id}/vote", json={"vote_type": "down"})).json()
+    assert (result["accuracy_score"], result["total_votes"]) == (0, 2)
+
+    response = await client.post(f"/reports/{report_id}/vote", json={"vote_type": "invalid"})
+    assert response.status_code == 400
+
+    response = await client.post("/reports/non-existent-report-id/vote", json={"vote_type": "up"})
+    assert response.status_code == 404
+
+
+async def test_time_filtering(client):
     """Test Time-Based Filtering - GET /api/reports?time_filter=1h|6h|24h"""
-    results = TestResults()
-    
+    fresh = await create_report(client, lat=18.5204, lng=73.8567)
+    # Backdate one report to 3 hours ago so the windows differ
+    old = await create_report(client)
+    await server.db.waterlogging_reports.update_one(
+        id_filter(old["id"]), {"$set": {"created_at": datetime.utcnow() - timedelta(hours=3)}}
+    )
+
+    expected = {"1h": {fresh["id"]}, "6h": {fresh["id"], old["id"]},
+                "24h": {fresh["id"], old["id"]}, "invalid": {fresh["id"], old["id"]}}
+    for time_filter, ids in expected.items():
+        response = await client.get("/reports", params={"time_filter": time_filter})
+        assert response.status_code == 200
+        assert {r["id"] for r in response.json()} == ids, time_filter
+
+
+async def test_readiness_probe(client):
+    """Test GET /api/health/ready reports database reachability and pool stats"""
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert data["database"]["reachable"] is True
+    assert "in_use" in data["pool"]
+
+
+async def test_background_workers_start_when_setup_steps_fail(monkeypatch):
+    """A failing index or road-graph load must not leave the worker without its queues"""
+    async def broken():
+        raise RuntimeError("boom")
+
+    server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    monkeypatch.setattr(server, "ensure_report_ttl_index", broken)
+    monkeypatch.setattr(server, "load_report_indexes", broken)
+    server.create_app()
+    await server.startup_db()
     try:
-        # Test 1: Time filter 1h
-        response_1h = requests.get(f"{API_URL}/reports?time_filter=1h", timeout=10)
-        
-        if response_1h.status_code == 200:
-            reports_1h = response_1h.json()
-            if isinstance(reports_1h, list):
-                results.pass_test("GET /api/reports?time_filter=1h returns list")
-            else:
-                results.fail_test("Time filter 1h format", f"Expected list, got {type(reports_1h)}")
-        else:
-            results.fail_test("Time filter 1h status", f"Expected 200, got {response_1h.status_code}")
-        
-        # Test 2: Time filter 6h
-        response_6h = requests.get(f"{API_URL}/reports?time_filter=6h", timeout=10)
-        
-        if response_6h.status_code == 200:
-            reports_6h = response_6h.json()
-            if isinstance(reports_6h, list):
-                results.pass_test("GET /api/reports?time_filter=6h returns list")
-            else:
-                results.fail_test("Time filter 6h format", f"Expected list, got {type(reports_6h)}")
-        else:
-            results.fail_test("Time filter 6h status", f"Expected 200, got {response_6h.status_code}")
-        
-        # Test 3: Time filter 24h
-        response_24h = requests.get(f"{API_URL}/reports?time_filter=24h", timeout=10)
-        
-        if response_24h.status_code == 200:
-            reports_24h = response_24h.json()
-            if isinstance(reports_24h, list):
-                results.pass_test("GET /api/reports?time_filter=24h returns list")
-            else:
-                results.fail_test("Time filter 24h format", f"Expected list, got {type(reports_24h)}")
-        else:
-            results.fail_test("Time filter 24h status", f"Expected 200, got {response_24h.status_code}")
-        
-        # Test 4: Invalid time filter (should default to 24h)
-        response_invalid = requests.get(f"{API_URL}/reports?time_filter=invalid", timeout=10)
-        
-        if response_invalid.status_code == 200:
-            reports_invalid = response_invalid.json()
-            if isinstance(reports_invalid, list):
-                results.pass_test("GET /api/reports?time_filter=invalid returns list (defaults to 24h)")
-            else:
-                results.fail_test("Invalid time filter format", f"Expected list, got {type(reports_invalid)}")
-        else:
-            results.fail_test("Invalid time filter status", f"Expected 200, got {response_invalid.status_code}")
-        
-        # Test 5: Create a fresh report and verify it appears in all time filters
-        fresh_report = {
-            "lat": 18.5204,
-            "lng": 73.8567,
-            "severity": "Medium"
-        }
-        
-        create_response = requests.post(
-            f"{API_URL}/reports", 
-            json=fresh_report,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if create_response.status_code == 200:
-            fresh_report_id = create_response.json()["id"]
-            
-            # Check if fresh report appears in 1h filter
-            fresh_1h_response = requests.get(f"{API_URL}/reports?time_filter=1h", timeout=10)
-            if fresh_1h_response.status_code == 200:
-                fresh_reports_1h = fresh_1h_response.json()
-                found_in_1h = any(report["id"] == fresh_report_id for report in fresh_reports_1h)
-                
-                if found_in_1h:
-                    results.pass_test("Fresh report appears in 1h time filter")
-                else:
-                    results.fail_test("Fresh report 1h filter", "Fresh report not found in 1h filter")
-            else:
-                results.fail_test("Fresh report 1h check", f"Failed to get 1h filtered reports: {fresh_1h_response.status_code}")
-        else:
-            results.fail_test("Time filter test setup", f"Failed to create fresh report: {create_response.status_code}")
-            
-    except Exception as e:
-        results.fail_test("Time filtering connection", str(e))
-    
-    return results
-
-def main():
-    """Run all backend tests"""
-    print("🧪 Starting AquaRoute Backend API Tests")
-    print(f"Backend URL: {API_URL}")
-    print("="*60)
-    
-    all_results = TestResults()
-    
-    # Test 1: API Root endpoint
-    print("\n📍 Testing API Root Endpoint")
-    result = test_api_root()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 2: GET reports (empty state)
-    print("\n📍 Testing GET Reports (Empty State)")
-    result = test_get_reports_empty()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 3: Create valid report
-    print("\n📍 Testing POST Reports (Valid Data)")
-    result, created_report = test_create_report_valid()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 4: Different severity levels
-    print("\n📍 Testing Different Severity Levels")
-    result = test_severity_levels()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 5: Invalid severity
-    print("\n📍 Testing Invalid Severity Validation")
-    result = test_invalid_severity()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 6: Missing required fields
-    print("\n📍 Testing Missing Required Fields")
-    result = test_missing_required_fields()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 7: Data persistence
-    print("\n📍 Testing Data Persistence")
-    result = test_data_persistence()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 8: Malformed JSON
-    print("\n📍 Testing Malformed JSON Handling")
-    result = test_malformed_json()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # NEW FEATURE TESTS
-    
-    # Test 9: Comments System
-    print("\n📍 Testing Comments System (NEW FEATURE)")
-    result = test_comments_system()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 10: Voting System
-    print("\n📍 Testing Voting System (NEW FEATURE)")
-    result = test_voting_system()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Test 11: Time-Based Filtering
-    print("\n📍 Testing Time-Based Filtering (NEW FEATURE)")
-    result = test_time_filtering()
-    all_results.passed += result.passed
-    all_results.failed += result.failed
-    all_results.errors.extend(result.errors)
-    
-    # Final summary
-    success = all_results.summary()
-    
-    if success:
-        print("\n🎉 All backend tests passed! AquaRoute API is working correctly.")
-        return 0
-    else:
-        print(f"\n⚠️  {all_results.failed} backend tests failed. See details above.")
-        return 1
+        assert (await server.image_queue.stats())["workers"] == server.IMAGE_WORKERS
+    finally:
+        await server.shutdown_db_client()
+
+
+async def test_settings_are_read_after_loading_env_file(monkeypatch):
+    """Values that only backend/.env provides apply to the app create_app builds"""
+    def load_env():
+        monkeypatch.setenv("IMAGE_WORKERS", "3")
+        monkeypatch.setenv("EXPIRY_SWEEP_INTERVAL_SECONDS", "15")
+        monkeypatch.setenv("REPORTS_CACHE_TTL_SECONDS", "0")
+        monkeypatch.setenv("WEBHOOK_ALLOWED_HOSTS", "Hooks.Example.com, ")
+
+    monkeypatch.setattr(server, "load_env", load_env)
+    try:
+        server.create_app()
+        assert server.IMAGE_WORKERS == 3
+        assert server.image_queue.workers == 3
+        assert server.EXPIRY_SWEEP_INTERVAL == 15.0
+        assert server.reports_cache.ttl == 0.0
+        assert server.WEBHOOK_ALLOWED_HOSTS == ("hooks.example.com",)
+    finally:
+        monkeypatch.undo()
+        server.create_app()
+
+
+async def test_ttl_grace_without_collmod_permission(monkeypatch, caplog):
+    """An app user without collMod gets a warning, not a failed startup step"""
+    from pymongo.errors import OperationFailure
+
+    class Reports:
+        async def create_index(self, *args, **kwargs):
+            raise OperationFailure("index options conflict", code=85)
+
+    class Database:
+        waterlogging_reports = Reports()
+
+        async def command(self, *args, **kwargs):
+            raise OperationFailure("not authorized to execute command collMod", code=13)
+
+    monkeypatch.setattr(server, "db", Database())
+    await server.ensure_report_ttl_index()
+    assert "collMod not permitted" in caplog.text
+
+
+async def test_report_stats_rollups(client):
+    """Test GET /api/stats counts creates, votes and expiries per hour, area and severity"""
+    first = await create_report(client, severity="Severe")
+    await create_report(client, severity="Severe", lat=19.0762)
+    await create_report(client, severity="Low", lat=28.6139, lng=77.2090)
+    assert (await client.post(f"/reports/{first['id']}/vote", json={"vote_type": "up"})).status_code == 200
+    assert (await client.post(f"/reports/{first['id']}/vote", json={"vote_type": "down"})).status_code == 200
+    await server.db.waterlogging_reports.update_one(
+        id_filter(first["id"]), {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    await server.sweep_expired_reports()
+
+    response = await client.get("/stats")
+    assert response.status_code == 200
+    buckets = response.json()["buckets"]
+    assert [(b["area"], b["severity"]) for b in buckets] == [("te7ud", "Severe"), ("ttnfu", "Low")]
+    assert {k: buckets[0][k] for k in ("reports", "upvotes", "downvotes", "expired")} == \
+        {"reports": 2, "upvotes": 1, "downvotes": 1, "expired": 1}
+    # History outlives the expired report
+    assert len((await client.get("/reports")).json()) == 2
+
+    coarse = (await client.get("/stats", params={"area": "te", "precision": 2})).json()
+    assert [(b["area"], b["reports"]) for b in coarse["buckets"]] == [("te", 2)]
+    assert (await client.get("/stats", params={"area": "te!"})).status_code == 400
+    assert (await client.get("/stats", params={"start": "2026-01-01T00:00:00",
+                                               "end": "2026-03-01T00:00:00"})).status_code == 400
+
+
+async def test_debug_endpoints_require_admin_token(client, monkeypatch):
+    """Test /debug/profile is hidden without ADMIN_TOKEN and guarded with it"""
+    url = "http://testserver/debug/profile"
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert (await client.get(url, params={"seconds": 0.05})).status_code == 404
+
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    assert (await client.get(url, params={"seconds": 0.05})).status_code == 401
+    headers = {"Authorization": "Bearer s3cret"}
+    response = await client.get(url, params={"seconds": 0.05, "interval_ms": 1}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["X-Profile-Samples"]) > 0
+
+    response = await client.get("http://testserver/debug/slow-requests", headers=headers)
+    assert response.status_code == 200 and isinstance(response.json(), list)
+
+
+async def test_corroboration_queries_mongo_until_report_index_is_seeded(client, monkeypatch):
+    """Test a worker whose startup could not seed report_index still finds neighbours"""
+    queried = []
+
+    def near_filter(lat, lng, radius_m):
+        # Stand-in for the $geoWithin filter, which mongomock cannot evaluate
+        queried.append((lat, lng, radius_m))
+        return {"loc.coordinates.1": {"$gte": lat - 0.001, "$lte": lat + 0.001}}
+
+    monkeypatch.setattr(server, "near_filter", near_filter)
+    monkeypatch.setattr(server, "report_index_ready", False)
+    await create_report(client, lat=19.0760, lng=72.8777)
+    # Nothing seeded: the first report is only in Mongo
+    monkeypatch.setattr(server, "report_index", GeoHashIndex())
+    second = await create_report(client, lat=19.0765, lng=72.8780)
+    assert second["nearby_reports"] == 1
+    assert queried[-1] == (19.0765, 72.8780, server.AGREEMENT_RADIUS_M)
+
+
+async def test_trust_scores_follow_votes_and_corroboration(client):
+    """Test stored confidence reacts to votes and nearby reports, and sort/threshold use it"""
+    lone = await create_report(client, lat=28.6139, lng=77.2090, severity="Medium")
+    first = await create_report(client, lat=19.0760, lng=72.8777, severity="Severe")
+    second = await create_report(client, lat=19.0765, lng=72.8780, severity="Severe")
+    assert second["nearby_reports"] == 1
+    assert second["confidence"] > lone["confidence"]
+
+    stored = await server.db.waterlogging_reports.find_one(id_filter(first["id"]))
+    assert stored["nearby_reports"] == 1 and stored["confidence"] > first["confidence"]
+
+    result = (await client.post(f"/reports/{first['id']}/vote", json={"vote_type": "up"})).json()
+    assert result["confidence"] > stored["confidence"]
+
+    ranked = (await client.get("/reports", params={"sort": "trust"})).json()
+    assert [r["id"] for r in ranked][0] == first["id"]
+    assert [r["id"] for r in ranked][-1] == lone["id"]
+
+    trusted = (await client.get("/reports", params={"min_confidence": 0.4})).json()
+    assert {r["id"] for r in trusted} == {first["id"], second["id"]}
+
+
+# Concurrent scenarios
+
+async def test_parallel_votes_are_not_lost(client):
+    """Concurrent votes on one report must all be counted"""
+    report_id = (await create_report(client))["id"]
+    ups, downs = 40, 15
+    votes = ["up"] * ups + ["down"] * downs
+
+    responses = await asyncio.gather(*(
+        client.post(f"/reports/{report_id}/vote", json={"vote_type": v}) for v in votes
+    ))
+    assert all(r.status_code == 200 for r in responses)
+
+    stored = await server.db.waterlogging_reports.find_one(id_filter(report_id))
+    assert stored["total_votes"] == ups + downs
+    assert stored["accuracy_score"] == ups - downs
+    # Every response reflects at least its own vote
+    assert all(1 <= r.json()["total_votes"] <= ups + downs for r in responses)
+
+
+async def test_comments_racing_report_expiry(client):
+    """Comments posted while the report expires either land or 404, never half-succeed"""
+    report_id = (await create_report(client))["id"]
+    await server.db.waterlogging_reports.update_one(
+        id_filter(report_id), {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+    async def comment(i):
+        return await client.post(f"/reports/{report_id}/comments", json={"text": f"comment {i}"})
+
+    results = await asyncio.gather(server.sweep_expired_reports(), client.get("/reports"),
+                                   *(comment(i) for i in range(20)))
+    listing, comment_responses = results[1], results[2:]
+    assert listing.status_code == 200
+    assert report_id not in {r["id"] for r in listing.json()}
+    assert all(r.status_code in (200, 404) for r in comment_responses)
+
+    accepted = {r.json()["id"] for r in comment_responses if r.status_code == 200}
+    stored = {c["id"] for c in (await client.get(f"/reports/{report_id}/comments")).json()}
+    assert stored == accepted
+
+    # Once the sweep has run the report is gone for good
+    response = await comment(99)
+    assert response.status_code == 404
+
+
+async def test_parallel_creates(client):
+    """Concurrent creates all persist with unique IDs"""
+    count = 30
+    responses = await asyncio.gather(*(
+        client.post("/reports", json={"lat": 19.0 + i * 0.001, "lng": 72.8, "severity": "Low"})
+        for i in range(count)
+    ))
+    assert all(r.status_code == 200 for r in responses)
+    ids = {r.json()["id"] for r in responses}
+    assert len(ids) == count
+
+    listed = {r["id"] for r in (await client.get("/reports")).json()}
+    assert ids <= listed
+    assert len(server.flood_index) == count
+
+
+async def test_parallel_idempotent_retries(client):
+    """Concurrent retries of one request create exactly one report"""
+    data = {"lat": 19.2, "lng": 72.9, "severity": "Medium"}
+    responses = await asyncio.gather(*(
+        client.post("/reports", json=data, headers={"Idempotency-Key": "burst"})
+        for _ in range(10)
+    ))
+    # Retries that overlap the original are told to back off
+    assert {r.status_code for r in responses} <= {200, 409}
+    ids = {r.json()["id"] for r in responses if r.status_code == 200}
+    assert len(ids) == 1
+    assert await server.db.waterlogging_reports.count_documents({}) == 1
+
 
 if __name__ == "__main__":
-    exit_code = main()
-    sys.exit(exit_code)
\ No newline at end of file
+    sys.exit(pytest.main([__file__, "-q"]))
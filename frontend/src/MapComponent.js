@@ -422,12 +422,29 @@ function LocationMarker({ setReports, reports, userLocation }) {
   }, [userLocation, map]);
 
   const handleReportSubmit = async (reportData) => {
+    // One key per submission: retries after a dropped connection or a 409/5xx
+    // get the original report back instead of creating a duplicate
+    const idempotencyKey = window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    const maxAttempts = 3;
     try {
-      const response = await axios.post(API_URL, reportData, {
-        headers: { 'Content-Type': 'application/json' }
-      });
-      
-      setReports(prevReports => [...prevReports, response.data]);
+      let response;
+      for (let attempt = 1; ; attempt++) {
+        try {
+          response = await axios.post(API_URL, reportData, {
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey }
+          });
+          break;
+        } catch (error) {
+          const status = error.response?.status;
+          const retryable = !error.response || status === 409 || status >= 500;
+          if (!retryable || attempt >= maxAttempts) throw error;
+          await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+      }
+
+      setReports(prevReports => [...prevReports.filter(r => r.id !== response.data.id), response.data]);
       alert(`✅ Waterlogging report submitted successfully!${reportData.image_base64 ? ' 📸 Photo included!' : ''}`);
     } catch (error) {
       console.error("Error posting report:", error);
@@ -589,7 +606,7 @@ const MapComponent = () => {
 
   const fetchReports = async (filter = timeFilter) => {
     try {
-      const response = await axios.get(`${API_URL}?time_filter=${filter}`);
+      const response = await axios.get(`${API_URL}?time_filter=${filter}&include_comment_summary=true`);
       setReports(response.data);
       setLastUpdated(new Date());
     } catch (error) {
@@ -786,6 +803,10 @@ const MapComponent = () => {
                     />
                   </div>
                 )}
+
+                {!hasPhoto(report) && report.image_status === 'pending' && (
+                  <p className="popup-photo-pending">📸 Photo processing…</p>
+                )}
                 
                 <p className="popup-details">
                   📍 <strong>Location:</strong><br/>
@@ -825,8 +846,13 @@ const MapComponent = () => {
                     onClick={() => setShowComments(report.id)}
                     className="comments-btn"
                   >
-                    💬 View Comments
+                    💬 View Comments{report.comment_count > 0 && ` (${report.comment_count})`}
                   </button>
+                  {report.latest_comment && (
+                    <p className="popup-latest-comment">
+                      <strong>{report.latest_comment.author}:</strong> {report.latest_comment.text}
+                    </p>
+                  )}
                 </div>
                 
                 <p className="popup-warning">
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the in-memory report index (backend/spatial_index.py).
+
+Loads N random points over a metro-sized area into GeoHashIndex and, when a
+mongod is given, into a collection with a 2dsphere index, then times radius
+and viewport (bbox) queries on both. A linear scan over the same points is
+included as the baseline the index should beat.
+
+    python spatial_benchmark.py                                   # 10k and 100k points
+    python spatial_benchmark.py --sizes 10000,100000,1000000 --mongo-url mongodb://localhost:27017
+
+Mongo timings include the round trip to the server, which is what the request
+path pays.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+from spatial_index import EARTH_RADIUS_M, GeoHashIndex, haversine_m, radius_bbox  # noqa: E402
+
+# Mumbai metropolitan region, larger than the load benchmark's box so 1M points stay realistic
+LAT_RANGE = (18.85, 19.45)
+LNG_RANGE = (72.75, 73.15)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def timed(func, queries):
+    samples = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += len(func(*query))
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "avg_hits": hits / max(len(queries), 1),
+    }
+
+
+def make_points(n, rng):
+    return [(f"r{i}", rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for i in range(n)]
+
+
+def make_queries(count, radius_m, viewport_m, rng):
+    centers = [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(count)]
+    radius = [(lat, lng, radius_m) for lat, lng in centers]
+    bbox = [radius_bbox(lat, lng, viewport_m / 2) for lat, lng in centers]
+    return radius, bbox
+
+
+def bench_index(points, radius_queries, bbox_queries):
+    index = GeoHashIndex()
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    start = time.perf_counter()
+    for point_id, lat, lng in points:
+        index.insert(point_id, lat, lng, expires_at)
+    build = time.perf_counter() - start
+    results = {
+        "build_s": build,
+        "radius": timed(index.within_radius, radius_queries),
+        "bbox": timed(index.within_bbox, bbox_queries),
+    }
+    start = time.perf_counter()
+    expired = index.expire(expires_at)
+    results["expire_all_s"] = time.perf_counter() - start
+    assert len(expired) == len(points)
+    return results
+
+
+def bench_scan(points, radius_queries, bbox_queries):
+    def radius(lat, lng, radius_m):
+        return [pid for pid, plat, plng in points if haversine_m(lat, lng, plat, plng) <= radius_m]
+
+    def bbox(min_lat, min_lng, max_lat, max_lng):
+        return [pid for pid, plat, plng in points
+                if min_lat <= plat <= max_lat and min_lng <= plng <= max_lng]
+
+    return {"radius": timed(radius, radius_queries), "bbox": timed(bbox, bbox_queries)}
+
+
+def bench_mongo(mongo_url, points, radius_queries, bbox_queries):
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_url)
+    collection = client["aquaroute_benchmark"]["spatial_benchmark"]
+    collection.drop()
+    start = time.perf_counter()
+    batch = []
+    for point_id, lat, lng in points:
+        batch.append({"id": point_id, "location": {"type": "Point", "coordinates": [lng, lat]}})
+        if len(batch) == 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    collection.create_index([("location", "2dsphere")])
+    build = time.perf_counter() - start
+
+    def radius(lat, lng, radius_m):
+        return list(collection.find(
+            {"location": {"$geoWithin": {"$centerSphere": [[lng, lat], radius_m / EARTH_RADIUS_M]}}},
+            {"_id": 0, "id": 1},
+        ))
+
+    def bbox(min_lat, min_lng, max_lat, max_lng):
+        ring = [[min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]]
+        return list(collection.find(
+            {"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}},
+            {"_id": 0, "id": 1},
+        ))
+
+    try:
+        return {"build_s": build, "radius": timed(radius, radius_queries), "bbox": timed(bbox, bbox_queries)}
+    finally:
+        collection.drop()
+        client.close()
+
+
+def print_row(size, name, result):
+    build = f"{result['build_s']:.2f}s" if "build_s" in result else "-"
+    print(f"{size:>9}  {name:<14} {build:>8}  "
+          f"{result['radius']['p50_ms']:>9.3f} {result['radius']['p99_ms']:>9.3f} {result['radius']['avg_hits']:>7.1f}  "
+          f"{result['bbox']['p50_ms']:>9.3f} {result['bbox']['p99_ms']:>9.3f} {result['bbox']['avg_hits']:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated point counts")
+    parser.add_argument("--queries", type=int, default=200, help="Queries of each kind per size")
+    parser.add_argument("--radius-m", type=float, default=500.0, help="Radius query size")
+    parser.add_argument("--viewport-m", type=float, default=3000.0, help="Viewport (bbox) edge length")
+    parser.add_argument("--mongo-url", default=None, help="Local mongod URL; omit to skip the 2dsphere comparison")
+    parser.add_argument("--scan-limit", type=int, default=100000,
+                        help="Skip the linear-scan baseline above this many points")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'points':>9}  {'engine':<14} {'build':>8}  "
+          f"{'radius p50':>9} {'p99 ms':>9} {'hits':>7}  {'bbox p50':>9} {'p99 ms':>9} {'hits':>7}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        points = make_points(size, rng)
+        radius_queries, bbox_queries = make_queries(args.queries, args.radius_m, args.viewport_m, rng)
+        result = bench_index(points, radius_queries, bbox_queries)
+        print_row(size, "geohash index", result)
+        if size <= args.scan_limit:
+            print_row(size, "linear scan", bench_scan(points, radius_queries, bbox_queries))
+        if args.mongo_url:
+            print_row(size, "mongo 2dsphere", bench_mongo(args.mongo_url, points, radius_queries, bbox_queries))
+        print(f"{'':>9}  geohash index expired all {size} points in {result['expire_all_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
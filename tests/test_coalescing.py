@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from coalescing import SingleFlightCache
+
+
+def test_concurrent_gets_share_one_load():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]"
+
+    async def scenario():
+        cache = SingleFlightCache("test", ttl=60)
+        results = await asyncio.gather(*(cache.get("k", loader) for _ in range(50)))
+        # Within the TTL the stored result is reused
+        results.append(await cache.get("k", loader))
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1 and set(results) == {b"[]"}
+
+
+def test_errors_are_not_cached():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("mongo down")
+        return "ok"
+
+    async def scenario():
+        cache = SingleFlightCache("test", ttl=60)
+        with pytest.raises(RuntimeError):
+            await cache.get("k", loader)
+        return await cache.get("k", loader)
+
+    assert asyncio.run(scenario()) == "ok" and len(calls) == 2
+
+
+def test_invalidate_detaches_in_flight_load():
+    async def scenario():
+        cache = SingleFlightCache("test", ttl=60)
+        started = asyncio.Event()
+
+        async def stale():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        async def fresh():
+            return "fresh"
+
+        first = asyncio.ensure_future(cache.get("k", stale))
+        await started.wait()
+        cache.invalidate()
+        # A read after the write starts its own load instead of joining the old one
+        second = await cache.get("k", fresh)
+        return await first, second, await cache.get("k", stale)
+
+    assert asyncio.run(scenario()) == ("stale", "fresh", "fresh")
+
+
+def test_zero_ttl_only_coalesces_and_evicts_oldest():
+    async def scenario():
+        cache = SingleFlightCache("test", ttl=0)
+        await cache.get("k", lambda: asyncio.sleep(0, "v"))
+        assert len(cache) == 0
+        bounded = SingleFlightCache("test", ttl=60, max_entries=2)
+        for key in "abc":
+            await bounded.get(key, lambda key=key: asyncio.sleep(0, key))
+        return await bounded.get("a", lambda: asyncio.sleep(0, "reloaded"))
+
+    assert asyncio.run(scenario()) == "reloaded"
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+PROBE = """
+import sys
+import server
+server.create_app()
+heavy = [m for m in ("cloudinary", "PIL", "motor", "dotenv") if m in sys.modules]
+print(",".join(heavy))
+"""
+
+
+def test_import_and_app_factory_defer_heavy_subsystems():
+    # dotenv is loaded by create_app, everything else waits for first use
+    env = dict(os.environ, MONGO_URL="mongodb://localhost:27017", DB_NAME="cold_start")
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "dotenv"
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from coordination import LocalEventBus, MongoEventBus, MongoLease
+
+
+def test_local_bus_dispatches_to_subscribers():
+    bus = LocalEventBus()
+    seen = []
+    bus.subscribe("report.created", seen.append)
+    asyncio.run(bus.publish("report.created", {"id": "r1"}))
+    asyncio.run(bus.publish("other", {"id": "r2"}))
+    assert seen == [{"id": "r1"}]
+
+
+def test_mongo_lease_elects_one_leader_and_fails_over():
+    async def scenario():
+        leases = AsyncMongoMockClient()["coordination"]["leases"]
+        first = MongoLease(leases, "expiry-sweeper", ttl=timedelta(seconds=30), worker_id="w1")
+        second = MongoLease(leases, "expiry-sweeper", ttl=timedelta(seconds=30), worker_id="w2")
+        assert await first.acquire()
+        assert not await second.acquire()
+        # Renewal by the holder keeps the lease
+        assert await first.acquire()
+        await first.release()
+        assert await second.acquire()
+        assert not await first.acquire()
+
+    asyncio.run(scenario())
+
+
+def test_mongo_bus_stream_starts_at_the_time_of_start():
+    """Events published between start() and the listener opening the stream are delivered"""
+    watched = []
+
+    class Stream:
+        resume_token = None
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.Event().wait()
+
+    class Database:
+        async def command(self, name):
+            return {"ok": 1, "operationTime": "t-42"}
+
+    class Collection:
+        database = Database()
+
+        async def create_index(self, *args, **kwargs):
+            pass
+
+        def watch(self, pipeline, **kwargs):
+            watched.append(kwargs)
+            return Stream()
+
+    async def scenario():
+        bus = MongoEventBus(Collection(), worker_id="w1")
+        await bus.start()
+        await asyncio.sleep(0)
+        await bus.stop()
+
+    asyncio.run(scenario())
+    assert watched == [{"resume_after": None, "start_at_operation_time": "t-42"}]
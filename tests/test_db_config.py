@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from pymongo.read_preferences import SecondaryPreferred
+
+from db_config import MongoSettings, PoolMonitor
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "20")
+    monkeypatch.setenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "500")
+    settings = MongoSettings.from_env()
+    kwargs = settings.client_kwargs()
+    assert kwargs["maxPoolSize"] == 20
+    assert kwargs["waitQueueTimeoutMS"] == 500
+    assert kwargs["readPreference"] == "primary"
+    assert isinstance(settings.list_read_preference_obj(), SecondaryPreferred)
+
+
+def test_pool_monitor_tracks_saturation():
+    monitor = PoolMonitor(max_pool_size=1)
+    event = SimpleNamespace(address=("db1", 27017))
+    monitor.connection_created(event)
+    monitor.connection_check_out_started(event)
+    monitor.connection_checked_out(event)
+    assert monitor.stats()["in_use"] == 1
+    assert not monitor.saturated
+
+    # A second request queues behind the only connection
+    monitor.connection_check_out_started(event)
+    assert monitor.saturated
+    monitor.connection_check_out_failed(SimpleNamespace(address=("db1", 27017), reason="timeout"))
+    assert monitor.stats()["last_failure"] == "timeout"
+    assert not monitor.saturated
+
+    monitor.connection_checked_in(event)
+    assert monitor.stats()["in_use"] == 0
+
+
+def test_pool_monitor_judges_saturation_per_server():
+    monitor = PoolMonitor(max_pool_size=2)
+    primary = SimpleNamespace(address=("db1", 27017))
+    secondary = SimpleNamespace(address=("db2", 27017))
+    for event in (primary, secondary, secondary):
+        monitor.connection_check_out_started(event)
+        monitor.connection_checked_out(event)
+    # Three connections in use overall, but no pool is full yet
+    monitor.connection_check_out_started(primary)
+    assert monitor.stats()["in_use"] == 3
+    assert not monitor.saturated
+
+    monitor.connection_check_out_started(secondary)
+    assert monitor.saturated
+    stats = monitor.stats()
+    assert stats["saturation"] == 1.0
+    assert stats["servers"]["db1:27017"] == {"open": 0, "in_use": 1, "waiting": 1, "saturation": 0.5}
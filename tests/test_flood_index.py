@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from flood_index import FloodPenaltyIndex, point_segment_distance_m
+
+
+def make_index():
+    index = FloodPenaltyIndex()
+    # Two parallel east-west roads in Mumbai, ~1.1km apart
+    index.add_edge("road-a", [(19.0760, 72.8700), (19.0760, 72.8850)])
+    index.add_edge("road-b", [(19.0860, 72.8700), (19.0860, 72.8850)])
+    return index
+
+
+def test_point_segment_distance():
+    # ~111m north of the segment midpoint
+    d = point_segment_distance_m((19.0770, 72.8777), (19.0760, 72.8700), (19.0760, 72.8850))
+    assert 105 < d < 117
+
+
+def test_report_penalises_only_nearby_edges():
+    index = make_index()
+    affected = index.add_report("r1", 19.0765, 72.8777, "Medium")
+    assert affected == ("road-a",)
+    snap = index.snapshot()
+    assert snap.penalties == {"road-a": 2.0}
+    assert snap.edges_by_report["r1"] == ("road-a",)
+
+
+def test_remove_report_restores_penalties():
+    index = make_index()
+    index.add_report("r1", 19.0765, 72.8777, "Severe")
+    index.add_report("r2", 19.0762, 72.8780, "Low")
+    assert index.penalty("road-a") == 5.0
+    assert index.remove_report("r1") == ("road-a",)
+    assert index.penalty("road-a") == 1.0
+    index.remove_report("r2")
+    assert index.snapshot().penalties == {}
+
+
+def test_expire_drops_past_reports():
+    index = make_index()
+    now = datetime.utcnow()
+    index.add_report("old", 19.0760, 72.8777, "Medium", now - timedelta(minutes=1))
+    index.add_report("new", 19.0860, 72.8777, "Medium", now + timedelta(hours=1))
+    assert index.expire(now) == ["old"]
+    assert index.snapshot().penalties == {"road-b": 2.0}
+    assert len(index) == 1
+
+
+def test_snapshot_is_stable_across_updates():
+    index = make_index()
+    index.add_report("r1", 19.0760, 72.8777, "Medium")
+    before = index.snapshot()
+    index.add_report("r2", 19.0760, 72.8777, "Medium")
+    after = index.snapshot()
+    assert before.penalties == {"road-a": 2.0}
+    assert after.penalties == {"road-a": 4.0}
+    assert after.version > before.version
+    assert index.snapshot() is after
+
+
+def test_snapshots_share_untouched_shards():
+    index = FloodPenaltyIndex()
+    for i in range(200):
+        index.add_edge(f"e{i}", [(10.0 + i * 0.01, 10.0), (10.0 + i * 0.01, 10.0005)])
+    for i in range(200):
+        index.add_report(f"r{i}", 10.0 + i * 0.01, 10.0002, "Low")
+    before = index.snapshot()
+    index.remove_report("r7")
+    after = index.snapshot()
+    assert len(before.penalties) == 200 and before.edges_by_report["r7"] == ("e7",)
+    assert len(after.penalties) == 199 and "r7" not in after.edges_by_report
+    assert dict(after.penalties) == {f"e{i}": 1.0 for i in range(200) if i != 7}
+    shared = sum(a is b for a, b in zip(before.penalties._shards, after.penalties._shards))
+    assert shared == len(after.penalties._shards) - 1
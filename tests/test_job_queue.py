@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from job_queue import JobQueue
+
+
+def make_queue(process, **kwargs):
+    return JobQueue(AsyncMongoMockClient()["job_queue_test"], "image_jobs", process, **kwargs)
+
+
+def test_successful_job_is_removed():
+    processed = []
+
+    async def process(job):
+        processed.append((job["report_id"], job["image_base64"]))
+
+    async def scenario():
+        queue = make_queue(process)
+        await queue.enqueue(report_id="r1", image_base64="data:image/jpeg;base64,AAAA")
+        ran = await queue.drain()
+        return ran, await queue.collection.count_documents({})
+
+    ran, remaining = asyncio.run(scenario())
+    assert ran == 1 and remaining == 0
+    assert processed == [("r1", "data:image/jpeg;base64,AAAA")]
+
+
+def test_failures_back_off_then_dead_letter():
+    dead = []
+
+    async def process(job):
+        raise RuntimeError("upload failed")
+
+    async def on_dead(job):
+        dead.append((job["report_id"], job["image_base64"]))
+
+    async def scenario():
+        queue = make_queue(process, max_attempts=2, retry_backoff=60, on_dead=on_dead,
+                           dead_unset=("image_base64",))
+        await queue.ensure_indexes()
+        await queue.enqueue(report_id="r1", image_base64="img")
+        assert await queue.drain() == 1
+        job = await queue.collection.find_one({})
+        assert job["status"] == "queued" and job["attempts"] == 1
+        assert job["available_at"] > datetime.utcnow() + timedelta(seconds=50)
+        # Not due yet
+        assert await queue.drain() == 0
+
+        await queue.collection.update_one({}, {"$set": {"available_at": datetime.utcnow()}})
+        assert await queue.drain() == 1
+        indexes = await queue.collection.index_information()
+        assert indexes["failed_at_1"]["expireAfterSeconds"] == 7 * 86400
+        return await queue.collection.find_one({})
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "dead" and job["attempts"] == 2
+    assert job["last_error"] == "upload failed" and "image_base64" not in job
+    # The handler still saw the full job
+    assert dead == [("r1", "img")]
+
+
+def test_expired_lock_is_reclaimed():
+    async def process(job):
+        pass
+
+    async def scenario():
+        queue = make_queue(process, visibility_timeout=60)
+        await queue.enqueue(report_id="r1", image_base64="img")
+        claimed = await queue.claim()
+        # Held by a live worker
+        assert await queue.claim() is None
+        # That worker died and its lock ran out
+        await queue.collection.update_one(
+            {"_id": claimed["_id"]}, {"$set": {"locked_until": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        return await queue.claim()
+
+    job = asyncio.run(scenario())
+    assert job["report_id"] == "r1" and job["attempts"] == 2
+
+
+def test_worker_that_lost_its_lock_leaves_the_job_alone():
+    async def process(job):
+        raise RuntimeError("upload failed")
+
+    async def scenario():
+        queue = make_queue(process, visibility_timeout=60)
+        await queue.enqueue(report_id="r1", image_base64="img")
+        stale = await queue.claim()
+        await queue.collection.update_one(
+            {"_id": stale["_id"]}, {"$set": {"locked_until": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        current = await queue.claim()
+        # The first worker finally fails; the job stays locked by the second
+        outcome = await queue.run_job(stale)
+        return outcome, current, await queue.collection.find_one({"_id": stale["_id"]})
+
+    outcome, current, stored = asyncio.run(scenario())
+    assert outcome == "lost"
+    assert stored["status"] == "processing" and stored["lock_token"] == current["lock_token"]
+
+
+def test_lock_is_renewed_while_the_job_runs():
+    async def scenario():
+        async def process(job):
+            # Longer than the visibility timeout; nobody else may claim it meanwhile
+            await asyncio.sleep(0.3)
+            claims.append(await queue.claim())
+
+        claims = []
+        queue = make_queue(process, visibility_timeout=0.15)
+        await queue.enqueue(report_id="r1", image_base64="img")
+        outcome = await queue.run_job(await queue.claim())
+        return outcome, claims
+
+    outcome, claims = asyncio.run(scenario())
+    assert outcome == "done" and claims == [None]
+
+
+def test_workers_pick_up_new_jobs():
+    processed = []
+
+    async def process(job):
+        processed.append(job["report_id"])
+
+    async def scenario():
+        queue = make_queue(process, workers=2, poll_interval=60)
+        await queue.start()
+        for i in range(5):
+            await queue.enqueue(report_id=f"r{i}", image_base64="img")
+        for _ in range(100):
+            if len(processed) == 5:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert sorted(processed) == [f"r{i}" for i in range(5)]
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from metrics import Histogram, MongoCommandTimer, RequestTimings, current_timings
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = Histogram("demo_seconds", "Demo", ("route",), buckets=(0.1, 1.0))
+    hist.observe(0.05, "/api/reports")
+    hist.observe(0.5, "/api/reports")
+    hist.observe(3.0, "/api/reports")
+    lines = hist.render()
+    assert 'demo_seconds_bucket{route="/api/reports",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/api/reports",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{route="/api/reports",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/api/reports"} 3' in lines
+    assert hist.sum("/api/reports") == 3.55
+
+
+def test_command_listener_accumulates_request_db_time():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        listener = MongoCommandTimer()
+        listener.succeeded(SimpleNamespace(duration_micros=1500, command_name="find"))
+        listener.failed(SimpleNamespace(duration_micros=500, command_name="insert"))
+    finally:
+        current_timings.reset(token)
+    assert timings.db_calls == 2
+    assert abs(timings.db_seconds - 0.002) < 1e-9
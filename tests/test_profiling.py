@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel
+
+from metrics import MetricsMiddleware, recent_slow_requests, timed_phase
+from profiling import ProfilerBusy, SamplingProfiler, TimedRoute, profile
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_collapsed_stacks_name_running_functions():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    worker.start()
+    profiler = SamplingProfiler()
+    try:
+        for _ in range(20):
+            profiler.sample()
+            time.sleep(0.001)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = profiler.collapsed().splitlines()
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy and all("busy_loop (" in line for line in busy)
+    stack, count = busy[0].rsplit(" ", 1)
+    assert int(count) > 0 and profiler.samples == 20
+
+
+def test_one_profile_at_a_time():
+    async def scenario():
+        first = asyncio.ensure_future(profile(0.05, interval=0.001))
+        await asyncio.sleep(0)
+        with pytest.raises(ProfilerBusy):
+            await profile(0.01)
+        return await first
+
+    assert asyncio.run(scenario()).samples > 0
+
+
+def test_slow_requests_are_broken_down_by_phase():
+    class Item(BaseModel):
+        name: str
+
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.post("/items", response_model=Item)
+    async def create_item(item: Item):
+        with timed_phase("upload"):
+            await asyncio.sleep(0.01)
+        return item
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(MetricsMiddleware, slow_request_seconds=0.005)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.post("/items", json={"name": "pump"})
+
+    assert asyncio.run(scenario()).status_code == 200
+    entry = recent_slow_requests[-1]
+    assert entry["route"] == "/items" and entry["status"] == 200
+    assert set(entry["phases"]) == {"validation", "endpoint", "serialization", "upload"}
+    assert entry["phases"]["endpoint"] >= entry["phases"]["upload"] >= 0.01
+    assert sum(entry["phases"][p] for p in ("validation", "endpoint", "serialization")) <= entry["seconds"]
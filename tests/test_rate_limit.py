@@ -0,0 +1,110 @@
+import asyncio
+
+from rate_limit import (
+    Budget, RateLimitMiddleware, TokenBucketLimiter, client_key_from_scope, parse_networks
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_reports_retry_after():
+    clock = FakeClock()
+    budget = Budget("vote", rate=1.0, burst=3)
+    limiter = TokenBucketLimiter(budgets=[], default=budget, clock=clock)
+    assert [limiter.check("ip:1", budget) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.check("ip:1", budget) == 1.0
+    # Other clients have their own bucket
+    assert limiter.check("ip:2", budget) == 0.0
+    clock.now = 1.0
+    assert limiter.check("ip:1", budget) == 0.0
+
+
+def test_full_limiter_evicts_least_recently_used_bucket():
+    clock = FakeClock()
+    budget = Budget("vote", rate=1.0, burst=2)
+    limiter = TokenBucketLimiter(budgets=[], default=budget, max_keys=2, clock=clock)
+    limiter.check("ip:1", budget)
+    limiter.check("ip:2", budget)
+    limiter.check("ip:1", budget)
+    assert limiter.check("ip:1", budget) > 0
+    # ip:2 is the least recently used, so a new client evicts it and ip:1 keeps its state
+    limiter.check("ip:3", budget)
+    assert list(limiter._buckets) == [("ip:1", "vote"), ("ip:3", "vote")]
+    assert limiter.check("ip:1", budget) > 0
+
+
+def test_budget_matching_by_method_and_path():
+    limiter = TokenBucketLimiter()
+    assert limiter.budget_for("POST", "/api/reports").name == "create_report"
+    assert limiter.budget_for("POST", "/api/reports/abc/vote").name == "vote"
+    assert limiter.budget_for("GET", "/api/reports").name == "default"
+
+
+def test_client_key_uses_peer_unless_behind_trusted_proxy():
+    proxies = parse_networks("10.0.0.0/8, 127.0.0.1")
+    # The client spoofs an entry; the trusted proxy appends the real peer on the right
+    scope = {"headers": [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.9, 10.0.0.7")], "client": ("127.0.0.1", 1)}
+    assert client_key_from_scope(scope, proxies) == "ip:203.0.113.9"
+    # Without a trusted-proxy setting, or from an untrusted peer, the header is ignored
+    assert client_key_from_scope(scope) == "ip:127.0.0.1"
+    scope["client"] = ("198.51.100.4", 1)
+    assert client_key_from_scope(scope, proxies) == "ip:198.51.100.4"
+
+
+def test_spoofed_headers_do_not_bypass_limits():
+    budget = Budget("create_report", rate=0.001, burst=5)
+    limiter = TokenBucketLimiter(budgets=[("POST", r"^/api/reports$", budget)], default=None)
+    statuses = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    middleware = RateLimitMiddleware(app, limiter=limiter, enabled=True, max_in_flight=10,
+                                     trusted_proxies=parse_networks("10.0.0.1"))
+    for i in range(12):
+        headers = [(b"authorization", f"Bearer token-{i}".encode()),
+                   (b"x-forwarded-for", f"192.0.2.{i}".encode())]
+        for peer in ("1.2.3.4", "10.0.0.1"):
+            scope = {"type": "http", "method": "POST", "path": "/api/reports", "headers": headers}
+            if peer == "10.0.0.1":
+                # Behind the proxy the client can only prepend entries
+                scope["headers"] = [(b"x-forwarded-for", f"192.0.2.{i}, 5.6.7.8".encode())]
+            asyncio.run(middleware({**scope, "client": (peer, 5)}, None, send))
+    assert statuses[0::2].count(200) == 5 and statuses[1::2].count(200) == 5
+
+
+def test_middleware_returns_429_with_retry_after():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    budget = Budget("create_report", rate=0.5, burst=1)
+    limiter = TokenBucketLimiter(budgets=[("POST", r"^/api/reports$", budget)], default=None)
+    middleware = RateLimitMiddleware(app, limiter=limiter, enabled=True, max_in_flight=10)
+
+    async def call():
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/reports",
+                 "headers": [], "client": ("1.2.3.4", 5)}
+        await middleware(scope, None, send)
+        return sent[0]
+
+    first, second = asyncio.run(call()), asyncio.run(call())
+    assert first["status"] == 200
+    assert second["status"] == 429
+    assert (b"retry-after", b"2") in second["headers"]
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from report_stats import bucket_of, query_stats, record_stats, valid_area
+
+HOUR = datetime(2026, 7, 1, 9)
+
+
+def report(lat=19.0760, lng=72.8777, severity="Severe", minutes=10):
+    return {"lat": lat, "lng": lng, "severity": severity, "created_at": HOUR + timedelta(minutes=minutes)}
+
+
+def test_bucket_is_creation_hour_area_and_severity():
+    assert bucket_of(report()) == (HOUR, "te7ud", 2)
+    assert bucket_of(report(minutes=59)) == bucket_of(report(minutes=0))
+    assert valid_area("te7") and not valid_area("te7uda") and not valid_area("tea^")
+
+
+def test_rollups_count_and_coarsen():
+    async def scenario():
+        stats = AsyncMongoMockClient()["report_stats_test"].report_stats
+        await record_stats(stats, [report(), report(minutes=30), report(severity="Low")], {"reports": 1})
+        # ~6km away: same geohash-3 area, different geohash-5 area
+        await record_stats(stats, [report(lat=19.13)], {"reports": 1})
+        await record_stats(stats, [report()], {"upvotes": 1})
+        await record_stats(stats, [report(), report(minutes=30)], {"expired": 1})
+        await record_stats(stats, [report(minutes=70)], {"reports": 1})
+        assert await stats.count_documents({}) == 4
+
+        window = (HOUR, HOUR + timedelta(hours=1))
+        fine = await query_stats(stats, *window)
+        coarse = await query_stats(stats, *window, precision=3)
+        nearby = await query_stats(stats, *window, area="te7ud")
+        return fine, coarse, nearby
+
+    fine, coarse, nearby = asyncio.run(scenario())
+    assert len(fine) == 3
+    severe = {"hour": HOUR, "area": "te7ud", "severity": "Severe",
+              "reports": 2, "upvotes": 1, "downvotes": 0, "expired": 2}
+    assert severe in fine and severe in nearby and len(nearby) == 2
+    assert [(b["area"], b["severity"], b["reports"]) for b in coarse] == [("te7", "Low", 1), ("te7", "Severe", 3)]
@@ -0,0 +1,110 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import bson
+from mongomock_motor import AsyncMongoMockClient
+
+from report_store import (
+    attach_images, from_document, id_filter, migrate_legacy_reports, near_filter, to_document
+)
+from spatial_index import EARTH_RADIUS_M
+
+
+def api_report(**overrides):
+    now = datetime.utcnow().replace(microsecond=0)
+    report = {
+        "id": str(uuid.uuid4()), "lat": 19.076, "lng": 72.8777, "severity": "Severe",
+        "image_url": None, "image_base64": None, "image_status": None,
+        "created_at": now, "expires_at": now + timedelta(days=1),
+        "accuracy_score": 2, "total_votes": 4, "comment_count": 1,
+        "latest_comment": {"author": "Anonymous", "text": "Knee deep", "created_at": now},
+        "has_photo": False, "nearby_reports": 0, "confidence": 0.42, "trust_rank": 123.4,
+    }
+    report.update(overrides)
+    return report
+
+
+def legacy_document(report):
+    # What earlier versions stored: the API dict plus an ObjectId
+    return {"_id": bson.ObjectId(), **report}
+
+
+def test_round_trip_and_size():
+    report = api_report()
+    doc = to_document(report)
+    assert doc["loc"] == {"type": "Point", "coordinates": [72.8777, 19.076]}
+    assert doc["severity"] == 2 and "id" not in doc and "image_url" not in doc
+    assert from_document(doc, fill_defaults=True) == report
+    assert len(bson.encode(doc)) < len(bson.encode(legacy_document(report)))
+
+
+def test_legacy_documents_read_through_compat_layer():
+    report = api_report()
+    assert from_document(legacy_document(report)) == report
+
+
+def test_near_filter_uses_geo_query_for_compact_documents():
+    compact, legacy = near_filter(19.076, 72.8777, 150.0)["$or"]
+    assert compact == {"loc": {"$geoWithin": {"$centerSphere": [[72.8777, 19.076], 150.0 / EARTH_RADIUS_M]}}}
+
+    near, far = api_report(lat=19.0765), api_report(lat=19.09)
+
+    async def scenario():
+        # mongomock has no $geoWithin, so check the legacy branch on its own
+        collection = AsyncMongoMockClient()["report_store_test"]["waterlogging_reports"]
+        await collection.insert_many([legacy_document(near), legacy_document(far), to_document(api_report())])
+        return [doc["id"] for doc in await collection.find(legacy).to_list(None)]
+
+    assert asyncio.run(scenario()) == [near["id"]]
+
+
+def test_migration_converts_and_moves_images():
+    photo = api_report(image_base64="data:image/jpeg;base64,AAAA", image_status="inline", has_photo=True)
+    plain = api_report()
+
+    async def scenario():
+        db = AsyncMongoMockClient()["report_store_test"]
+        await db.reports.insert_many([legacy_document(photo), legacy_document(plain)])
+        assert await migrate_legacy_reports(db.reports, db.images) == 2
+        assert await migrate_legacy_reports(db.reports, db.images) == 0
+        stored = await db.reports.find_one(id_filter(photo["id"]))
+        reports = [from_document(doc, fill_defaults=True) for doc in await db.reports.find({}).to_list(None)]
+        await attach_images(db.images, reports)
+        return stored, reports
+
+    stored, reports = asyncio.run(scenario())
+    assert "image_base64" not in stored and "id" not in stored
+    assert sorted(reports, key=lambda r: r["id"]) == sorted([photo, plain], key=lambda r: r["id"])
+
+
+def test_migration_keeps_concurrent_updates():
+    report = api_report()
+
+    class VoteDuringMigration:
+        """Applies a vote to the legacy document right after the new copy is written"""
+
+        def __init__(self, collection):
+            self.collection = collection
+
+        def find(self, *args, **kwargs):
+            return self.collection.find(*args, **kwargs)
+
+        async def replace_one(self, *args, **kwargs):
+            result = await self.collection.replace_one(*args, **kwargs)
+            await self.collection.update_one({"id": report["id"]}, {"$inc": {"total_votes": 1}})
+            return result
+
+        async def delete_one(self, *args, **kwargs):
+            return await self.collection.delete_one(*args, **kwargs)
+
+    async def scenario():
+        db = AsyncMongoMockClient()["report_store_test"]
+        await db.reports.insert_one(legacy_document(report))
+        assert await migrate_legacy_reports(VoteDuringMigration(db.reports), db.images) == 0
+        # The vote landed on the legacy document, which is kept and retried
+        assert await migrate_legacy_reports(db.reports, db.images) == 1
+        return await db.reports.find({}).to_list(None)
+
+    docs = asyncio.run(scenario())
+    assert len(docs) == 1 and docs[0]["total_votes"] == report["total_votes"] + 1
@@ -0,0 +1,77 @@
+import asyncio
+
+from scheduler import Scheduler
+
+
+class DeniedLease:
+    name = "denied"
+
+    async def acquire(self):
+        return False
+
+    async def release(self):
+        pass
+
+
+def test_run_now_is_single_flight():
+    calls = []
+
+    async def slow_job():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.register("slow", slow_job, interval=60)
+        await asyncio.gather(*(scheduler.run_now("slow") for _ in range(5)))
+        return scheduler.stats()["slow"]
+
+    stats = asyncio.run(scenario())
+    assert calls == [1]
+    assert stats["runs"] == 1 and stats["failures"] == 0
+
+
+def test_timeout_and_errors_are_recorded():
+    async def hangs():
+        await asyncio.sleep(10)
+
+    async def fails():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        scheduler = Scheduler()
+        scheduler.register("hangs", hangs, interval=60, timeout=0.01)
+        scheduler.register("fails", fails, interval=60)
+        await scheduler.run_now("hangs")
+        await scheduler.run_now("fails")
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["hangs"]["failures"] == 1 and "timed out" in stats["hangs"]["last_error"]
+    assert stats["fails"]["last_error"] == "boom"
+
+
+def test_loop_runs_periodically_only_with_lease_and_stops_cleanly():
+    runs = {"led": 0, "follower": 0}
+
+    async def led():
+        runs["led"] += 1
+
+    async def follower():
+        runs["follower"] += 1
+
+    async def scenario():
+        scheduler = Scheduler(shutdown_grace=0.1)
+        scheduler.register("led", led, interval=0.01, jitter=0)
+        scheduler.register("follower", follower, interval=0.01, jitter=0, lease=DeniedLease())
+        await scheduler.start()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        count = runs["led"]
+        await asyncio.sleep(0.05)
+        return count
+
+    count = asyncio.run(scenario())
+    assert count >= 3
+    assert runs["led"] == count  # nothing runs after stop()
+    assert runs["follower"] == 0
@@ -0,0 +1,46 @@
+import math
+from datetime import datetime, timedelta
+
+from scoring import (
+    HALF_LIFE_SECONDS,
+    base_confidence,
+    effective_confidence,
+    rank_threshold,
+    score_fields,
+    trust_rank,
+)
+
+
+def test_confidence_rises_with_votes_agreement_and_photo():
+    plain = base_confidence()
+    assert math.isclose(plain, 0.3)  # 0.6 * prior accuracy of 0.5
+    assert base_confidence(accuracy_score=5, total_votes=5) > plain
+    assert base_confidence(accuracy_score=-5, total_votes=5) < plain
+    assert base_confidence(nearby_reports=3) > plain
+    assert base_confidence(has_photo=True) > plain
+
+
+def test_rank_ordering_matches_decayed_confidence():
+    now = datetime(2026, 7, 1, 12, 0)
+    old_strong = trust_rank(0.9, "Severe", now - timedelta(seconds=HALF_LIFE_SECONDS))
+    new_weak = trust_rank(0.4, "Severe", now)
+    # 0.9 halved by one half-life (0.45) still beats a fresh 0.4
+    assert old_strong > new_weak
+    assert math.isclose(effective_confidence(old_strong, now), 0.45)
+
+
+def test_threshold_is_a_range_on_rank():
+    created = datetime(2026, 7, 1, 12, 0)
+    rank = trust_rank(0.8, "Severe", created)
+    assert rank >= rank_threshold(0.5, created)
+    # After two half-lives the report has decayed to 0.2
+    later = created + timedelta(seconds=2 * HALF_LIFE_SECONDS)
+    assert rank < rank_threshold(0.5, later)
+    assert rank >= rank_threshold(0.19, later)
+
+
+def test_score_fields_for_document():
+    fields = score_fields({"created_at": datetime(2026, 7, 1), "severity": "Low",
+                           "accuracy_score": 2, "total_votes": 2, "image_url": "https://x"})
+    assert 0 < fields["confidence"] <= 1
+    assert fields["trust_rank"] == trust_rank(fields["confidence"], "Low", datetime(2026, 7, 1))
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta
+
+from spatial_index import (
+    GeoHashIndex, geohash_bounds, geohash_cover, geohash_encode, haversine_m, radius_bbox
+)
+
+
+def test_geohash_encode_and_bounds():
+    # Reference value from the original geohash.org example
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds("u4pruydqqvj")
+    assert min_lat <= 57.64911 <= max_lat and min_lng <= 10.40744 <= max_lng
+
+
+def test_cover_includes_every_point_in_box():
+    rng = random.Random(3)
+    bbox = (19.0, 72.8, 19.03, 72.85)
+    cells = set(geohash_cover(bbox, 6))
+    for _ in range(500):
+        lat = rng.uniform(bbox[0], bbox[2])
+        lng = rng.uniform(bbox[1], bbox[3])
+        assert geohash_encode(lat, lng, 6) in cells
+
+
+def test_queries_match_brute_force():
+    rng = random.Random(7)
+    index = GeoHashIndex()
+    points = {}
+    for i in range(2000):
+        lat, lng = rng.uniform(18.9, 19.25), rng.uniform(72.78, 72.98)
+        points[f"p{i}"] = (lat, lng)
+        index.insert(f"p{i}", lat, lng)
+    # Removals exercise the swap-remove path
+    for i in range(0, 2000, 3):
+        assert index.remove(f"p{i}")
+        del points[f"p{i}"]
+    assert len(index) == len(points)
+
+    for radius in (50, 400, 3000):
+        lat, lng = rng.uniform(18.95, 19.2), rng.uniform(72.8, 72.95)
+        expected = sorted(pid for pid, (plat, plng) in points.items()
+                          if haversine_m(lat, lng, plat, plng) <= radius)
+        found = index.within_radius(lat, lng, radius)
+        assert sorted(pid for pid, _ in found) == expected
+        assert [d for _, d in found] == sorted(d for _, d in found)
+
+    bbox = radius_bbox(19.07, 72.88, 2000)
+    expected = sorted(pid for pid, (plat, plng) in points.items()
+                      if bbox[0] <= plat <= bbox[2] and bbox[1] <= plng <= bbox[3])
+    assert sorted(index.within_bbox(*bbox)) == expected
+    # A box larger than the occupied area walks the buckets instead of the cover
+    assert len(index.within_bbox(-90, -180, 90, 180)) == len(points)
+
+
+def test_reinsert_moves_point_and_expiry():
+    now = datetime.utcnow()
+    index = GeoHashIndex()
+    index.insert("a", 19.0, 72.8, expires_at=now + timedelta(minutes=5))
+    index.insert("b", 19.0, 72.8001, expires_at=now + timedelta(hours=1))
+    # Moving "a" far away and extending its expiry leaves a stale heap entry
+    index.insert("a", 28.6, 77.2, expires_at=now + timedelta(hours=2))
+    assert index.position("a") == (28.6, 77.2)
+    assert [pid for pid, _ in index.within_radius(19.0, 72.8, 100)] == ["b"]
+
+    assert index.expire(now + timedelta(minutes=10)) == []
+    assert index.expire(now + timedelta(hours=1, minutes=1)) == ["b"]
+    assert "b" not in index and "a" in index
+    assert index.bucket_count == 1
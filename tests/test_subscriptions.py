@@ -0,0 +1,45 @@
+import random
+
+from spatial_index import haversine_m
+from subscriptions import Subscription, SubscriptionIndex
+
+
+def test_place_and_commute_matching():
+    index = SubscriptionIndex()
+    index.add(Subscription("home", ((19.0760, 72.8777),), radius_m=300))
+    index.add(Subscription("commute", ((19.0200, 72.8400), (19.0600, 72.8400), (19.0600, 72.8800)),
+                           radius_m=150, min_severity="Medium"))
+
+    assert [s.id for s, _ in index.match(19.0770, 72.8777, "Low")] == ["home"]
+    # On the first leg of the commute, ~100m off the road
+    matches = index.match(19.0400, 72.8410, "Severe")
+    assert [s.id for s, _ in matches] == ["commute"] and matches[0][1] < 150
+    # Below the commute's severity threshold
+    assert index.match(19.0400, 72.8410, "Low") == []
+    # Between the legs' bounding boxes but far from the road
+    assert index.match(19.0300, 72.8700, "Severe") == []
+
+
+def test_matches_agree_with_brute_force():
+    rng = random.Random(11)
+    index = SubscriptionIndex()
+    subscriptions = []
+    for i in range(300):
+        subscription = Subscription(f"s{i}", ((rng.uniform(19.0, 19.1), rng.uniform(72.8, 72.9)),),
+                                    radius_m=rng.uniform(50, 2000))
+        subscriptions.append(subscription)
+        index.add(subscription)
+    for _ in range(200):
+        lat, lng = rng.uniform(19.0, 19.1), rng.uniform(72.8, 72.9)
+        expected = {s.id for s in subscriptions if haversine_m(lat, lng, *s.points[0]) <= s.radius_m}
+        assert {s.id for s, _ in index.match(lat, lng, "Low")} == expected
+
+
+def test_remove_and_replace():
+    index = SubscriptionIndex()
+    index.add(Subscription("a", ((19.0, 72.8),), radius_m=100))
+    index.add(Subscription("a", ((28.6, 77.2),), radius_m=100))
+    assert len(index) == 1
+    assert index.match(19.0, 72.8, "Low") == []
+    assert index.remove("a") and not index.remove("a")
+    assert index.match(28.6, 77.2, "Low") == []
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import webhooks
+from webhooks import UnsafeWebhookURL, is_public_address, resolve_webhook_url
+
+
+@pytest.mark.parametrize("address, public", [
+    ("93.184.216.34", True),
+    ("2606:2800:220:1:248:1893:25c8:1946", True),
+    ("127.0.0.1", False),
+    ("169.254.169.254", False),
+    ("10.1.2.3", False),
+    ("172.16.0.1", False),
+    ("192.168.1.1", False),
+    ("100.64.0.1", False),
+    ("0.0.0.0", False),
+    ("::1", False),
+    ("fe80::1%eth0", False),
+    ("fd00::1", False),
+    ("::ffff:127.0.0.1", False),
+    ("224.0.0.1", False),
+])
+def test_public_addresses(address, public):
+    assert is_public_address(address) is public
+
+
+def resolve(url, answers, allowed_hosts=()):
+    async def fake_resolve(host, port):
+        return answers
+
+    async def scenario():
+        original = webhooks.resolve_host
+        webhooks.resolve_host = fake_resolve
+        try:
+            return await resolve_webhook_url(url, allowed_hosts)
+        finally:
+            webhooks.resolve_host = original
+
+    return asyncio.run(scenario())
+
+
+def test_target_is_pinned_to_checked_address():
+    target = resolve("https://hooks.example.com/a?b=1#frag", ["2606:2800:220:1:248:1893:25c8:1946"])
+    assert target.url == "https://[2606:2800:220:1:248:1893:25c8:1946]/a?b=1"
+    assert target.host_header == "hooks.example.com" and target.server_name == "hooks.example.com"
+
+
+@pytest.mark.parametrize("url, answers, allowed", [
+    ("gopher://hooks.example.com/", ["93.184.216.34"], ()),
+    ("https://user:pw@hooks.example.com/", ["93.184.216.34"], ()),
+    ("https://hooks.example.com:99999/", ["93.184.216.34"], ()),
+    # One private answer is enough to refuse
+    ("https://hooks.example.com/", ["93.184.216.34", "10.0.0.1"], ()),
+    ("https://evil.example.net/", ["93.184.216.34"], ("example.com",)),
+    ("https://notexample.com/", ["93.184.216.34"], ("example.com",)),
+])
+def test_unsafe_urls_are_refused(url, answers, allowed):
+    with pytest.raises(UnsafeWebhookURL):
+        resolve(url, answers, allowed)
+
+
+def test_allowlist_includes_subdomains():
+    assert resolve("https://hooks.example.com/", ["93.184.216.34"], ("example.com",)).server_name == "hooks.example.com"